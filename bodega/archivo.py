@@ -0,0 +1,306 @@
+# bodega/archivo.py
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import cached_property
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Producto, MovimientoInventario, AuditLog
+
+# ==============================================================================
+# Archivo Histórico (Almacenamiento Frío)
+# ==============================================================================
+# El Kardex y la auditoría solo crecen. Las filas anteriores a un corte se
+# mueven a archivos JSONL comprimidos con gzip, por tabla y por mes (UTC).
+# El Kardex, que siempre se consulta por producto, se reparte además en
+# cubetas según un hash del código, para que el historial de un producto no
+# obligue a descomprimir los movimientos de todo el catálogo de ese mes:
+#
+#     <BODEGA_ARCHIVO_DIR>/kardex/2024-01/17.jsonl.gz
+#     <BODEGA_ARCHIVO_DIR>/auditoria/2024-01.jsonl.gz
+#
+# Cada lote se agrega al archivo antes de borrarse de la base de datos, así
+# que una ejecución interrumpida puede repetirse: al leer, las filas
+# duplicadas se descartan por id.
+#
+# En el Kardex, cada producto con movimientos archivados recibe una fila
+# "SALDO INICIAL" justo antes del corte con el stock a esa fecha, de modo que
+# los saldos de las filas que quedan siguen encadenados.
+
+TAMANO_LOTE = 1000
+TIPO_SALDO_INICIAL = 'SALDO INICIAL'
+
+TABLA_KARDEX = 'kardex'
+TABLA_AUDITORIA = 'auditoria'
+
+CUBETAS_KARDEX = 64
+
+CAMPOS_KARDEX = [
+    'id', 'producto_id', 'fecha_hora', 'tipo_movimiento', 'cantidad',
+    'stock_anterior', 'stock_nuevo', 'referencia',
+]
+CAMPOS_AUDITORIA = [
+    'id', 'fecha_hora', 'usuario_id', 'usuario__username', 'accion',
+    'modelo_afectado', 'detalle',
+]
+
+def directorio_archivo():
+    return Path(getattr(settings, 'BODEGA_ARCHIVO_DIR', Path(settings.BASE_DIR) / 'archivo'))
+
+def _particion(fecha):
+    return f"{fecha.astimezone(dt_timezone.utc):%Y-%m}"
+
+def cubeta_kardex(producto_id):
+    digest = hashlib.md5(str(producto_id).encode('utf-8')).hexdigest()
+    return f"{int(digest[:8], 16) % CUBETAS_KARDEX:02d}"
+
+def _ruta(tabla, particion, cubeta=None):
+    if cubeta is None:
+        return directorio_archivo() / tabla / f"{particion}.jsonl.gz"
+    return directorio_archivo() / tabla / particion / f"{cubeta}.jsonl.gz"
+
+def _escribir_filas(tabla, filas, cubeta=None):
+    """
+    Agrega `filas` (dicts con 'fecha_hora' datetime) a sus particiones
+    mensuales; `cubeta(fila)`, si se indica, reparte cada mes en varios archivos.
+    """
+    por_archivo = {}
+    for fila in filas:
+        clave = (_particion(fila['fecha_hora']), cubeta(fila) if cubeta is not None else None)
+        por_archivo.setdefault(clave, []).append(fila)
+    for (particion, nombre_cubeta), grupo in por_archivo.items():
+        ruta = _ruta(tabla, particion, nombre_cubeta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Los miembros gzip concatenados forman un archivo gzip válido
+        with gzip.open(ruta, 'at', encoding='utf-8') as archivo:
+            for fila in grupo:
+                fila = dict(fila, fecha_hora=fila['fecha_hora'].astimezone(dt_timezone.utc).isoformat())
+                archivo.write(json.dumps(fila, ensure_ascii=False) + '\n')
+
+# ==============================================================================
+# Archivado
+# ==============================================================================
+
+def _borrar_por_id(modelo, ids, alias):
+    """
+    Borra las filas con un DELETE directo: sin señales por fila, porque el
+    archivado no cambia stock ni catálogo (QuerySet.delete() las cargaría
+    todas para emitir post_delete).
+    """
+    conexion = connections[alias]
+    tabla = conexion.ops.quote_name(modelo._meta.db_table)
+    columna = conexion.ops.quote_name(modelo._meta.pk.column)
+    marcadores = ', '.join(['%s'] * len(ids))
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {tabla} WHERE {columna} IN ({marcadores})", ids)
+
+def _archivar_en_lotes(queryset, tabla, campos, tamano_lote, preparar=None, cubeta=None):
+    """
+    Escribe y borra las filas de `queryset` de a `tamano_lote`, cada lote en
+    su propia transacción para no mantener bloqueos largos.
+    """
+    total = 0
+    queryset = queryset.order_by('fecha_hora', 'id')
+    while True:
+        with transaction.atomic():
+            filas = list(queryset.values(*campos)[:tamano_lote])
+            if not filas:
+                return total
+            ids = [fila['id'] for fila in filas]
+            if preparar is not None:
+                filas = [preparar(fila) for fila in filas]
+            _escribir_filas(tabla, [fila for fila in filas if fila is not None], cubeta)
+            _borrar_por_id(queryset.model, ids, queryset.db)
+        total += len(ids)
+
+def archivar_auditoria(corte, tamano_lote=TAMANO_LOTE):
+    """Archiva las entradas de auditoría anteriores a `corte`. Devuelve cuántas."""
+    def preparar(fila):
+        # El nombre de usuario se guarda por si el usuario se elimina luego
+        fila['usuario'] = fila.pop('usuario__username')
+        return fila
+
+    return _archivar_en_lotes(
+        AuditLog.objects.filter(fecha_hora__lt=corte), TABLA_AUDITORIA, CAMPOS_AUDITORIA, tamano_lote, preparar
+    )
+
+def _crear_saldos_iniciales(corte):
+    """
+    Crea la fila de saldo inicial (en `corte` menos un microsegundo) de cada
+    producto con movimientos anteriores al corte que aún no la tenga.
+    """
+    apertura = corte - timedelta(microseconds=1)
+    con_saldo = MovimientoInventario.objects.filter(tipo_movimiento=TIPO_SALDO_INICIAL, fecha_hora=apertura)
+    ultimo = MovimientoInventario.objects.filter(
+        producto=OuterRef('pk'), fecha_hora__lt=apertura
+    ).order_by('-fecha_hora', '-id')
+    saldos = (
+        Producto.objects.annotate(saldo=Subquery(ultimo.values('stock_nuevo')[:1]))
+        .filter(saldo__isnull=False)
+        .exclude(pk__in=con_saldo.values('producto_id'))
+        .values_list('pk', 'saldo')
+    )
+    referencia = f"Historial anterior al {corte:%d-%m-%Y} archivado"
+    with transaction.atomic():
+        creados = MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                producto_id=pk, tipo_movimiento=TIPO_SALDO_INICIAL, cantidad=0,
+                stock_anterior=saldo, stock_nuevo=saldo, referencia=referencia
+            )
+            for pk, saldo in saldos
+        ])
+        # fecha_hora es auto_now_add: se fija después de insertar
+        MovimientoInventario.objects.filter(
+            tipo_movimiento=TIPO_SALDO_INICIAL, referencia=referencia, fecha_hora__gt=apertura
+        ).update(fecha_hora=apertura)
+    return apertura, len(creados)
+
+def archivar_kardex(corte, tamano_lote=TAMANO_LOTE):
+    """
+    Archiva los movimientos anteriores a `corte` y deja un saldo inicial por
+    producto. Devuelve (movimientos archivados, saldos creados). Los saldos
+    iniciales de archivados anteriores se descartan sin escribirse: el saldo
+    nuevo los reemplaza.
+    """
+    apertura, saldos = _crear_saldos_iniciales(corte)
+
+    def preparar(fila):
+        return None if fila['tipo_movimiento'] == TIPO_SALDO_INICIAL else fila
+
+    archivados = _archivar_en_lotes(
+        MovimientoInventario.objects.filter(fecha_hora__lt=apertura), TABLA_KARDEX, CAMPOS_KARDEX, tamano_lote, preparar,
+        cubeta=lambda fila: cubeta_kardex(fila['producto_id'])
+    )
+    return archivados, saldos
+
+# ==============================================================================
+# Lectura
+# ==============================================================================
+
+# Las particiones leídas (ya filtradas y ordenadas) se guardan en memoria
+# para que las páginas siguientes del mismo historial no vuelvan a
+# descomprimir el archivo. La clave incluye el tamaño y la fecha de
+# modificación de cada archivo, así que un archivado posterior la invalida.
+
+MAX_PARTICIONES_EN_CACHE = 32
+MAX_FILAS_EN_CACHE = 50000
+
+_particiones_leidas = OrderedDict()
+_particiones_lock = threading.Lock()
+
+class LectorArchivo:
+    """
+    Recorre las filas archivadas de una tabla en orden (fecha_hora, id),
+    leyendo solo las particiones necesarias. `filtro` es un par
+    (campo, valor) que selecciona filas (por ejemplo, las de un producto) y
+    `cubeta` el archivo del mes donde están. `construir` las convierte en
+    objetos para las plantillas y `disponible`, si se indica, evita abrir
+    archivos cuando se sabe que no hay nada archivado.
+    """
+
+    def __init__(self, tabla, construir, filtro=None, cubeta=None, disponible=None):
+        self.tabla = tabla
+        self.construir = construir
+        self.filtro = filtro
+        self.cubeta = cubeta
+        self._disponible = disponible
+
+    @cached_property
+    def particiones(self):
+        if self._disponible is not None and not self._disponible():
+            return []
+        directorio = directorio_archivo() / self.tabla
+        return sorted({ruta.name.split('.')[0] for ruta in directorio.glob('*') if ruta.is_dir() or ruta.name.endswith('.jsonl.gz')})
+
+    def _rutas(self, particion):
+        # El archivo plano del mes es el formato anterior a las cubetas
+        rutas = [_ruta(self.tabla, particion)]
+        if self.cubeta is not None:
+            rutas.append(_ruta(self.tabla, particion, self.cubeta))
+        else:
+            rutas.extend(sorted((directorio_archivo() / self.tabla / particion).glob('*.jsonl.gz')))
+        return [ruta for ruta in rutas if ruta.is_file()]
+
+    def _leer_sin_cache(self, rutas):
+        # Descarta por texto las líneas que no pueden pasar el filtro antes de decodificarlas
+        campo, valor = self.filtro or (None, None)
+        fragmento = f'"{campo}": {json.dumps(valor, ensure_ascii=False)}' if self.filtro else None
+        filas = {}
+        for ruta in rutas:
+            with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+                for linea in archivo:
+                    if fragmento is not None and fragmento not in linea:
+                        continue
+                    fila = json.loads(linea)
+                    if fragmento is None or fila.get(campo) == valor:
+                        fila['fecha_hora'] = datetime.fromisoformat(fila['fecha_hora'])
+                        filas[fila['id']] = fila
+        return sorted(filas.values(), key=lambda fila: (fila['fecha_hora'], fila['id']))
+
+    def _leer(self, particion):
+        rutas = self._rutas(particion)
+        clave = (self.filtro, tuple((str(ruta), ruta.stat().st_mtime_ns, ruta.stat().st_size) for ruta in rutas))
+        with _particiones_lock:
+            filas = _particiones_leidas.get(clave)
+            if filas is not None:
+                _particiones_leidas.move_to_end(clave)
+                return filas
+        filas = self._leer_sin_cache(rutas)
+        if len(filas) <= MAX_FILAS_EN_CACHE:
+            with _particiones_lock:
+                _particiones_leidas[clave] = filas
+                if len(_particiones_leidas) > MAX_PARTICIONES_EN_CACHE:
+                    _particiones_leidas.popitem(last=False)
+        return filas
+
+    def anteriores(self, posicion=None):
+        """Objetos anteriores a `posicion` (fecha, id), del más reciente al más antiguo."""
+        for particion in reversed(self.particiones):
+            if posicion is not None and particion > _particion(posicion[0]):
+                continue
+            for fila in reversed(self._leer(particion)):
+                if posicion is None or (fila['fecha_hora'], fila['id']) < posicion:
+                    yield self.construir(dict(fila))
+
+    def posteriores(self, posicion):
+        """Objetos posteriores a `posicion` (fecha, id), del más antiguo al más reciente."""
+        for particion in self.particiones:
+            if particion < _particion(posicion[0]):
+                continue
+            for fila in self._leer(particion):
+                if (fila['fecha_hora'], fila['id']) > posicion:
+                    yield self.construir(dict(fila))
+
+def lector_kardex(producto):
+    """Movimientos archivados de `producto`, como instancias (no guardadas)."""
+    def construir(fila):
+        return MovimientoInventario(**fila)
+
+    def disponible():
+        # Solo los productos con saldo inicial tienen historial archivado
+        return MovimientoInventario.objects.filter(producto=producto, tipo_movimiento=TIPO_SALDO_INICIAL).exists()
+
+    return LectorArchivo(
+        TABLA_KARDEX, construir, filtro=('producto_id', producto.pk), cubeta=cubeta_kardex(producto.pk),
+        disponible=disponible
+    )
+
+def lector_auditoria():
+    """Entradas de auditoría archivadas, como instancias (no guardadas)."""
+    def construir(fila):
+        usuario = fila.pop('usuario')
+        log = AuditLog(**fila)
+        if log.usuario_id is not None:
+            log.usuario = User(pk=log.usuario_id, username=usuario)
+        return log
+
+    return LectorArchivo(TABLA_AUDITORIA, construir)
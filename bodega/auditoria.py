@@ -0,0 +1,197 @@
+# bodega/auditoria.py
+
+import contextvars
+import logging
+import queue
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction, connection
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Escritor de Auditoría con Buffer
+# ==============================================================================
+# Las señales no insertan cada AuditLog en el momento: lo encolan con
+# transaction.on_commit (así lo que se revierte nunca se audita) y, dentro de
+# `auditoria_en_lote()` (cada petición, vía el middleware, o una importación),
+# las entradas se acumulan y se escriben al final con un único bulk_create.
+#
+# Con BODEGA_AUDITORIA_ASINCRONA = True los lotes se entregan a un hilo de
+# fondo y la petición no espera el INSERT.
+#
+# El buffer es una variable de contexto (como el usuario, ver middleware.py)
+# para que dos peticiones atendidas por el mismo hilo no mezclen sus lotes.
+
+TAMANO_MAXIMO_LOTE = 500
+
+_buffer = contextvars.ContextVar('bodega_auditoria_buffer', default=None)
+
+def _escribir(entradas):
+    if not entradas:
+        return
+    if getattr(settings, 'BODEGA_AUDITORIA_ASINCRONA', False):
+        _escritor_asincrono().enviar(entradas)
+    else:
+        AuditLog.objects.bulk_create(entradas, batch_size=TAMANO_MAXIMO_LOTE)
+
+def _encolar(entrada):
+    """Se ejecuta al confirmar la transacción donde se generó la entrada."""
+    buffer = _buffer.get()
+    if buffer is None:
+        _escribir([entrada])
+        return
+    buffer.append(entrada)
+    if len(buffer) >= TAMANO_MAXIMO_LOTE:
+        _escribir(buffer[:])
+        buffer.clear()
+
+def registrar_auditoria(usuario, accion, modelo_afectado, detalle):
+    """Agrega una entrada al registro de auditoría (se escribe al confirmar)."""
+    entrada = AuditLog(usuario=usuario, accion=accion, modelo_afectado=modelo_afectado, detalle=detalle)
+    transaction.on_commit(partial(_encolar, entrada))
+
+@contextmanager
+def auditoria_en_lote():
+    """
+    Acumula las entradas confirmadas dentro del bloque y las escribe al salir
+    con un solo INSERT. Se puede anidar: solo el bloque externo escribe.
+    """
+    if _buffer.get() is not None:
+        yield
+        return
+    token = _buffer.set([])
+    try:
+        yield
+    finally:
+        entradas = _buffer.get()
+        _buffer.reset(token)
+        _escribir(entradas)
+
+@asynccontextmanager
+async def auditoria_en_lote_async():
+    """Como `auditoria_en_lote`, para código asíncrono: el INSERT final va a un hilo."""
+    if _buffer.get() is not None:
+        yield
+        return
+    token = _buffer.set([])
+    try:
+        yield
+    finally:
+        entradas = _buffer.get()
+        _buffer.reset(token)
+        await sync_to_async(_escribir)(entradas)
+
+# ==============================================================================
+# Cambios por Campo
+# ==============================================================================
+# Antes de guardar se toma una foto de los campos auditables tal como están en
+# la base de datos; después se compara con la instancia. Si ningún campo
+# relevante cambió no se escribe la entrada. Los campos ignorados se definen
+# por modelo ('app_label.Modelo') y se pueden ampliar con
+# BODEGA_AUDITORIA_CAMPOS_IGNORADOS en settings.
+
+CAMPOS_IGNORADOS = {
+    # update_last_login guarda al usuario en cada inicio de sesión
+    'auth.User': {'last_login'},
+    # Metadatos que cambian en cada guardado. cantidad_stock sí se audita:
+    # el servicio de stock no dispara señales, así que solo llegan aquí los
+    # ajustes manuales desde el formulario, que no quedan en el Kardex.
+    'bodega.Producto': {'version', 'actualizado_en'},
+}
+
+# Campos cuyo valor no se copia al registro, solo se indica que cambió
+CAMPOS_OCULTOS = {
+    'auth.User': {'password'},
+}
+
+def campos_ignorados(modelo):
+    etiqueta = modelo._meta.label
+    extra = getattr(settings, 'BODEGA_AUDITORIA_CAMPOS_IGNORADOS', {}).get(etiqueta, ())
+    return CAMPOS_IGNORADOS.get(etiqueta, set()) | set(extra)
+
+def campos_auditables(modelo, update_fields=None):
+    """Nombres (attname) de los campos concretos que se comparan al guardar."""
+    ignorados = campos_ignorados(modelo)
+    campos = [
+        campo for campo in modelo._meta.concrete_fields
+        if not campo.primary_key and campo.name not in ignorados
+    ]
+    if update_fields is not None:
+        campos = [campo for campo in campos if campo.name in update_fields or campo.attname in update_fields]
+    return [campo.attname for campo in campos]
+
+def capturar_estado(instance, update_fields=None):
+    """
+    Devuelve los valores guardados de los campos auditables de `instance`, o
+    None si la instancia es nueva. Un dict vacío significa que solo se guardan
+    campos ignorados y, por lo tanto, no habrá nada que auditar.
+    """
+    if instance._state.adding or instance.pk is None:
+        return None
+    campos = campos_auditables(type(instance), update_fields)
+    if not campos:
+        return {}
+    antes = type(instance)._base_manager.filter(pk=instance.pk).values(*campos).first()
+    return antes
+
+def describir_cambios(antes, instance):
+    """Texto con los campos que cambiaron entre `antes` e `instance` ('' si ninguno)."""
+    ocultos = CAMPOS_OCULTOS.get(type(instance)._meta.label, set())
+    cambios = []
+    for campo, valor_anterior in antes.items():
+        valor_nuevo = getattr(instance, campo)
+        if valor_nuevo == valor_anterior:
+            continue
+        if campo in ocultos:
+            cambios.append(f"{campo}: (modificado)")
+        else:
+            cambios.append(f"{campo}: {valor_anterior!r} → {valor_nuevo!r}")
+    return '; '.join(cambios)
+
+# ==============================================================================
+# Modo Asíncrono
+# ==============================================================================
+
+class _EscritorAsincrono(threading.Thread):
+    """Hilo de fondo que inserta los lotes de auditoría que recibe por una cola."""
+
+    def __init__(self):
+        super().__init__(name='bodega-auditoria', daemon=True)
+        self.cola = queue.Queue()
+
+    def enviar(self, entradas):
+        self.cola.put(list(entradas))
+
+    def vaciar(self):
+        """Espera a que se escriban todos los lotes enviados (útil en pruebas)."""
+        self.cola.join()
+
+    def run(self):
+        while True:
+            entradas = self.cola.get()
+            try:
+                AuditLog.objects.bulk_create(entradas, batch_size=TAMANO_MAXIMO_LOTE)
+            except Exception:
+                # Un lote fallido no debe detener el hilo; se registra y se sigue
+                logger.exception("No se pudo escribir un lote de auditoría")
+            finally:
+                connection.close()
+                self.cola.task_done()
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+def _escritor_asincrono():
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None or not _escritor.is_alive():
+            _escritor = _EscritorAsincrono()
+            _escritor.start()
+        return _escritor
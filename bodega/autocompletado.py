@@ -0,0 +1,203 @@
+# bodega/autocompletado.py
+
+import heapq
+import json
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+
+from .busqueda import normalizar
+from .cache import obtener_versiones, aobtener_versiones, cambios_de_stock, VERSION_CATALOGO, SECUENCIA_STOCK
+from .models import Producto
+
+# ==============================================================================
+# Índice de Autocompletado en Memoria
+# ==============================================================================
+# Cada worker mantiene en memoria el catálogo ordenado por nombre y dos listas
+# ordenadas de claves (códigos y palabras del nombre) para buscar prefijos con
+# bisect. Las respuestas JSON ya serializadas se guardan en un LRU acotado.
+# Nada de esto toca la base de datos mientras no cambien las versiones
+# compartidas: la de catálogo (altas, bajas y ediciones de productos) obliga
+# a reconstruir el índice; la secuencia de stock solo a recargar las
+# cantidades de los productos movidos (ver el diario en bodega/cache.py) y a
+# descartar las respuestas que los incluyen.
+
+LIMITE_RESULTADOS = 50
+MAX_RESPUESTAS_EN_CACHE = 512
+
+def normalizar_codigo(codigo):
+    """Como `normalizar`, pero conserva guiones y demás separadores del código."""
+    codigo = unicodedata.normalize('NFKD', codigo or '')
+    return ''.join(c for c in codigo if not unicodedata.combining(c)).lower().strip()
+
+def _rango_prefijo(claves, prefijo):
+    """Posiciones de `claves` (ordenadas) que empiezan con `prefijo`."""
+    inicio = bisect_left(claves, prefijo)
+    fin = bisect_left(claves, prefijo + '\uffff')
+    return range(inicio, fin)
+
+class IndiceAutocompletado:
+
+    def __init__(self, limite=LIMITE_RESULTADOS, max_respuestas=MAX_RESPUESTAS_EN_CACHE):
+        self.limite = limite
+        self.max_respuestas = max_respuestas
+        self._lock = threading.RLock()
+        self._versiones = None
+        self._respuestas = OrderedDict()
+        # Catálogo ordenado por nombre: las posiciones sirven de desempate
+        self._codigos = []
+        self._nombres = []
+        self._stock = []
+        self._codigos_norm = []
+        self._nombres_norm = []
+        self._palabras = []
+        self._posicion = {}
+        # Claves de búsqueda ordenadas, con la posición del producto al lado
+        self._claves_codigo, self._pos_codigo = [], []
+        self._claves_palabra, self._pos_palabra = [], []
+
+    # --- Sincronización con la base de datos ---
+
+    def _reconstruir(self):
+        filas = sorted(
+            Producto.objects.order_by().values_list('codigo_producto', 'nombre', 'cantidad_stock'),
+            key=lambda fila: (fila[1].lower(), fila[0])
+        )
+        self._codigos = [codigo for codigo, _, _ in filas]
+        self._nombres = [nombre for _, nombre, _ in filas]
+        self._stock = [stock for _, _, stock in filas]
+        self._codigos_norm = [normalizar_codigo(codigo) for codigo in self._codigos]
+        self._nombres_norm = [normalizar(nombre) for nombre in self._nombres]
+        self._palabras = [
+            tuple(set(nombre.split()) | set(normalizar(codigo).split()))
+            for codigo, nombre in zip(self._codigos, self._nombres_norm)
+        ]
+        self._posicion = {codigo: i for i, codigo in enumerate(self._codigos)}
+
+        por_codigo = sorted((clave, i) for i, clave in enumerate(self._codigos_norm))
+        por_palabra = sorted(
+            (palabra, i)
+            for i, palabras in enumerate(self._palabras)
+            for palabra in palabras
+        )
+        self._claves_codigo = [clave for clave, _ in por_codigo]
+        self._pos_codigo = [i for _, i in por_codigo]
+        self._claves_palabra = [clave for clave, _ in por_palabra]
+        self._pos_palabra = [i for _, i in por_palabra]
+
+    def _recargar_stock(self, codigos=None):
+        """Relee el stock de `codigos` (o de todo el catálogo si es None)."""
+        productos = Producto.objects.order_by()
+        if codigos is not None:
+            if not codigos:
+                return
+            productos = productos.filter(pk__in=codigos)
+        for codigo, stock in productos.values_list('codigo_producto', 'cantidad_stock'):
+            posicion = self._posicion.get(codigo)
+            if posicion is not None:
+                self._stock[posicion] = stock
+
+    def _descartar_respuestas(self, codigos):
+        posiciones = {self._posicion[codigo] for codigo in codigos if codigo in self._posicion}
+        for clave in [clave for clave, (_, incluidas) in self._respuestas.items() if not posiciones.isdisjoint(incluidas)]:
+            del self._respuestas[clave]
+
+    def _sincronizar(self):
+        versiones = obtener_versiones(VERSION_CATALOGO, SECUENCIA_STOCK)
+        if versiones == self._versiones:
+            return
+        if self._versiones is None or versiones[0] != self._versiones[0]:
+            self._reconstruir()
+            self._respuestas.clear()
+        else:
+            cambiados = cambios_de_stock(self._versiones[1], versiones[1])
+            if cambiados is None:
+                self._recargar_stock()
+                self._respuestas.clear()
+            else:
+                self._recargar_stock(cambiados)
+                self._descartar_respuestas(cambiados)
+        self._versiones = versiones
+
+    # --- Búsqueda ---
+
+    def _buscar(self, consulta):
+        palabras = normalizar(consulta).split()
+        codigo = normalizar_codigo(consulta)
+        if not palabras:
+            return list(range(min(self.limite, len(self._codigos))))
+
+        candidatos = {self._pos_codigo[i] for i in _rango_prefijo(self._claves_codigo, codigo)}
+        # La palabra más larga es la más selectiva para acotar candidatos
+        palabra_guia = max(palabras, key=len)
+        for i in _rango_prefijo(self._claves_palabra, palabra_guia):
+            posicion = self._pos_palabra[i]
+            if all(any(t.startswith(p) for t in self._palabras[posicion]) for p in palabras):
+                candidatos.add(posicion)
+
+        frase = ' '.join(palabras)
+
+        def orden(posicion):
+            codigo_norm = self._codigos_norm[posicion]
+            if codigo_norm == codigo:
+                relevancia = 3
+            elif codigo_norm.startswith(codigo):
+                relevancia = 2
+            elif self._nombres_norm[posicion].startswith(frase):
+                relevancia = 1
+            else:
+                relevancia = 0
+            return (-relevancia, posicion)
+
+        return heapq.nsmallest(self.limite, candidatos, key=orden)
+
+    def _responder_sincronizado(self, consulta, clave):
+        """Arma (o toma del LRU) la respuesta; requiere el lock y el índice al día."""
+        guardada = self._respuestas.get(clave)
+        if guardada is not None:
+            self._respuestas.move_to_end(clave)
+            return guardada[0]
+
+        posiciones = self._buscar(consulta)
+        resultados = [
+            {
+                "id": self._codigos[i],
+                "text": f"{self._codigos[i]} - {self._nombres[i]} (Stock: {self._stock[i]})"
+            }
+            for i in posiciones
+        ]
+        respuesta = json.dumps(resultados, ensure_ascii=False).encode('utf-8')
+        # Se guardan las posiciones incluidas para descartar solo las respuestas afectadas por un movimiento
+        self._respuestas[clave] = (respuesta, frozenset(posiciones))
+        if len(self._respuestas) > self.max_respuestas:
+            self._respuestas.popitem(last=False)
+        return respuesta
+
+    def responder(self, consulta):
+        """Devuelve la respuesta JSON (bytes) para `consulta`, en el formato de select2."""
+        clave = normalizar_codigo(consulta)
+        with self._lock:
+            self._sincronizar()
+            return self._responder_sincronizado(consulta, clave)
+
+    async def aresponder(self, consulta):
+        """
+        Como `responder`, sin salir del event loop cuando el índice está al
+        día. Si hay que reconstruirlo (o otro hilo lo está haciendo), el
+        trabajo con la base de datos se hace en un hilo.
+        """
+        clave = normalizar_codigo(consulta)
+        versiones = await aobtener_versiones(VERSION_CATALOGO, SECUENCIA_STOCK)
+        if self._lock.acquire(blocking=False):
+            try:
+                if versiones == self._versiones:
+                    return self._responder_sincronizado(consulta, clave)
+            finally:
+                self._lock.release()
+        return await sync_to_async(self.responder)(consulta)
+
+# Una instancia por proceso (worker)
+indice_autocompletado = IndiceAutocompletado()
@@ -0,0 +1,114 @@
+# bodega/busqueda.py
+
+import unicodedata
+import re
+
+from django.db.models import Q, Count, Case, When, Value, IntegerField
+
+from .models import Producto, ProductoToken
+
+# ==============================================================================
+# Normalización y Tokens
+# ==============================================================================
+# Cada producto se indexa como el conjunto de trigramas de las palabras de su
+# nombre y código (sin acentos, en minúsculas). Una búsqueda exige que el
+# producto tenga todos los trigramas de la consulta, lo que se resuelve con
+# el índice (token, producto) en lugar de recorrer el catálogo con LIKE.
+
+LONGITUD_NGRAMA = 3
+
+_NO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+
+def normalizar(texto):
+    """Minúsculas, sin acentos y con cualquier separador convertido en espacio."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return _NO_ALFANUMERICO.sub(' ', texto).strip()
+
+def tokens_de_texto(texto):
+    """Trigramas de cada palabra; las palabras más cortas se guardan completas."""
+    tokens = set()
+    for palabra in normalizar(texto).split():
+        if len(palabra) < LONGITUD_NGRAMA:
+            tokens.add(palabra)
+        else:
+            tokens.update(palabra[i:i + LONGITUD_NGRAMA] for i in range(len(palabra) - LONGITUD_NGRAMA + 1))
+    return tokens
+
+def tokens_producto(codigo_producto, nombre):
+    return tokens_de_texto(f"{codigo_producto} {nombre}")
+
+# ==============================================================================
+# Mantenimiento del Índice
+# ==============================================================================
+
+def indexar_producto(producto):
+    """Reemplaza los tokens de un producto (se llama desde post_save)."""
+    ProductoToken.objects.filter(producto=producto).delete()
+    ProductoToken.objects.bulk_create([
+        ProductoToken(producto=producto, token=token)
+        for token in tokens_producto(producto.codigo_producto, producto.nombre)
+    ])
+
+def reindexar_todo(tamano_lote=1000):
+    """Reconstruye el índice completo. Devuelve la cantidad de productos indexados."""
+    ProductoToken.objects.all().delete()
+    total = 0
+    lote = []
+    for codigo, nombre in Producto.objects.order_by().values_list('codigo_producto', 'nombre').iterator(chunk_size=tamano_lote):
+        lote.extend(ProductoToken(producto_id=codigo, token=token) for token in tokens_producto(codigo, nombre))
+        total += 1
+        if len(lote) >= tamano_lote:
+            ProductoToken.objects.bulk_create(lote)
+            lote = []
+    ProductoToken.objects.bulk_create(lote)
+    return total
+
+# ==============================================================================
+# Búsqueda
+# ==============================================================================
+
+def _condicion_tokens(consulta):
+    """
+    Q que selecciona los productos con todos los tokens de la consulta.
+    Las palabras de menos de tres letras se buscan como prefijo de token.
+    """
+    palabras = normalizar(consulta).split()
+    trigramas = set()
+    condicion = Q()
+    for palabra in palabras:
+        if len(palabra) < LONGITUD_NGRAMA:
+            cortas = ProductoToken.objects.filter(token__startswith=palabra).values('producto_id')
+            condicion &= Q(pk__in=cortas)
+        else:
+            trigramas.update(tokens_de_texto(palabra))
+    if trigramas:
+        coincidentes = (
+            ProductoToken.objects.filter(token__in=trigramas)
+            .values('producto_id')
+            .annotate(n=Count('token'))
+            .filter(n=len(trigramas))
+            .values('producto_id')
+        )
+        condicion &= Q(pk__in=coincidentes)
+    return condicion if palabras else None
+
+def buscar_productos(queryset, consulta):
+    """
+    Filtra `queryset` por `consulta` usando el índice de tokens más un prefijo
+    sobre `codigo_producto` (clave primaria), y anota `relevancia`:
+    código exacto > prefijo de código > prefijo de nombre > resto.
+    """
+    consulta = (consulta or '').strip()
+    condicion = _condicion_tokens(consulta)
+    if condicion is None:
+        return queryset.annotate(relevancia=Value(0, output_field=IntegerField()))
+    return queryset.filter(condicion | Q(codigo_producto__istartswith=consulta)).annotate(
+        relevancia=Case(
+            When(codigo_producto__iexact=consulta, then=Value(3)),
+            When(codigo_producto__istartswith=consulta, then=Value(2)),
+            When(nombre__istartswith=consulta, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
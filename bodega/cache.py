@@ -0,0 +1,224 @@
+# bodega/cache.py
+
+import hashlib
+import random
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Count
+
+from .models import Producto, Proveedor
+
+# ==============================================================================
+# Caché de Agregados del Dashboard
+# ==============================================================================
+# Los widgets del dashboard (totales, stock bajo y gráficos) solo cambian
+# cuando se mueve stock o se edita el catálogo, así que se calculan una vez y
+# se guardan en la caché de Django hasta que una señal o el servicio de stock
+# los invalida. El timeout es solo una red de seguridad.
+
+CLAVE_DASHBOARD = 'bodega:dashboard:widgets'
+TIMEOUT_DASHBOARD = 60 * 15
+
+def _consultas_dashboard():
+    stock_bajo = Producto.objects.filter(cantidad_stock__lte=F('stock_minimo'), stock_minimo__gt=0)
+    productos_top_stock = Producto.objects.filter(cantidad_stock__gt=0).order_by('-cantidad_stock').values_list('nombre', 'cantidad_stock')[:10]
+    productos_por_categoria = Producto.objects.filter(categoria__isnull=False, categoria__gt='').values('categoria').annotate(total=Count('categoria')).order_by('-total')
+    lista_stock_bajo = stock_bajo.order_by('cantidad_stock').values('codigo_producto', 'nombre', 'cantidad_stock')[:5]
+    return stock_bajo, lista_stock_bajo, productos_top_stock, productos_por_categoria
+
+def _armar_widgets(num_productos, num_proveedores, stock_bajo_count, stock_bajo_lista, productos_top_stock, productos_por_categoria):
+    return {
+        'num_productos': num_productos,
+        'num_proveedores': num_proveedores,
+        'productos_stock_bajo_count': stock_bajo_count,
+        'productos_stock_bajo_lista': stock_bajo_lista,
+        'chart_labels': [nombre for nombre, _ in productos_top_stock],
+        'chart_data': [stock for _, stock in productos_top_stock],
+        'pie_chart_labels': [item['categoria'] for item in productos_por_categoria],
+        'pie_chart_data': [item['total'] for item in productos_por_categoria],
+    }
+
+def calcular_widgets_dashboard():
+    """Ejecuta las consultas de agregados del dashboard y devuelve datos serializables."""
+    stock_bajo, lista_stock_bajo, top, por_categoria = _consultas_dashboard()
+    return _armar_widgets(
+        Producto.objects.count(), Proveedor.objects.count(), stock_bajo.count(),
+        list(lista_stock_bajo), list(top), list(por_categoria)
+    )
+
+async def acalcular_widgets_dashboard():
+    """Versión asíncrona de `calcular_widgets_dashboard` (ORM asíncrono)."""
+    stock_bajo, lista_stock_bajo, top, por_categoria = _consultas_dashboard()
+    return _armar_widgets(
+        await Producto.objects.acount(), await Proveedor.objects.acount(), await stock_bajo.acount(),
+        [fila async for fila in lista_stock_bajo], [fila async for fila in top], [fila async for fila in por_categoria]
+    )
+
+def obtener_widgets_dashboard():
+    """Devuelve los widgets desde la caché, calculándolos si no están."""
+    return cache.get_or_set(CLAVE_DASHBOARD, calcular_widgets_dashboard, TIMEOUT_DASHBOARD)
+
+async def aobtener_widgets_dashboard():
+    widgets = await cache.aget(CLAVE_DASHBOARD)
+    if widgets is None:
+        widgets = await acalcular_widgets_dashboard()
+        await cache.aset(CLAVE_DASHBOARD, widgets, TIMEOUT_DASHBOARD)
+    return widgets
+
+def invalidar_dashboard():
+    """
+    Descarta los widgets en caché cuando la transacción en curso se confirma.
+    Invalidar antes del commit permitiría que otra petición volviera a
+    guardar en caché los datos anteriores al cambio.
+    """
+    transaction.on_commit(lambda: cache.delete(CLAVE_DASHBOARD))
+
+# ==============================================================================
+# Versiones Compartidas
+# ==============================================================================
+# Cachés locales de cada worker (por ejemplo, el índice de autocompletado)
+# comparan estas versiones con las que vieron al construirse. Son tokens
+# aleatorios en lugar de contadores para que, si la caché compartida pierde
+# la clave, la versión nueva nunca coincida con una vista antes.
+
+VERSION_CATALOGO = 'bodega:version:catalogo'
+VERSION_STOCK = 'bodega:version:stock'
+
+def _version_inicial(clave):
+    if clave == SECUENCIA_STOCK:
+        # Un contador que parte de un número al azar, por la misma razón
+        return random.randrange(1 << 48)
+    return uuid.uuid4().hex
+
+def obtener_versiones(*claves):
+    """Devuelve la versión actual de cada clave, creándola si no existe."""
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, _version_inicial(clave), None)
+            versiones[clave] = cache.get(clave)
+    return tuple(versiones[clave] for clave in claves)
+
+async def aobtener_versiones(*claves):
+    versiones = await cache.aget_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            await cache.aadd(clave, _version_inicial(clave), None)
+            versiones[clave] = await cache.aget(clave)
+    return tuple(versiones[clave] for clave in claves)
+
+def renovar_version(clave):
+    """Cambia la versión de `clave` cuando se confirma la transacción en curso."""
+    transaction.on_commit(lambda: cache.set(clave, uuid.uuid4().hex, None))
+
+# ==============================================================================
+# Diario de Cambios de Stock
+# ==============================================================================
+# VERSION_STOCK dice que algo se movió, no qué. Para que el índice de
+# autocompletado de cada worker no relea el stock de todo el catálogo tras
+# cada despacho, el servicio de stock anota además los productos movidos bajo
+# un número de secuencia creciente. Un lector que vio la secuencia N y ahora
+# ve M relee solo los productos de las entradas N+1..M; si falta alguna
+# (expiró, o se lee entre el incr y el set) o el salto es muy grande, vuelve a
+# releer todo, que siempre es correcto.
+
+SECUENCIA_STOCK = 'bodega:stock:secuencia'
+TIMEOUT_DIARIO = 60 * 60
+MAX_ENTRADAS_DIARIO = 200
+
+def _clave_diario(numero):
+    return f'bodega:stock:cambios:{numero}'
+
+def _siguiente_numero():
+    try:
+        return cache.incr(SECUENCIA_STOCK)
+    except ValueError:
+        cache.add(SECUENCIA_STOCK, _version_inicial(SECUENCIA_STOCK), None)
+        return cache.incr(SECUENCIA_STOCK)
+
+def anotar_cambios_stock(codigos):
+    """Agrega al diario los productos cuyo stock cambió, al confirmar la transacción."""
+    codigos = sorted(codigos)
+
+    def anotar():
+        cache.set(_clave_diario(_siguiente_numero()), codigos, TIMEOUT_DIARIO)
+    transaction.on_commit(anotar)
+
+def cambios_de_stock(desde, hasta):
+    """
+    Códigos cuyo stock cambió entre las secuencias `desde` (excluida) y
+    `hasta`, o None si el diario no alcanza a cubrir ese tramo.
+    """
+    if not 0 <= hasta - desde <= MAX_ENTRADAS_DIARIO:
+        return None
+    claves = [_clave_diario(numero) for numero in range(desde + 1, hasta + 1)]
+    entradas = cache.get_many(claves)
+    if len(entradas) < len(claves):
+        return None
+    return set().union(*entradas.values())
+
+# ==============================================================================
+# Consulta de Stock por Lote
+# ==============================================================================
+# Los formularios de despacho y recepción piden el stock de todas sus líneas
+# en una sola llamada. Cada producto se guarda en caché bajo las versiones
+# de catálogo y stock vigentes, así cualquier movimiento o edición deja
+# obsoletas las entradas sin borrarlas una por una; el timeout corto es
+# solo una red de seguridad.
+
+TIMEOUT_STOCK = 30
+
+CAMPOS_STOCK = ('codigo_producto', 'cantidad_stock', 'stock_minimo', 'ubicacion_rack_id', 'unidad_de_medida', 'version', 'actualizado_en')
+
+def _datos_stock(fila):
+    return {
+        'stock': fila['cantidad_stock'],
+        'stock_minimo': fila['stock_minimo'],
+        'rack': fila['ubicacion_rack_id'],
+        'unidad': fila['unidad_de_medida'],
+        # `version` solo cambia con el stock; la fecha cubre las ediciones del producto
+        'version': f"{fila['version']}.{fila['actualizado_en'].timestamp():.6f}",
+    }
+
+def _claves_stock(codigos, versiones):
+    prefijo = 'bodega:stock:{}:{}:'.format(*versiones)
+    return {prefijo + hashlib.md5(codigo.encode('utf-8')).hexdigest(): codigo for codigo in codigos}
+
+def consultar_stock(codigos):
+    """
+    Devuelve {codigo_producto: datos} para los códigos que existen, con una
+    sola consulta para los que no estaban en caché.
+    """
+    codigos = list(dict.fromkeys(codigos))
+    claves = _claves_stock(codigos, obtener_versiones(VERSION_CATALOGO, VERSION_STOCK))
+
+    resultado = {claves[clave]: datos for clave, datos in cache.get_many(claves).items()}
+    faltantes = [codigo for codigo in codigos if codigo not in resultado]
+    if faltantes:
+        filas = Producto.objects.filter(pk__in=faltantes).values(*CAMPOS_STOCK)
+        nuevos = {fila['codigo_producto']: _datos_stock(fila) for fila in filas}
+        cache.set_many(
+            {clave: nuevos[codigo] for clave, codigo in claves.items() if codigo in nuevos},
+            TIMEOUT_STOCK
+        )
+        resultado.update(nuevos)
+    return resultado
+
+async def aconsultar_stock(codigos):
+    """Versión asíncrona de `consultar_stock` (ORM y caché asíncronos)."""
+    codigos = list(dict.fromkeys(codigos))
+    claves = _claves_stock(codigos, await aobtener_versiones(VERSION_CATALOGO, VERSION_STOCK))
+
+    resultado = {claves[clave]: datos for clave, datos in (await cache.aget_many(claves)).items()}
+    faltantes = [codigo for codigo in codigos if codigo not in resultado]
+    if faltantes:
+        filas = Producto.objects.filter(pk__in=faltantes).values(*CAMPOS_STOCK)
+        nuevos = {fila['codigo_producto']: _datos_stock(fila) async for fila in filas}
+        await cache.aset_many(
+            {clave: nuevos[codigo] for clave, codigo in claves.items() if codigo in nuevos},
+            TIMEOUT_STOCK
+        )
+        resultado.update(nuevos)
+    return resultado
@@ -0,0 +1,326 @@
+# bodega/datos_sinteticos.py
+
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    Area, Rack, Proveedor, Producto,
+    Despacho, DespachoItem, Recepcion, RecepcionItem, MovimientoInventario, AuditLog
+)
+from .busqueda import reindexar_todo
+from .cache import invalidar_dashboard, renovar_version, VERSION_CATALOGO, VERSION_STOCK
+
+# ==============================================================================
+# Generador de Datos Sintéticos
+# ==============================================================================
+# Carga volúmenes de producción en una base de desarrollo para medir los
+# cambios de rendimiento. Todo sale de un `random.Random(semilla)`: la misma
+# semilla y la misma fecha final producen exactamente los mismos datos.
+#
+# No pasa por bodega/services.py: inserta con bulk_create en lotes grandes, que
+# no dispara señales (auditoría, índice de búsqueda, difusión, caché), y lleva
+# en memoria los saldos de cada producto para que el Kardex quede encadenado
+# igual que si cada documento se hubiera registrado por el servicio. Los
+# efectos de las señales se aplican una sola vez al final.
+
+TAMANO_LOTE = 5000
+
+PROPORCION_RECEPCIONES = 0.25
+LINEAS_MEDIAS = {'recepcion': 6, 'despacho': 4}
+LINEAS_MAXIMAS = 40
+CANTIDAD_RECEPCION = (5, 60)
+CANTIDAD_MAXIMA_DESPACHO = 25
+
+_TIPOS = ['Tornillo', 'Perno', 'Tuerca', 'Arandela', 'Cable', 'Guante', 'Cinta', 'Filtro',
+          'Rodamiento', 'Manguera', 'Válvula', 'Abrazadera', 'Broca', 'Disco', 'Casco', 'Lente']
+_MATERIALES = ['acero', 'inox', 'bronce', 'PVC', 'nitrilo', 'cobre', 'aluminio', 'goma', 'galvanizado']
+_MEDIDAS = ['3 mm', '6 mm', '10 mm', '12 mm', '1/2"', '3/4"', '1"', 'M8', 'M10', 'M12', 'talla M', 'talla L']
+_CATEGORIAS = ['Ferretería', 'EPP', 'Eléctrico', 'Hidráulico', 'Mantención', 'Consumibles', 'Herramientas']
+_UNIDADES = ['Unidad', 'Caja', 'Par', 'Metro', 'Rollo']
+_ESTADOS = ['Nuevo', 'Bueno', 'Usado']
+_ACCIONES_AUDITORIA = [('Producto', 'MODIFICADO'), ('Producto', 'CREADO'), ('Despacho', 'REGISTRADO'),
+                       ('Recepcion', 'REGISTRADO'), ('Proveedor', 'MODIFICADO'), ('Rack', 'CREADO')]
+_MOTIVOS = ['Mantención preventiva', 'Reparación', 'Reposición', 'Proyecto', 'Consumo interno']
+
+
+@contextmanager
+def fechas_explicitas(*campos):
+    """
+    Desactiva temporalmente `auto_now_add` en los campos dados para que
+    bulk_create respete la fecha asignada en vez de usar la hora actual.
+    """
+    originales = [campo.auto_now_add for campo in campos]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, original in zip(campos, originales):
+            campo.auto_now_add = original
+
+
+def _siguiente_id(modelo):
+    return (modelo.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+
+
+def _reiniciar_secuencias(*modelos):
+    """
+    Las cabeceras se insertan con id explícito (MySQL no devuelve los ids de
+    bulk_create); en PostgreSQL hay que avanzar la secuencia a mano.
+    """
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), modelos):
+            cursor.execute(sql)
+
+
+class GeneradorDatos:
+    """
+    Genera el catálogo (productos, racks, proveedores, áreas y operarios),
+    después los documentos en orden cronológico y, opcionalmente, entradas
+    de auditoría. `prefijo` distingue un
+    conjunto generado de otro para poder cargar varios en la misma base.
+    """
+
+    def __init__(self, semilla=0, prefijo='SIN', hasta=None, dias=365, tamano_lote=TAMANO_LOTE):
+        self.rng = random.Random(semilla)
+        self.prefijo = prefijo
+        self.tamano_lote = tamano_lote
+        hasta = hasta or timezone.localdate()
+        self.fin = datetime.combine(hasta + timedelta(days=1), time.min)
+        if settings.USE_TZ:
+            self.fin = timezone.make_aware(self.fin)
+        self.inicio = self.fin - timedelta(days=dias)
+
+        self.productos = []
+        self.racks = []
+        self.proveedores = []
+        self.areas = []
+        self.usuarios = []
+        self.stock = {}
+        self.versiones = {}
+        self._acumulados = []
+
+    # --- Catálogo -------------------------------------------------------------
+
+    def generar_catalogo(self, productos, racks, proveedores, areas, usuarios=5):
+        if Producto.objects.filter(codigo_producto__startswith=f"{self.prefijo}-").exists():
+            raise ValueError(f"Ya hay datos generados con el prefijo '{self.prefijo}'.")
+        rng, p = self.rng, self.prefijo
+        lote = self.tamano_lote
+
+        with transaction.atomic():
+            # bulk_create no devuelve los ids en MySQL: se leen de vuelta
+            nombres = [f"{p.lower()}_operario{i:02d}" for i in range(1, usuarios + 1)]
+            User.objects.bulk_create([User(username=nombre, password='!') for nombre in nombres], batch_size=lote)
+            self.usuarios = list(User.objects.filter(username__in=nombres).order_by('username').values_list('id', flat=True))
+            Rack.objects.bulk_create(
+                [Rack(codigo_rack=f"{p}-R{i:04d}", descripcion=f"Pasillo {1 + i % 20}") for i in range(1, racks + 1)],
+                batch_size=lote,
+            )
+            self.racks = [f"{p}-R{i:04d}" for i in range(1, racks + 1)]
+            Proveedor.objects.bulk_create(
+                [Proveedor(nombre=f"{p} Proveedor {i:05d}", contacto=f"Contacto {i}",
+                           telefono=f"+56 9 {rng.randint(10000000, 99999999)}",
+                           correo_electronico=f"ventas{i}@proveedor.example")
+                 for i in range(1, proveedores + 1)],
+                batch_size=lote,
+            )
+            self.proveedores = list(
+                Proveedor.objects.filter(nombre__startswith=f"{p} Proveedor ").order_by('id').values_list('id', flat=True)
+            )
+            Area.objects.bulk_create(
+                [Area(nombre=f"{p} Área {i:04d}") for i in range(1, areas + 1)], batch_size=lote
+            )
+            self.areas = list(
+                Area.objects.filter(nombre__startswith=f"{p} Área ").order_by('id').values_list('id', flat=True)
+            )
+
+            nuevos = []
+            for i in range(1, productos + 1):
+                codigo = f"{p}-{i:07d}"
+                nuevos.append(Producto(
+                    codigo_producto=codigo,
+                    nombre=f"{rng.choice(_TIPOS)} {rng.choice(_MATERIALES)} {rng.choice(_MEDIDAS)}",
+                    ubicacion_rack_id=rng.choice(self.racks) if self.racks else None,
+                    proveedor_id=rng.choice(self.proveedores) if self.proveedores else None,
+                    categoria=rng.choice(_CATEGORIAS),
+                    estado=rng.choice(_ESTADOS),
+                    unidad_de_medida=rng.choice(_UNIDADES),
+                    stock_minimo=rng.choice([0, 0, 5, 10, 20]),
+                ))
+                self.productos.append(codigo)
+                if len(nuevos) >= lote:
+                    Producto.objects.bulk_create(nuevos)
+                    nuevos = []
+            Producto.objects.bulk_create(nuevos)
+
+        # Pocos productos concentran la mayoría de los movimientos (Zipf)
+        orden = list(self.productos)
+        rng.shuffle(orden)
+        self.productos = orden
+        self._acumulados = list(accumulate(1 / (i + 1) ** 0.8 for i in range(len(orden))))
+        self.stock = dict.fromkeys(orden, 0)
+        self.versiones = dict.fromkeys(orden, 0)
+
+    # --- Documentos -----------------------------------------------------------
+
+    def _producto_al_azar(self):
+        return self.productos[bisect(self._acumulados, self.rng.random() * self._acumulados[-1])]
+
+    def _cantidad_lineas(self, tipo):
+        return 1 + min(int(self.rng.expovariate(1 / (LINEAS_MEDIAS[tipo] - 1))), LINEAS_MAXIMAS - 1)
+
+    def _lineas(self, tipo):
+        """
+        Líneas (codigo, cantidad) de un documento. En despachos descuenta del
+        saldo en memoria línea a línea, así nunca se despacha más de lo que hay.
+        """
+        lineas = []
+        for _ in range(self._cantidad_lineas(tipo)):
+            codigo = self._producto_al_azar()
+            if tipo == 'recepcion':
+                cantidad = self.rng.randint(*CANTIDAD_RECEPCION)
+            else:
+                disponible = self.stock[codigo] - sum(c for p, c in lineas if p == codigo)
+                if disponible <= 0:
+                    continue
+                cantidad = self.rng.randint(1, min(disponible, CANTIDAD_MAXIMA_DESPACHO))
+            lineas.append((codigo, cantidad))
+        return lineas
+
+    def generar_documentos(self, documentos, progreso=None):
+        """
+        Genera `documentos` recepciones y despachos repartidos entre `inicio`
+        y `fin`. Un despacho sin stock disponible se convierte en recepción.
+        `progreso(documentos, movimientos)` se llama tras cada lote escrito.
+        Devuelve la cantidad de movimientos creados.
+        """
+        if not self.productos:
+            raise ValueError("Genere el catálogo antes que los documentos.")
+        rng = self.rng
+        paso = (self.fin - self.inicio) / max(documentos, 1)
+        siguiente = {'recepcion': _siguiente_id(Recepcion), 'despacho': _siguiente_id(Despacho)}
+        pendientes = {'recepcion': [], 'despacho': [], 'recepcion_items': [], 'despacho_items': [], 'movimientos': []}
+        escritos = movimientos = 0
+
+        campos_fecha = [Recepcion._meta.get_field('fecha_recepcion'), Despacho._meta.get_field('fecha_despacho'),
+                        MovimientoInventario._meta.get_field('fecha_hora')]
+        with fechas_explicitas(*campos_fecha):
+            for i in range(documentos):
+                fecha = self.inicio + paso * i + paso * rng.random()
+                tipo = 'recepcion' if rng.random() < PROPORCION_RECEPCIONES else 'despacho'
+                lineas = self._lineas(tipo)
+                if not lineas:
+                    tipo = 'recepcion'
+                    lineas = self._lineas(tipo)
+                movimientos += self._documento(tipo, siguiente[tipo], fecha, lineas, pendientes)
+                siguiente[tipo] += 1
+
+                if len(pendientes['movimientos']) >= self.tamano_lote:
+                    self._escribir(pendientes)
+                    escritos = i + 1
+                    if progreso:
+                        progreso(escritos, movimientos)
+            self._escribir(pendientes)
+            if progreso and escritos != documentos:
+                progreso(documentos, movimientos)
+
+        self._actualizar_stock()
+        _reiniciar_secuencias(Recepcion, Despacho)
+        return movimientos
+
+    def _documento(self, tipo, pk, fecha, lineas, pendientes):
+        usuario_id = self.rng.choice(self.usuarios) if self.usuarios else None
+        if tipo == 'recepcion':
+            pendientes['recepcion'].append(Recepcion(
+                id=pk, fecha_recepcion=fecha, proveedor_id=self.rng.choice(self.proveedores),
+                documento_referencia=f"OC-{pk:07d}", usuario_registra_id=usuario_id,
+            ))
+            pendientes['recepcion_items'].extend(
+                RecepcionItem(recepcion_id=pk, producto_id=codigo, cantidad=cantidad) for codigo, cantidad in lineas
+            )
+            signo, tipo_movimiento, referencia = 1, 'Recepción', f"Recepción ID: {pk}"
+        else:
+            pendientes['despacho'].append(Despacho(
+                id=pk, fecha_despacho=fecha, usuario_registra_id=usuario_id,
+                usuario_solicitante=f"Solicitante {self.rng.randint(1, 200)}",
+                area_id=self.rng.choice(self.areas) if self.areas else None,
+                motivo=self.rng.choice(_MOTIVOS),
+            ))
+            pendientes['despacho_items'].extend(
+                DespachoItem(despacho_id=pk, producto_id=codigo, cantidad=cantidad) for codigo, cantidad in lineas
+            )
+            signo, tipo_movimiento, referencia = -1, 'Despacho', f"Despacho ID: {pk}"
+
+        # Mismo encadenamiento de saldos que _registrar_movimientos
+        for codigo, cantidad in lineas:
+            stock_anterior = self.stock[codigo]
+            self.stock[codigo] = stock_anterior + signo * cantidad
+            pendientes['movimientos'].append(MovimientoInventario(
+                producto_id=codigo, fecha_hora=fecha, tipo_movimiento=tipo_movimiento, cantidad=signo * cantidad,
+                stock_anterior=stock_anterior, stock_nuevo=self.stock[codigo], referencia=referencia,
+            ))
+        for codigo in {codigo for codigo, _ in lineas}:
+            self.versiones[codigo] += 1
+        return len(lineas)
+
+    def _escribir(self, pendientes):
+        """Inserta las cabeceras, líneas y movimientos acumulados en una transacción."""
+        with transaction.atomic():
+            for modelo, clave in ((Recepcion, 'recepcion'), (Despacho, 'despacho'),
+                                  (RecepcionItem, 'recepcion_items'), (DespachoItem, 'despacho_items'),
+                                  (MovimientoInventario, 'movimientos')):
+                modelo.objects.bulk_create(pendientes[clave], batch_size=self.tamano_lote)
+                pendientes[clave] = []
+
+    def _actualizar_stock(self):
+        """Deja el stock y la versión de cada producto igual al último saldo del Kardex."""
+        productos = [
+            Producto(codigo_producto=codigo, cantidad_stock=self.stock[codigo], version=self.versiones[codigo])
+            for codigo in self.productos if self.versiones[codigo]
+        ]
+        with transaction.atomic():
+            Producto.objects.bulk_update(productos, ['cantidad_stock', 'version'], batch_size=1000)
+
+    # --- Auditoría ------------------------------------------------------------
+
+    def generar_auditoria(self, entradas):
+        """Genera `entradas` del registro de auditoría repartidas entre `inicio` y `fin`."""
+        rng = self.rng
+        paso = (self.fin - self.inicio) / max(entradas, 1)
+        pendientes = []
+        with fechas_explicitas(AuditLog._meta.get_field('fecha_hora')):
+            for i in range(entradas):
+                modelo, accion = rng.choice(_ACCIONES_AUDITORIA)
+                pendientes.append(AuditLog(
+                    usuario_id=rng.choice(self.usuarios) if self.usuarios else None,
+                    accion=accion, modelo_afectado=modelo,
+                    detalle=f"Objeto: {modelo} {rng.choice(self.productos) if self.productos else i}",
+                    fecha_hora=self.inicio + paso * i + paso * rng.random(),
+                ))
+                if len(pendientes) >= self.tamano_lote:
+                    AuditLog.objects.bulk_create(pendientes)
+                    pendientes = []
+            AuditLog.objects.bulk_create(pendientes)
+
+
+def finalizar_carga():
+    """
+    Aplica de una vez lo que las señales habrían hecho fila a fila: índice de
+    búsqueda, versiones del catálogo y del stock, y caché del dashboard.
+    """
+    total = reindexar_todo()
+    renovar_version(VERSION_CATALOGO)
+    renovar_version(VERSION_STOCK)
+    invalidar_dashboard()
+    return total
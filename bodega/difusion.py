@@ -0,0 +1,115 @@
+# bodega/difusion.py
+
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .cache import consultar_stock, aconsultar_stock
+
+# ==============================================================================
+# Difusión de Cambios de Stock
+# ==============================================================================
+# Las tablets se suscriben por SSE (ver `stock_en_vivo` en views.py) a
+# productos o racks y reciben el stock nuevo cuando se confirma cada
+# movimiento, en lugar de consultar el stock cada pocos segundos.
+#
+# El backend se elige con BODEGA_DIFUSION_BACKEND. DifusionLocal reparte los
+# eventos dentro del proceso: con varios workers, cada uno solo avisa a sus
+# propias conexiones. Para repartir entre workers, escriba un backend con los
+# mismos métodos (publicar/suscribir/desuscribir) sobre un canal compartido,
+# por ejemplo Redis pub/sub. `hay_suscriptores` es opcional: sin él, cada
+# movimiento consulta y publica el stock aunque nadie esté escuchando.
+
+TAMANO_COLA = 100
+
+class Suscripcion:
+    """
+    Cola de eventos de una conexión. Se crea dentro del event loop que la
+    consume; `entregar` puede llamarse desde cualquier hilo.
+    """
+    def __init__(self, productos=(), racks=()):
+        self.productos = set(productos)
+        self.racks = set(racks)
+        self.cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        self._loop = asyncio.get_running_loop()
+
+    def interesa(self, evento):
+        return evento['codigo'] in self.productos or evento['rack'] in self.racks
+
+    def podria_interesar(self, codigos):
+        """Sin leer el stock: el rack de cada producto solo se conoce al consultarlo."""
+        return bool(self.racks) or not self.productos.isdisjoint(codigos)
+
+    def entregar(self, evento):
+        self._loop.call_soon_threadsafe(self._encolar, evento)
+
+    def _encolar(self, evento):
+        # Un cliente lento no debe frenar a los demás: se descarta el evento
+        # más antiguo, el siguiente ya trae el stock vigente.
+        if self.cola.full():
+            self.cola.get_nowait()
+        self.cola.put_nowait(evento)
+
+class DifusionLocal:
+    """Reparte los eventos entre las suscripciones de este proceso."""
+    def __init__(self):
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self, suscripcion):
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def hay_suscriptores(self, codigos):
+        with self._lock:
+            return any(suscripcion.podria_interesar(codigos) for suscripcion in self._suscripciones)
+
+    def publicar(self, eventos):
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for evento in eventos:
+            for suscripcion in suscripciones:
+                if suscripcion.interesa(evento):
+                    suscripcion.entregar(evento)
+
+_difusor = None
+_lock_difusor = threading.Lock()
+
+def obtener_difusor():
+    global _difusor
+    with _lock_difusor:
+        if _difusor is None:
+            ruta = getattr(settings, 'BODEGA_DIFUSION_BACKEND', 'bodega.difusion.DifusionLocal')
+            _difusor = import_string(ruta)()
+        return _difusor
+
+def eventos_stock(codigos):
+    """Un evento por producto con su stock, mínimo, rack, unidad y versión actuales."""
+    return [{'codigo': codigo, **datos} for codigo, datos in consultar_stock(codigos).items()]
+
+async def aeventos_stock(codigos):
+    return [{'codigo': codigo, **datos} for codigo, datos in (await aconsultar_stock(codigos)).items()]
+
+def publicar_stock(codigos):
+    """
+    Difunde el stock de `codigos` cuando se confirma la transacción en curso.
+    Se lee después del commit para no anunciar un stock que luego se revierte.
+    """
+    codigos = list(codigos)
+
+    def publicar():
+        difusor = obtener_difusor()
+        hay_suscriptores = getattr(difusor, 'hay_suscriptores', None)
+        if hay_suscriptores is not None and not hay_suscriptores(codigos):
+            return
+        difusor.publicar(eventos_stock(codigos))
+
+    # robust: un fallo al difundir se registra en el log sin afectar al movimiento
+    transaction.on_commit(publicar, robust=True)
@@ -0,0 +1,100 @@
+# bodega/etiquetas.py
+
+import hashlib
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from .models import Producto
+from .pdfs import guardar_archivo
+from .pdfs_proceso import generar_qr, escribir_pdf
+
+# ==============================================================================
+# Caché de Imágenes QR
+# ==============================================================================
+# El QR de un producto solo depende de su código, así que la imagen nunca
+# cambia: se genera una vez, se guarda en disco y se sirve con caché
+# inmutable. Si cambian los parámetros de `generar_qr`, suba VERSION_QR
+# para que las claves (y los ETag) cambien.
+
+VERSION_QR = 'v1'
+
+FORMATOS_QR = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Por debajo de esta cantidad de imágenes faltantes no compensa arrancar procesos
+MINIMO_PARALELO = 200
+
+def directorio_qr():
+    return Path(getattr(settings, 'BODEGA_QR_CACHE_DIR', Path(settings.BASE_DIR) / 'cache_qr'))
+
+def clave_qr(codigo, formato):
+    return hashlib.sha256(f"{VERSION_QR}:{formato}:{codigo}".encode()).hexdigest()
+
+def ruta_qr(codigo, formato):
+    clave = clave_qr(codigo, formato)
+    return directorio_qr() / clave[:2] / f"{clave}.{formato}"
+
+def obtener_qr(codigo, formato='png'):
+    """Ruta de la imagen QR en caché, generándola si hace falta."""
+    ruta = ruta_qr(codigo, formato)
+    if not ruta.exists():
+        guardar_archivo(ruta, generar_qr(codigo, formato))
+    return ruta
+
+def obtener_qrs(codigos, formato='png', procesos=None):
+    """
+    Como `obtener_qr` para muchos códigos a la vez: las imágenes que faltan
+    se generan repartidas entre procesos. Devuelve {codigo: ruta}.
+    """
+    rutas = {codigo: ruta_qr(codigo, formato) for codigo in codigos}
+    faltantes = [codigo for codigo, ruta in rutas.items() if not ruta.exists()]
+    if len(faltantes) < MINIMO_PARALELO:
+        imagenes = (generar_qr(codigo, formato) for codigo in faltantes)
+        for codigo, imagen in zip(faltantes, imagenes):
+            guardar_archivo(rutas[codigo], imagen)
+        return rutas
+
+    procesos = procesos or getattr(settings, 'BODEGA_PDF_PROCESOS', None)
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        imagenes = pool.map(generar_qr, faltantes, [formato] * len(faltantes), chunksize=50)
+        for codigo, imagen in zip(faltantes, imagenes):
+            guardar_archivo(rutas[codigo], imagen)
+    return rutas
+
+# ==============================================================================
+# Hojas de Etiquetas
+# ==============================================================================
+
+def productos_para_etiquetas(rack=None, categoria=None):
+    """(codigo, nombre) de los productos a etiquetar, agrupados por rack."""
+    productos = Producto.objects.all()
+    if rack:
+        productos = productos.filter(ubicacion_rack_id=rack)
+    if categoria:
+        productos = productos.filter(categoria=categoria)
+    return productos.order_by('ubicacion_rack_id', 'nombre').values_list('codigo_producto', 'nombre')
+
+def hoja_etiquetas(productos, procesos=None):
+    """
+    Arma un único PDF con una etiqueta QR por cada (codigo, nombre) de
+    `productos` y devuelve un archivo temporal listo para enviarse.
+    """
+    productos = list(productos)
+    rutas = obtener_qrs([codigo for codigo, _nombre in productos], 'png', procesos)
+    etiquetas = [
+        {'codigo': codigo, 'nombre': nombre, 'imagen': rutas[codigo].resolve().as_uri()}
+        for codigo, nombre in productos
+    ]
+    html_string = get_template('bodega/pdf/etiquetas_pdf.html').render({'etiquetas': etiquetas})
+    archivo = tempfile.TemporaryFile()
+    archivo.write(escribir_pdf(html_string))
+    archivo.seek(0)
+    return archivo
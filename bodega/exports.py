@@ -0,0 +1,163 @@
+# bodega/exports.py
+
+import csv
+import json
+import os
+import tempfile
+from datetime import date, datetime
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse, FileResponse, HttpResponseBadRequest
+from openpyxl import Workbook
+
+from .metricas import registro as metricas, contar_bytes
+
+# ==============================================================================
+# Configuración
+# ==============================================================================
+
+TAMANO_BLOQUE = 2000
+
+FORMATOS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# ==============================================================================
+# Lectura por Bloques
+# ==============================================================================
+
+def iterar_en_bloques(queryset, campos, tamano=TAMANO_BLOQUE):
+    """
+    Recorre `queryset` como tuplas de `campos` pidiendo `tamano` filas por
+    consulta, avanzando por clave primaria (keyset). A diferencia de
+    `.iterator()`, que en MySQL descarga el resultado completo al cliente,
+    cada bloque es una consulta independiente y la memoria queda acotada.
+    El primer campo de la consulta interna es siempre `pk`, y las filas
+    salen ordenadas por él.
+    """
+    ultimo = None
+    while True:
+        bloque = queryset.order_by('pk')
+        if ultimo is not None:
+            bloque = bloque.filter(pk__gt=ultimo)
+        filas = list(bloque.values_list('pk', *campos)[:tamano])
+        if not filas:
+            return
+        for fila in filas:
+            yield fila[1:]
+        ultimo = filas[-1][0]
+        if len(filas) < tamano:
+            return
+
+# ==============================================================================
+# Escritores por Formato
+# ==============================================================================
+
+class _Eco:
+    """Pseudo-archivo que devuelve lo escrito en lugar de guardarlo."""
+    def write(self, value):
+        return value
+
+def _valor_texto(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+def _generar_csv(encabezados, filas):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel reconozca los acentos al abrir el CSV
+    yield '\ufeff' + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow([_valor_texto(valor) for valor in fila])
+
+def _generar_ndjson(claves, filas):
+    for fila in filas:
+        yield json.dumps(dict(zip(claves, fila)), ensure_ascii=False, default=_valor_texto) + '\n'
+
+def _xlsx_temporal(titulo, encabezados, filas):
+    """
+    Escribe el libro en modo write-only (las filas se vuelcan a disco a medida
+    que se agregan) y devuelve un archivo temporal listo para enviarse.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo)
+    ws.append(encabezados)
+    for fila in filas:
+        # openpyxl no admite datetimes con zona horaria
+        ws.append([valor.replace(tzinfo=None) if isinstance(valor, datetime) else valor for valor in fila])
+    archivo = tempfile.TemporaryFile()
+    wb.save(archivo)
+    archivo.seek(0)
+    return archivo
+
+# ==============================================================================
+# Respuesta HTTP
+# ==============================================================================
+
+# Bajo ASGI, Django recorre los iteradores síncronos con sync_to_async(list):
+# carga la descarga completa en memoria antes de enviar el primer byte. Estas
+# respuestas piden los trozos en el hilo de la petición, de a unos 64 KB por
+# salto, y los envían a medida que llegan. Bajo WSGI no cambian nada.
+
+TAMANO_SALTO_ASGI = 64 * 1024
+
+class _EnvioPorTrozos:
+    async def __aiter__(self):
+        if self.is_async:
+            async for parte in super().__aiter__():
+                yield parte
+            return
+        trozos = self.streaming_content
+
+        def siguientes():
+            partes, tamano = [], 0
+            for parte in trozos:
+                partes.append(parte)
+                tamano += len(parte)
+                if tamano >= TAMANO_SALTO_ASGI:
+                    break
+            return partes
+
+        while partes := await sync_to_async(siguientes)():
+            for parte in partes:
+                yield parte
+
+class RespuestaStreaming(_EnvioPorTrozos, StreamingHttpResponse):
+    pass
+
+class RespuestaArchivo(_EnvioPorTrozos, FileResponse):
+    pass
+
+def formato_solicitado(request, por_defecto='xlsx'):
+    """Lee el parámetro `format` de la petición (xlsx, csv o ndjson)."""
+    return (request.GET.get('format') or por_defecto).lower()
+
+def respuesta_exportacion(formato, nombre_base, titulo, encabezados, claves, filas):
+    """
+    Construye la respuesta de descarga para cualquier exportación.
+    `encabezados` se usa en XLSX/CSV y `claves` como nombres en NDJSON;
+    `filas` puede ser cualquier iterable (idealmente un generador).
+    """
+    if formato not in FORMATOS:
+        return HttpResponseBadRequest(f"Formato no soportado. Use: {', '.join(FORMATOS)}")
+    content_type, extension = FORMATOS[formato]
+    nombre_archivo = f"{nombre_base}.{extension}"
+
+    if formato == 'xlsx':
+        archivo = _xlsx_temporal(titulo, encabezados, filas)
+        metricas.incrementar('bodega_exportacion_bytes_total', os.fstat(archivo.fileno()).st_size, formato=formato)
+        return RespuestaArchivo(archivo, as_attachment=True, filename=nombre_archivo, content_type=content_type)
+    if formato == 'csv':
+        contenido = _generar_csv(encabezados, filas)
+    else:
+        contenido = _generar_ndjson(claves, filas)
+    contenido = contar_bytes(
+        contenido, lambda total: metricas.incrementar('bodega_exportacion_bytes_total', total, formato=formato)
+    )
+    response = RespuestaStreaming(contenido, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
@@ -1,21 +1,47 @@
 from django import forms
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.forms import UserCreationForm
+from django.db import transaction
+from django.db.models import F
 from .models import (
     Producto, Proveedor, Rack, Area,
     Recepcion, RecepcionItem,
     Despacho, DespachoItem
 )
+from .services import ConflictoConcurrenciaError
 
 # ==============================================================================
 # Formularios para Catálogos (Producto, Proveedor, Rack, Area)
 # ==============================================================================
 
 class ProductoForm(forms.ModelForm):
+    # Versión leída al abrir el formulario, para detectar ediciones concurrentes
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         for field in self.fields:
             self.fields[field].widget.attrs.update({'class': 'form-control'})
+        self.fields['version'].initial = self.instance.version
+        # El código es la clave primaria y el formulario puede cambiarlo
+        self._pk_original = None if self.instance._state.adding else self.instance.pk
+
+    def save(self, commit=True):
+        if self._pk_original is not None:
+            # Compare-and-swap sobre `version`: solo gana quien editó la
+            # versión vigente; si un movimiento u otro usuario escribió el
+            # producto desde que se abrió el formulario, no se guarda nada.
+            leida = self.cleaned_data.get('version')
+            if leida is None:
+                leida = self.instance.version
+            with transaction.atomic():
+                if not Producto.objects.filter(pk=self._pk_original, version=leida).update(version=F('version') + 1):
+                    raise ConflictoConcurrenciaError(
+                        f"El producto {self._pk_original} fue modificado por otro usuario"
+                    )
+                self.instance.version = leida + 1
+                return super().save(commit)
+        return super().save(commit)
     
     class Meta:
         model = Producto
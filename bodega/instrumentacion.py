@@ -0,0 +1,123 @@
+# bodega/instrumentacion.py
+
+import contextvars
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# ==============================================================================
+# Instrumentación SQL por Petición
+# ==============================================================================
+# Cada conexión lleva un execute_wrapper permanente (se instala al crearse,
+# ver signals.py) que no hace nada salvo que la petición en curso esté siendo
+# medida: InstrumentacionSQLMiddleware deja un RegistroSQL en una variable de
+# contexto para las peticiones de la muestra (BODEGA_SQL_MUESTREO). Al ser
+# una variable de contexto, el registro también ve las consultas que una
+# vista asíncrona hace mediante sync_to_async, que usan otra conexión.
+#
+# Cada consulta se reduce a una huella (literales y listas IN reemplazados)
+# y, cuando una misma huella supera BODEGA_SQL_UMBRAL_REPETICIONES, se anota
+# desde dónde se ejecutó: la línea de plantilla y la línea de código de la
+# app. La pila solo se recorre en ese momento, una vez por huella.
+
+UMBRAL_REPETICIONES = 10
+
+_registro_actual = contextvars.ContextVar('bodega_registro_sql', default=None)
+
+_DIRECTORIO_APP = str(Path(__file__).parent)
+
+_RE_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMEROS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+def huella_sql(sql):
+    """SQL normalizado: mismas consultas con distintos valores dan la misma huella."""
+    sql = _RE_CADENAS.sub('?', sql)
+    sql = _RE_NUMEROS.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _RE_LISTAS.sub('(?...)', sql)
+    return _RE_ESPACIOS.sub(' ', sql).strip()
+
+def _origen_consulta():
+    """(línea de plantilla, línea de código de la app) desde donde se ejecuta la consulta."""
+    plantilla = codigo = None
+    frame = sys._getframe(2)
+    while frame is not None and (plantilla is None or codigo is None):
+        if plantilla is None and frame.f_code.co_name == 'render_annotated':
+            nodo = frame.f_locals.get('self')
+            token = getattr(nodo, 'token', None)
+            origen = getattr(nodo, 'origin', None)
+            if token is not None and origen is not None:
+                plantilla = f"{origen.template_name}:{token.lineno}"
+        archivo = frame.f_code.co_filename
+        if codigo is None and archivo.startswith(_DIRECTORIO_APP) and archivo != __file__:
+            codigo = f"{Path(archivo).name}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return plantilla, codigo
+
+class RegistroSQL:
+    """
+    Consultas de una petición: cantidad, tiempo total y, si es `detallado`,
+    repeticiones por huella. El modo simple (usado por las métricas en todas
+    las peticiones) no normaliza el SQL.
+    """
+
+    def __init__(self, umbral=UMBRAL_REPETICIONES, detallado=True):
+        self.umbral = umbral
+        self.detallado = detallado
+        self.consultas = 0
+        self.tiempo = 0.0
+        self.huellas = Counter()
+        self.repetidas = {}
+
+    def registrar(self, sql, duracion):
+        self.consultas += 1
+        self.tiempo += duracion
+        if not self.detallado:
+            return
+        huella = huella_sql(sql)
+        self.huellas[huella] += 1
+        if self.huellas[huella] == self.umbral + 1:
+            plantilla, codigo = _origen_consulta()
+            self.repetidas[huella] = {'plantilla': plantilla, 'codigo': codigo}
+
+    def resumen_repetidas(self):
+        return [
+            {'sql': huella, 'veces': self.huellas[huella], **origen}
+            for huella, origen in self.repetidas.items()
+        ]
+
+    def server_timing(self):
+        valor = f'db;dur={self.tiempo * 1000:.1f};desc="{self.consultas} consultas"'
+        if self.repetidas:
+            valor += f', n1;desc="{len(self.repetidas)} consultas repetidas"'
+        return valor
+
+def envolver_consulta(execute, sql, params, many, context):
+    """execute_wrapper instalado en cada conexión."""
+    registro = _registro_actual.get()
+    if registro is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        registro.registrar(sql, time.perf_counter() - inicio)
+
+def instalar_en_conexion(connection):
+    if envolver_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(envolver_consulta)
+
+def registro_actual():
+    return _registro_actual.get()
+
+def iniciar_registro(umbral=UMBRAL_REPETICIONES, detallado=True):
+    """Empieza a medir en el contexto actual. Devuelve (registro, token)."""
+    registro = RegistroSQL(umbral, detallado)
+    return registro, _registro_actual.set(registro)
+
+def terminar_registro(token):
+    _registro_actual.reset(token)
@@ -0,0 +1,56 @@
+# bodega/management/commands/archivar_historial.py
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bodega.archivo import (
+    archivar_kardex, archivar_auditoria, directorio_archivo, TAMANO_LOTE, TIPO_SALDO_INICIAL
+)
+from bodega.models import MovimientoInventario
+from bodega.snapshots import ultimo_dia_consolidado
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve el Kardex y el registro de auditoría anteriores al horizonte de "
+        "retención a archivos JSONL.gz mensuales (ver bodega/archivo.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=getattr(settings, 'BODEGA_RETENCION_DIAS', 365),
+            help="Días que se conservan en la base de datos (por defecto BODEGA_RETENCION_DIAS)."
+        )
+        parser.add_argument('--solo', choices=['kardex', 'auditoria'], help="Archiva solo una de las tablas.")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Filas borradas por transacción.")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError("--dias debe ser al menos 1.")
+        fecha_corte = timezone.localdate() - timedelta(days=options['dias'])
+        corte = timezone.make_aware(datetime.combine(fecha_corte, time.min))
+
+        if options['solo'] != 'auditoria':
+            # Las consultas de stock a una fecha pasada dependen de los snapshots
+            consolidado = ultimo_dia_consolidado()
+            sin_consolidar = MovimientoInventario.objects.filter(fecha_hora__lt=corte).exclude(tipo_movimiento=TIPO_SALDO_INICIAL)
+            if consolidado is not None:
+                sin_consolidar = sin_consolidar.filter(fecha_hora__date__gt=consolidado)
+            if sin_consolidar.exists():
+                raise CommandError(
+                    "Hay días sin consolidar antes del corte. Ejecute primero "
+                    "'consolidar_stock_diario'."
+                )
+            archivados, saldos = archivar_kardex(corte, options['lote'])
+            self.stdout.write(f"Kardex: {archivados} movimientos archivados, {saldos} saldos iniciales.")
+
+        if options['solo'] != 'kardex':
+            archivados = archivar_auditoria(corte, options['lote'])
+            self.stdout.write(f"Auditoría: {archivados} registros archivados.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Historial anterior al {fecha_corte:%d-%m-%Y} archivado en {directorio_archivo()}."
+        ))
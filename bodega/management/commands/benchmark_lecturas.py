@@ -0,0 +1,131 @@
+# bodega/management/commands/benchmark_lecturas.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from bodega.models import Producto
+
+
+def _cerrar_conexion():
+    # `connection` se resuelve en el hilo que llama: no pasar connection.close a otro hilo
+    connection.close()
+
+
+def _percentil(tiempos, p):
+    ordenados = sorted(tiempos)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara peticiones por segundo y latencia p99 de los endpoints AJAX de "
+        "lectura (autocompletado, stock por lote y dashboard), con middleware, "
+        "sesión y autenticación incluidos: en modo síncrono con un pool de hilos "
+        "del tamaño de los workers y en modo asíncrono con muchas tareas "
+        "concurrentes en un solo event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=2000, help="Peticiones por lectura y modo.")
+        parser.add_argument('--hilos', type=int, default=4, help="Hilos del modo síncrono (equivale a los workers WSGI).")
+        parser.add_argument('--concurrencia', type=int, default=100, help="Tareas simultáneas del modo asíncrono.")
+        parser.add_argument('--usuario', help="Usuario con el que se inicia sesión (por defecto, el primer superusuario activo).")
+
+    def handle(self, *args, **options):
+        if options['peticiones'] < 1 or options['hilos'] < 1 or options['concurrencia'] < 1:
+            raise CommandError("--peticiones, --hilos y --concurrencia deben ser al menos 1.")
+        codigos = list(Producto.objects.order_by('pk').values_list('pk', flat=True)[:60])
+        if not codigos:
+            raise CommandError("No hay productos: cargue datos antes de medir.")
+        usuarios = User.objects.filter(is_active=True)
+        if options['usuario']:
+            usuario = usuarios.filter(username=options['usuario']).first()
+        else:
+            usuario = usuarios.filter(is_superuser=True).order_by('pk').first()
+        if usuario is None:
+            raise CommandError("No se encontró el usuario: indíquelo con --usuario.")
+        consultas = [codigo[:2] for codigo in codigos]
+
+        lecturas = [
+            ('autocompletado', lambda i: (reverse('ajax_buscar_productos'), {'q': consultas[i % len(consultas)]})),
+            ('stock por lote', lambda i: (reverse('ajax_stock_productos'), {'codigo': codigos})),
+            ('dashboard', lambda i: (reverse('ajax_dashboard_datos'), {})),
+        ]
+        # El cliente de pruebas se presenta como 'testserver'
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.stdout.write(f"{'Lectura':<16}{'Modo':<8}{'pet/s':>10}{'p99 (ms)':>12}")
+            for nombre, peticion in lecturas:
+                for modo, resultado in (
+                    ('sync', self._medir_sync(usuario, peticion, options['peticiones'], options['hilos'])),
+                    ('async', asyncio.run(self._medir_async(usuario, peticion, options['peticiones'], options['concurrencia']))),
+                ):
+                    total, tiempos = resultado
+                    self.stdout.write(
+                        f"{nombre:<16}{modo:<8}{len(tiempos) / total:>10.0f}{_percentil(tiempos, 99) * 1000:>12.2f}"
+                    )
+
+    def _comprobar(self, respuesta):
+        if respuesta.status_code != 200:
+            raise CommandError(f"{respuesta.request['PATH_INFO']}: respuesta {respuesta.status_code}.")
+
+    def _medir_sync(self, usuario, peticion, peticiones, hilos):
+        # Un cliente (sesión) y una conexión por hilo, como un worker WSGI que
+        # atiende muchas peticiones; la conexión se cierra al terminar.
+        clientes = [Client() for _ in range(hilos)]
+        for cliente in clientes:
+            cliente.force_login(usuario)
+
+        def trabajador(numero):
+            tiempos = []
+            try:
+                for i in range(numero, peticiones, hilos):
+                    url, parametros = peticion(i)
+                    inicio = time.perf_counter()
+                    respuesta = clientes[numero].get(url, parametros)
+                    tiempos.append(time.perf_counter() - inicio)
+                    self._comprobar(respuesta)
+            finally:
+                connection.close()
+            return tiempos
+
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=hilos) as executor:
+                tiempos = [t for parte in executor.map(trabajador, range(hilos)) for t in parte]
+            return time.perf_counter() - inicio, tiempos
+        finally:
+            for cliente in clientes:
+                cliente.logout()
+
+    async def _medir_async(self, usuario, peticion, peticiones, concurrencia):
+        cliente = AsyncClient()
+        await cliente.aforce_login(usuario)
+        limite = asyncio.Semaphore(concurrencia)
+
+        async def una(i):
+            url, parametros = peticion(i)
+            async with limite:
+                inicio = time.perf_counter()
+                respuesta = await cliente.get(url, parametros)
+                segundos = time.perf_counter() - inicio
+            self._comprobar(respuesta)
+            return segundos
+
+        inicio = time.perf_counter()
+        try:
+            tiempos = await asyncio.gather(*(una(i) for i in range(peticiones)))
+            return time.perf_counter() - inicio, tiempos
+        finally:
+            await cliente.alogout()
+            # La conexión del hilo donde corre el ORM asíncrono (thread_sensitive)
+            await sync_to_async(_cerrar_conexion)()
@@ -0,0 +1,274 @@
+# bodega/management/commands/benchmark_vistas.py
+
+import json
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, TestCase
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from bodega.cache import invalidar_dashboard
+from bodega.datos_sinteticos import GeneradorDatos, finalizar_carga
+from bodega.models import Area, Despacho, MovimientoInventario, Producto, Proveedor, Recepcion
+from bodega.pdfs import descartar_pdf
+from bodega.services import registrar_recepcion
+
+# Escalas de la base sembrada. La "grande" se parece a un año de producción.
+ESCALAS = {
+    'pequena': {'productos': 500, 'documentos': 2_000, 'auditoria': 2_000},
+    'mediana': {'productos': 5_000, 'documentos': 50_000, 'auditoria': 50_000},
+    'grande': {'productos': 50_000, 'documentos': 2_000_000, 'auditoria': 1_000_000},
+}
+PREFIJO = 'BEN'
+# Fecha fija: cada corrida a la misma escala siembra exactamente los mismos datos
+FECHA_DATOS = date(2026, 1, 31)
+LINEAS_DESPACHO = (1, 50, 500)
+
+
+class Caso:
+    """Una petición a medir. `preparar` se ejecuta antes de cada repetición, fuera del cronómetro."""
+    def __init__(self, nombre, peticion, estado=200, preparar=None):
+        self.nombre = nombre
+        self.peticion = peticion
+        self.estado = estado
+        self.preparar = preparar
+
+
+def comparar_con_base(resultados, base, umbral, tolerancia_segundos, tolerancia_kb=64):
+    """
+    Devuelve la lista de regresiones de `resultados` frente a `base`. El
+    tiempo y la memoria cuentan como regresión si superan la base en más de
+    `umbral` (fracción) y además en más de la tolerancia absoluta, para no
+    fallar por ruido en casos de pocos milisegundos. Las consultas son
+    deterministas a una escala dada: cualquier consulta de más es regresión.
+    """
+    regresiones = []
+    for nombre, actual in resultados['casos'].items():
+        anterior = base['casos'].get(nombre)
+        if anterior is None:
+            continue
+        if actual['consultas'] > anterior['consultas']:
+            regresiones.append(f"{nombre}: {anterior['consultas']} -> {actual['consultas']} consultas")
+        for campo, tolerancia, unidad in (('segundos', tolerancia_segundos, 's'),
+                                          ('memoria_pico_kb', tolerancia_kb, 'KB')):
+            diferencia = actual[campo] - anterior[campo]
+            if diferencia > anterior[campo] * umbral and diferencia > tolerancia:
+                regresiones.append(
+                    f"{nombre}: {campo} {anterior[campo]:g} -> {actual[campo]:g} {unidad} "
+                    f"(+{diferencia / anterior[campo] * 100 if anterior[campo] else 100:.0f}%)"
+                )
+    return regresiones
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra una base de pruebas a la escala elegida y mide las vistas críticas "
+        "(tiempo, consultas SQL y pico de memoria). Escribe los resultados en JSON y, "
+        "con --base, falla si alguna vista empeoró más del umbral respecto de esa medición."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', choices=ESCALAS, default='pequena')
+        parser.add_argument('--repeticiones', type=int, default=5, help="Repeticiones medidas por caso (tras una de calentamiento).")
+        parser.add_argument('--casos', nargs='*', help="Mide solo los casos con estos nombres.")
+        parser.add_argument('--salida', help="Archivo JSON donde guardar los resultados.")
+        parser.add_argument('--base', help="Resultados JSON de referencia con los que comparar.")
+        parser.add_argument('--umbral', type=float, default=0.2, help="Empeoramiento relativo tolerado (0.2 = 20%%).")
+        parser.add_argument('--tolerancia-ms', type=float, default=5, help="Diferencia de tiempo ignorada como ruido.")
+        parser.add_argument('--keepdb', action='store_true', help="Conserva la base sembrada para la próxima corrida (la medición no la modifica).")
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError("--repeticiones debe ser al menos 1.")
+        base = None
+        if options['base']:
+            with open(options['base'], encoding='utf-8') as f:
+                base = json.load(f)
+            if base.get('escala') != options['escala']:
+                raise CommandError(f"La base se midió a escala '{base.get('escala')}', no '{options['escala']}'.")
+
+        # Base de pruebas aparte, como el test runner: nunca se tocan los datos reales
+        setup_test_environment()
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        directorio = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                BODEGA_PDF_CACHE_DIR=directorio, BODEGA_QR_CACHE_DIR=directorio,
+                BODEGA_PDF_PRECALENTAR=False, BODEGA_SQL_MUESTREO=0,
+            ):
+                self._sembrar(options['escala'])
+                # Todo lo que escriben los casos (la recepción de stock, los
+                # despachos medidos, la auditoría) se revierte: con --keepdb la
+                # base sembrada queda igual y las corridas siguen comparables.
+                with transaction.atomic():
+                    resultados = self._medir_casos(options)
+                    transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+            connection.creation.destroy_test_db(nombre_original, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                json.dump(resultados, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
+        if base is not None:
+            regresiones = comparar_con_base(
+                resultados, base, options['umbral'], options['tolerancia_ms'] / 1000
+            )
+            if regresiones:
+                raise CommandError("Regresiones respecto de la base:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto de la base."))
+
+    # --- Datos ----------------------------------------------------------------
+
+    def _sembrar(self, escala):
+        tamanos = ESCALAS[escala]
+        existentes = Producto.objects.filter(pk__startswith=f"{PREFIJO}-").count()
+        if existentes:
+            if existentes != tamanos['productos']:
+                raise CommandError(
+                    f"La base conservada tiene {existentes} productos; vuelva a sembrarla sin --keepdb."
+                )
+            return
+        self.stdout.write(f"Sembrando escala '{escala}'...")
+        inicio = time.perf_counter()
+        generador = GeneradorDatos(semilla=0, prefijo=PREFIJO, hasta=FECHA_DATOS)
+        generador.generar_catalogo(
+            tamanos['productos'], racks=max(tamanos['productos'] // 25, 1),
+            proveedores=max(tamanos['productos'] // 20, 1), areas=40,
+        )
+        generador.generar_documentos(tamanos['documentos'])
+        generador.generar_auditoria(tamanos['auditoria'])
+        finalizar_carga()
+        self.stdout.write(f"Base sembrada en {time.perf_counter() - inicio:.1f} s")
+
+    def _datos_despacho(self, area, productos, lineas):
+        datos = {
+            'usuario_solicitante': 'Benchmark', 'area': area.pk, 'motivo': 'Benchmark',
+            'items-TOTAL_FORMS': str(lineas), 'items-INITIAL_FORMS': '0',
+        }
+        for i in range(lineas):
+            datos[f'items-{i}-producto'] = productos[i % len(productos)]
+            datos[f'items-{i}-cantidad'] = '1'
+        return datos
+
+    def _casos(self, repeticiones):
+        productos = Producto.objects.filter(pk__startswith=f"{PREFIJO}-")
+        palabra = productos.order_by('pk').values_list('nombre', flat=True).first().split()[0]
+        con_mas_kardex = (
+            MovimientoInventario.objects.values('producto').annotate(total=Count('id'))
+            .order_by('-total').values_list('producto', flat=True).first()
+        )
+        despacho = Despacho.objects.annotate(lineas=Count('items')).order_by('-lineas', '-pk').first()
+        area = Area.objects.order_by('pk').first()
+
+        # Stock suficiente para todas las repeticiones de los despachos, con
+        # una recepción real para que el Kardex siga cuadrando
+        codigos = list(productos.order_by('pk').values_list('pk', flat=True)[:max(LINEAS_DESPACHO)])
+        usos = (repeticiones + 2) * sum(-(-lineas // len(codigos)) for lineas in LINEAS_DESPACHO)
+        registrar_recepcion(
+            Recepcion(proveedor=Proveedor.objects.order_by('pk').first(), documento_referencia='BENCHMARK'),
+            [(codigo, usos) for codigo in codigos]
+        )
+
+        casos = [
+            Caso('dashboard', lambda c: c.get(reverse('dashboard')), preparar=invalidar_dashboard),
+            Caso('lista_stock', lambda c: c.get(reverse('lista_stock'))),
+            Caso('lista_stock_q', lambda c: c.get(reverse('lista_stock'), {'q': palabra})),
+            Caso('buscar_productos_ajax', lambda c: c.get(reverse('ajax_buscar_productos'), {'q': palabra[:3]})),
+            Caso('historial_producto', lambda c: c.get(reverse('historial_producto', args=[con_mas_kardex]))),
+        ]
+        for lineas in LINEAS_DESPACHO:
+            datos = self._datos_despacho(area, codigos, lineas)
+            casos.append(Caso(
+                f'agregar_despacho_{lineas}', lambda c, datos=datos: c.post(reverse('agregar_despacho'), datos), estado=302
+            ))
+        casos += [
+            Caso('exportar_stock_excel', lambda c: c.get(reverse('exportar_stock_excel'))),
+            # Sin el PDF en caché: se mide el render, no la lectura del archivo
+            Caso('generar_despacho_pdf', lambda c: c.get(reverse('generar_despacho_pdf', args=[despacho.pk])),
+                 preparar=lambda: descartar_pdf('despacho', despacho.pk)),
+            Caso('audit_log_view', lambda c: c.get(reverse('audit_log'))),
+        ]
+        return casos
+
+    # --- Medición -------------------------------------------------------------
+
+    def _ejecutar(self, cliente, caso):
+        # Dentro de la transacción de la medición nada se confirma: los
+        # callbacks on_commit (invalidación de caché, auditoría) se ejecutan
+        # al final de cada petición, como tras un commit real.
+        if caso.preparar:
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                caso.preparar()
+        inicio = time.perf_counter()
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            respuesta = caso.peticion(cliente)
+            # El cliente cierra la respuesta al terminar de leerla sin disparar
+            # close_old_connections, que cerraría la conexión en plena transacción
+            if respuesta.streaming:
+                for _ in respuesta.streaming_content:
+                    pass
+        segundos = time.perf_counter() - inicio
+        if respuesta.status_code != caso.estado:
+            raise CommandError(f"{caso.nombre}: respuesta {respuesta.status_code}, se esperaba {caso.estado}.")
+        return segundos
+
+    def _medir(self, cliente, caso, repeticiones):
+        self._ejecutar(cliente, caso)  # calentamiento (plantillas, índice de autocompletado)
+        tiempos = [self._ejecutar(cliente, caso) for _ in range(repeticiones)]
+
+        # Consultas y memoria en una pasada aparte: tracemalloc distorsiona el tiempo
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as consultas:
+                self._ejecutar(cliente, caso)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'segundos': round(statistics.median(tiempos), 5),
+            'segundos_min': round(min(tiempos), 5),
+            'consultas': len(consultas),
+            'memoria_pico_kb': round(pico / 1024),
+        }
+
+    def _medir_casos(self, options):
+        usuario = User.objects.filter(username='benchmark').first() or User.objects.create_superuser('benchmark')
+        cliente = Client()
+        cliente.force_login(usuario)
+
+        casos = self._casos(options['repeticiones'])
+        if options['casos']:
+            desconocidos = set(options['casos']) - {caso.nombre for caso in casos}
+            if desconocidos:
+                raise CommandError(f"Casos desconocidos: {', '.join(sorted(desconocidos))}")
+            casos = [caso for caso in casos if caso.nombre in options['casos']]
+
+        resultados = {
+            'escala': options['escala'], 'motor': connection.vendor,
+            'repeticiones': options['repeticiones'], 'fecha': timezone.now().isoformat(), 'casos': {},
+        }
+        self.stdout.write(f"{'Caso':<26}{'mediana (ms)':>14}{'mín (ms)':>10}{'consultas':>11}{'pico (KB)':>11}")
+        for caso in casos:
+            medicion = self._medir(cliente, caso, options['repeticiones'])
+            resultados['casos'][caso.nombre] = medicion
+            self.stdout.write(
+                f"{caso.nombre:<26}{medicion['segundos'] * 1000:>14.1f}{medicion['segundos_min'] * 1000:>10.1f}"
+                f"{medicion['consultas']:>11}{medicion['memoria_pico_kb']:>11}"
+            )
+        return resultados
@@ -0,0 +1,43 @@
+# bodega/management/commands/consolidar_stock_diario.py
+
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bodega.snapshots import consolidar_dia, dias_pendientes
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Fecha inválida '{valor}', use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Consolida el Kardex en StockSnapshotDiario. Por defecto continúa desde el "
+        "último día consolidado hasta ayer; pensado para ejecutarse una vez al día (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help="Recalcula desde esta fecha (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=_fecha, help="Último día a consolidar (por defecto, ayer).")
+
+    def handle(self, *args, **options):
+        hasta = options['hasta'] or timezone.localdate() - timedelta(days=1)
+        dias = dias_pendientes(hasta, desde=options['desde'])
+        if not dias:
+            self.stdout.write("No hay días pendientes de consolidar.")
+            return
+
+        total = 0
+        for dia in dias:
+            escritos = consolidar_dia(dia)
+            total += escritos
+            if escritos:
+                self.stdout.write(f"{dia}: {escritos} productos")
+        self.stdout.write(self.style.SUCCESS(
+            f"Consolidados {len(dias)} días ({dias[0]} a {dias[-1]}), {total} snapshots."
+        ))
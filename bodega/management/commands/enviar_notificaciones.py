@@ -0,0 +1,34 @@
+# bodega/management/commands/enviar_notificaciones.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from bodega.notificaciones import enviar_notificaciones_pendientes, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía las alertas de stock bajo pendientes como un correo resumen por "
+        "administrador. Ejecútelo desde cron o con --continuo como proceso aparte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help="Repite el envío indefinidamente.")
+        parser.add_argument('--intervalo', type=int, default=300, help="Segundos entre resúmenes en modo continuo (por defecto 300).")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Máximo de alertas por resumen.")
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            # Vaciamos la bandeja completa, un resumen por lote
+            while True:
+                procesadas = enviar_notificaciones_pendientes(options['lote'])
+                total += procesadas
+                if procesadas < options['lote']:
+                    break
+            if total:
+                self.stdout.write(f"{total} alertas procesadas.")
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
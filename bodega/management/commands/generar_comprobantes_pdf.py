@@ -0,0 +1,56 @@
+# bodega/management/commands/generar_comprobantes_pdf.py
+
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bodega.pdfs import documentos_en_rango, renderizar_lote, generar_zip, unir_pdfs, TAMANO_LOTE_PDF
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Fecha inválida '{valor}', use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera en paralelo los comprobantes PDF de los despachos o recepciones de "
+        "un período y los entrega en un ZIP o en un único PDF (ver bodega/pdfs.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=['despacho', 'recepcion'])
+        parser.add_argument('salida', help="Archivo de destino (.zip o .pdf según --formato).")
+        parser.add_argument('--desde', type=_fecha, help="Primer día del período (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=_fecha, help="Último día del período (AAAA-MM-DD).")
+        parser.add_argument('--formato', choices=['zip', 'pdf'], default='zip')
+        parser.add_argument('--procesos', type=int, help="Procesos de renderizado (por defecto BODEGA_PDF_PROCESOS).")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_PDF, help="Documentos leídos por consulta.")
+
+    def handle(self, *args, **options):
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError("--desde no puede ser posterior a --hasta.")
+        tipo = options['tipo']
+        pks = list(documentos_en_rango(tipo, options['desde'], options['hasta']))
+        if not pks:
+            self.stdout.write("No hay documentos en el período indicado.")
+            return
+
+        def progreso(hechos, total):
+            self.stdout.write(f"{hechos}/{total} comprobantes")
+
+        documentos = renderizar_lote(tipo, pks, options['procesos'], options['lote'], progreso)
+        salida = Path(options['salida'])
+        with open(salida, 'wb') as destino:
+            if options['formato'] == 'pdf':
+                with unir_pdfs(documentos) as unido:
+                    while trozo := unido.read(64 * 1024):
+                        destino.write(trozo)
+            else:
+                for trozo in generar_zip(tipo, documentos):
+                    destino.write(trozo)
+
+        self.stdout.write(self.style.SUCCESS(f"{len(pks)} comprobantes de {tipo} guardados en {salida}."))
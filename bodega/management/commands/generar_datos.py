@@ -0,0 +1,75 @@
+# bodega/management/commands/generar_datos.py
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bodega.datos_sinteticos import GeneradorDatos, finalizar_carga, TAMANO_LOTE
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Fecha inválida '{valor}', use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos deterministas (catálogo, recepciones, despachos y "
+        "Kardex con saldos encadenados) para medir el rendimiento con volúmenes de "
+        "producción. Solo para bases de desarrollo: inserta con bulk_create sin señales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--racks', type=int, default=200)
+        parser.add_argument('--proveedores', type=int, default=300)
+        parser.add_argument('--areas', type=int, default=40)
+        parser.add_argument('--usuarios', type=int, default=5, help="Operarios que registran los documentos.")
+        parser.add_argument('--documentos', type=int, default=20000, help="Recepciones y despachos en total.")
+        parser.add_argument('--auditoria', type=int, default=0, help="Entradas del registro de auditoría.")
+        parser.add_argument('--dias', type=int, default=365, help="Días de historia que cubren los documentos.")
+        parser.add_argument('--hasta', type=_fecha, help="Último día con documentos (por defecto, hoy).")
+        parser.add_argument('--semilla', type=int, default=0, help="La misma semilla y fecha dan los mismos datos.")
+        parser.add_argument('--prefijo', default='SIN', help="Prefijo de códigos y nombres del conjunto generado.")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Filas por bulk_create.")
+
+    def handle(self, *args, **options):
+        for opcion in ('productos', 'proveedores', 'dias', 'lote'):
+            if options[opcion] < 1:
+                raise CommandError(f"--{opcion} debe ser al menos 1.")
+        for opcion in ('racks', 'areas', 'usuarios', 'documentos', 'auditoria'):
+            if options[opcion] < 0:
+                raise CommandError(f"--{opcion} no puede ser negativo.")
+
+        generador = GeneradorDatos(
+            semilla=options['semilla'], prefijo=options['prefijo'], hasta=options['hasta'],
+            dias=options['dias'], tamano_lote=options['lote'],
+        )
+        inicio = time.perf_counter()
+        try:
+            generador.generar_catalogo(
+                options['productos'], options['racks'], options['proveedores'], options['areas'],
+                usuarios=options['usuarios'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Catálogo: {options['productos']} productos ({time.perf_counter() - inicio:.1f} s)")
+
+        def progreso(documentos, movimientos):
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(f"{documentos} documentos, {movimientos} movimientos ({movimientos / segundos:.0f} mov/s)")
+
+        movimientos = generador.generar_documentos(options['documentos'], progreso=progreso)
+        generador.generar_auditoria(options['auditoria'])
+        indexados = finalizar_carga()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generados {options['documentos']} documentos y {movimientos} movimientos en "
+            f"{time.perf_counter() - inicio:.1f} s; {indexados} productos indexados."
+        ))
+        self.stdout.write(
+            "Para los gráficos históricos ejecute: "
+            f"manage.py consolidar_stock_diario --desde {generador.inicio.date()}"
+        )
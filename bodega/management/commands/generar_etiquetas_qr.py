@@ -0,0 +1,31 @@
+# bodega/management/commands/generar_etiquetas_qr.py
+
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from bodega.etiquetas import productos_para_etiquetas, hoja_etiquetas
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera una hoja de etiquetas QR en PDF para un rack, una categoría o "
+        "todo el catálogo (ver bodega/etiquetas.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help="Archivo PDF de destino.")
+        parser.add_argument('--rack', help="Solo los productos de este rack.")
+        parser.add_argument('--categoria', help="Solo los productos de esta categoría.")
+        parser.add_argument('--procesos', type=int, help="Procesos para generar los QR (por defecto BODEGA_PDF_PROCESOS).")
+
+    def handle(self, *args, **options):
+        productos = list(productos_para_etiquetas(rack=options['rack'], categoria=options['categoria']))
+        if not productos:
+            self.stdout.write("No hay productos que etiquetar.")
+            return
+
+        salida = Path(options['salida'])
+        with hoja_etiquetas(productos, options['procesos']) as pdf, open(salida, 'wb') as destino:
+            destino.write(pdf.read())
+        self.stdout.write(self.style.SUCCESS(f"{len(productos)} etiquetas guardadas en {salida}."))
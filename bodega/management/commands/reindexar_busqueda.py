@@ -0,0 +1,16 @@
+# bodega/management/commands/reindexar_busqueda.py
+
+from django.core.management.base import BaseCommand
+
+from bodega.busqueda import reindexar_todo
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye el índice de búsqueda de productos (ProductoToken). Solo es "
+        "necesario tras cargas masivas que no disparan señales (bulk_create, SQL directo)."
+    )
+
+    def handle(self, *args, **options):
+        total = reindexar_todo()
+        self.stdout.write(self.style.SUCCESS(f"Índice de búsqueda reconstruido para {total} productos."))
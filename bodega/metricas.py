@@ -0,0 +1,205 @@
+# bodega/metricas.py
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+# ==============================================================================
+# Métricas en Proceso
+# ==============================================================================
+# Contadores e histogramas en memoria, protegidos por un lock, expuestos en
+# formato de texto de Prometheus por la vista `metricas`. Con varios workers
+# (gunicorn) cada proceso vuelca su estado a un archivo propio dentro de
+# BODEGA_METRICAS_DIR, como máximo cada INTERVALO_VOLCADO segundos y al
+# salir; la vista suma los archivos de todos los procesos. Contadores e
+# histogramas solo crecen, así que la suma es siempre correcta; los archivos
+# de procesos ya terminados se siguen sumando para que los totales no bajen.
+
+INTERVALO_VOLCADO = 5
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+class _Metrica:
+    def __init__(self, nombre, tipo, ayuda, etiquetas, buckets=None):
+        self.nombre = nombre
+        self.tipo = tipo
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = buckets
+
+class Registro:
+    """Conjunto de métricas de un proceso. Todas las operaciones son seguras entre hilos."""
+
+    def __init__(self):
+        self._metricas = {}
+        # {nombre: {valores de etiquetas (tupla): número o [buckets..., +Inf, suma]}}
+        self._valores = {}
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._ultimo_volcado = 0.0
+        self._lock_volcado = threading.Lock()
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        self._metricas[nombre] = _Metrica(nombre, 'counter', ayuda, tuple(etiquetas))
+        self._valores.setdefault(nombre, {})
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        self._metricas[nombre] = _Metrica(nombre, 'histogram', ayuda, tuple(etiquetas), tuple(buckets))
+        self._valores.setdefault(nombre, {})
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = tuple(str(etiquetas[e]) for e in self._metricas[nombre].etiquetas)
+        with self._lock:
+            valores = self._valores[nombre]
+            valores[clave] = valores.get(clave, 0) + valor
+        self._volcar_si_corresponde()
+
+    def observar(self, nombre, valor, **etiquetas):
+        metrica = self._metricas[nombre]
+        clave = tuple(str(etiquetas[e]) for e in metrica.etiquetas)
+        with self._lock:
+            serie = self._valores[nombre].get(clave)
+            if serie is None:
+                serie = self._valores[nombre][clave] = [0] * (len(metrica.buckets) + 1) + [0.0]
+            # Conteo por bucket (el último es +Inf) y la suma; los acumulados
+            # se calculan al exponer
+            serie[bisect_left(metrica.buckets, valor)] += 1
+            serie[-1] += valor
+        self._volcar_si_corresponde()
+
+    # --- Multiproceso ---
+
+    def _directorio(self):
+        directorio = getattr(settings, 'BODEGA_METRICAS_DIR', None)
+        return Path(directorio) if directorio else None
+
+    def _estado(self):
+        with self._lock:
+            return {
+                nombre: [[list(clave), valor if not isinstance(valor, list) else valor[:]] for clave, valor in valores.items()]
+                for nombre, valores in self._valores.items()
+            }
+
+    def volcar(self):
+        """Escribe el estado de este proceso en su archivo del directorio compartido."""
+        directorio = self._directorio()
+        if directorio is None:
+            return
+        with self._lock_volcado:
+            if self._archivo is None:
+                # pid + token: un pid reutilizado nunca pisa el archivo de otro proceso
+                self._archivo = directorio / f"metricas_{os.getpid()}_{uuid.uuid4().hex[:8]}.json"
+            directorio.mkdir(parents=True, exist_ok=True)
+            descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as archivo:
+                json.dump(self._estado(), archivo)
+            os.replace(temporal, self._archivo)
+            self._ultimo_volcado = time.monotonic()
+
+    def _volcar_si_corresponde(self):
+        if self._directorio() is not None and time.monotonic() - self._ultimo_volcado >= INTERVALO_VOLCADO:
+            self.volcar()
+
+    def _estados(self):
+        """Estado de este proceso más el de los demás procesos del directorio compartido."""
+        estados = [self._estado()]
+        directorio = self._directorio()
+        if directorio is not None and directorio.exists():
+            for ruta in directorio.glob('metricas_*.json'):
+                if ruta == self._archivo:
+                    continue
+                try:
+                    estados.append(json.loads(ruta.read_text()))
+                except (OSError, ValueError):
+                    continue
+        return estados
+
+    # --- Exposición ---
+
+    def exponer(self):
+        """Texto en formato de exposición de Prometheus con la suma de todos los procesos."""
+        totales = {nombre: {} for nombre in self._metricas}
+        for estado in self._estados():
+            for nombre, series in estado.items():
+                if nombre not in totales:
+                    continue
+                for clave, valor in series:
+                    clave = tuple(clave)
+                    actual = totales[nombre].get(clave)
+                    if actual is None:
+                        totales[nombre][clave] = valor[:] if isinstance(valor, list) else valor
+                    elif isinstance(valor, list):
+                        totales[nombre][clave] = [a + b for a, b in zip(actual, valor)]
+                    else:
+                        totales[nombre][clave] = actual + valor
+
+        lineas = []
+        for nombre, metrica in self._metricas.items():
+            lineas.append(f"# HELP {nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre} {metrica.tipo}")
+            for clave, valor in sorted(totales[nombre].items()):
+                etiquetas = [f'{e}="{_escapar(v)}"' for e, v in zip(metrica.etiquetas, clave)]
+                if metrica.tipo == 'counter':
+                    lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+                    continue
+                acumulado = 0
+                for limite, cantidad in zip(metrica.buckets + ('+Inf',), valor[:-1]):
+                    acumulado += cantidad
+                    le = f'le="{limite}"'
+                    lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + [le])} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(valor[-1])}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+        return '\n'.join(lineas) + '\n'
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _etiquetas(etiquetas):
+    return '{' + ','.join(etiquetas) + '}' if etiquetas else ''
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+# ==============================================================================
+# Métricas de Bodega
+# ==============================================================================
+
+registro = Registro()
+
+registro.histograma('bodega_peticion_segundos', "Duración de las peticiones por vista.", ('vista', 'metodo'))
+registro.histograma('bodega_peticion_db_segundos', "Tiempo de base de datos por petición.", ('vista',))
+registro.histograma('bodega_respuesta_bytes', "Tamaño de las respuestas por vista.", ('vista',), BUCKETS_BYTES)
+registro.contador('bodega_despachos_total', "Despachos registrados.")
+registro.contador('bodega_recepciones_total', "Recepciones registradas.")
+registro.contador('bodega_lineas_registradas_total', "Líneas de documentos registradas.", ('tipo',))
+registro.contador('bodega_pdfs_renderizados_total', "Comprobantes PDF renderizados.", ('tipo',))
+registro.contador('bodega_exportacion_bytes_total', "Bytes enviados en exportaciones.", ('formato',))
+
+atexit.register(registro.volcar)
+
+def contar_documento(tipo, lineas):
+    """Cuenta un despacho o recepción y sus líneas cuando se confirma la transacción."""
+    def contar():
+        registro.incrementar('bodega_despachos_total' if tipo == 'despacho' else 'bodega_recepciones_total')
+        registro.incrementar('bodega_lineas_registradas_total', lineas, tipo=tipo)
+    transaction.on_commit(contar)
+
+def contar_bytes(contenido, al_terminar):
+    """Recorre `contenido` (str o bytes) y llama a `al_terminar(total)` con los bytes enviados."""
+    total = 0
+    try:
+        for trozo in contenido:
+            total += len(trozo.encode('utf-8') if isinstance(trozo, str) else trozo)
+            yield trozo
+    finally:
+        al_terminar(total)
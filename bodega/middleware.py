@@ -1,22 +1,214 @@
 # bodega/middleware.py
 
-import threading
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
 
-_thread_locals = threading.local()
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .auditoria import auditoria_en_lote, auditoria_en_lote_async
+from .instrumentacion import iniciar_registro, terminar_registro, registro_actual, UMBRAL_REPETICIONES
+from .metricas import registro as metricas, contar_bytes
+
+logger_sql = logging.getLogger('bodega.sql')
+
+# El usuario de la petición vive en una variable de contexto y no en un
+# threading.local: bajo ASGI varias peticiones comparten hilo, y un hilo de un
+# pool atiende peticiones distintas. sync_to_async copia el contexto al hilo
+# que ejecuta la vista, y las señales (y sus on_commit) leen el usuario desde
+# ahí. Los hilos propios no heredan el contexto: use `copiar_contexto`.
+#
+# Se guarda dentro de un _Referencia porque asgiref compara con != los valores
+# del contexto al pasar entre sync y async: request.user es un objeto perezoso
+# y esa comparación lo cargaría desde el event loop (SynchronousOnlyOperation).
+class _Referencia:
+    __slots__ = ('usuario',)
+
+    def __init__(self, usuario):
+        self.usuario = usuario
+
+_usuario_actual = contextvars.ContextVar('bodega_usuario_actual', default=_Referencia(None))
 
 def get_current_user():
     """Devuelve el usuario logueado actualmente."""
-    return getattr(_thread_locals, 'user', None)
+    return _usuario_actual.get().usuario
+
+@contextmanager
+def usuario_actual(user):
+    """Fija el usuario de auditoría dentro del bloque (comandos, tareas, pruebas)."""
+    token = _usuario_actual.set(_Referencia(user))
+    try:
+        yield
+    finally:
+        _usuario_actual.reset(token)
+
+def copiar_contexto(func):
+    """
+    Envuelve `func` para que se ejecute con el contexto actual (usuario,
+    lote de auditoría) aunque la llame otro hilo, por ejemplo un executor.
+    """
+    contexto = contextvars.copy_context()
+    def ejecutar(*args, **kwargs):
+        return contexto.run(func, *args, **kwargs)
+    return ejecutar
 
 class CurrentUserMiddleware:
     """
     Middleware que guarda el usuario de cada petición en una variable
-    accesible globalmente (pero segura para cada hilo/petición).
+    accesible globalmente (pero propia de cada petición, también bajo ASGI).
+    También agrupa la auditoría de la petición en un solo INSERT.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        _thread_locals.user = request.user
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Al salir se restablece el valor anterior, así el hilo no arrastra
+        # el usuario a la siguiente petición (o a código fuera de una petición).
+        with usuario_actual(request.user):
+            with auditoria_en_lote():
+                return self.get_response(request)
+
+    async def __acall__(self, request):
+        with usuario_actual(request.user):
+            async with auditoria_en_lote_async():
+                return await self.get_response(request)
+
+
+class InstrumentacionSQLMiddleware:
+    """
+    Mide las consultas SQL de una muestra de peticiones (ver
+    bodega/instrumentacion.py): agrega el header Server-Timing, deja una
+    línea de log con los números de la petición y avisa cuando una misma
+    consulta se repite más de BODEGA_SQL_UMBRAL_REPETICIONES veces (N+1).
+    Las peticiones fuera de la muestra no pagan nada.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.muestreo = getattr(settings, 'BODEGA_SQL_MUESTREO', 0)
+        self.umbral = getattr(settings, 'BODEGA_SQL_UMBRAL_REPETICIONES', UMBRAL_REPETICIONES)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _en_muestra(self):
+        return self.muestreo >= 1 or (self.muestreo > 0 and random.random() < self.muestreo)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._en_muestra():
+            return self.get_response(request)
+        registro, token = self._iniciar()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                terminar_registro(token)
+        return self._informar(request, response, registro)
+
+    async def __acall__(self, request):
+        if not self._en_muestra():
+            return await self.get_response(request)
+        registro, token = self._iniciar()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                terminar_registro(token)
+        return self._informar(request, response, registro)
+
+    def _iniciar(self):
+        # Si MetricasMiddleware ya está midiendo la petición, se amplía su
+        # registro en lugar de taparlo con otro
+        registro = registro_actual()
+        if registro is not None:
+            registro.detallado = True
+            registro.umbral = self.umbral
+            return registro, None
+        return iniciar_registro(self.umbral)
+
+    def _informar(self, request, response, registro):
+        vista = request.resolver_match.view_name if request.resolver_match else None
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': vista,
+            'estado': response.status_code,
+            'consultas': registro.consultas,
+            'tiempo_db_ms': round(registro.tiempo * 1000, 1),
+        }
+        logger_sql.info(
+            "%s %s: %d consultas, %.1f ms de base de datos", request.method, request.path,
+            registro.consultas, registro.tiempo * 1000, extra={'sql': datos}
+        )
+        repetidas = registro.resumen_repetidas()
+        if repetidas:
+            logger_sql.warning(
+                "Posible N+1 en %s: %s", vista or request.path,
+                '; '.join(f"{r['veces']}x en {r['plantilla'] or r['codigo']}" for r in repetidas),
+                extra={'sql': {**datos, 'repetidas': repetidas}}
+            )
+        response['Server-Timing'] = registro.server_timing()
+        return response
+
+
+class MetricasMiddleware:
+    """
+    Alimenta las métricas de cada petición (ver bodega/metricas.py):
+    latencia, tiempo de base de datos y tamaño de la respuesta por vista.
+    Va primero en MIDDLEWARE para medir la petición completa.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        registro, token = iniciar_registro(detallado=False)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            terminar_registro(token)
+        return self._observar(request, response, registro, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        registro, token = iniciar_registro(detallado=False)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            terminar_registro(token)
+        return self._observar(request, response, registro, time.perf_counter() - inicio)
+
+    def _observar(self, request, response, registro, duracion):
+        vista = request.resolver_match.url_name if request.resolver_match else 'sin_ruta'
+        vista = vista or 'sin_nombre'
+        metricas.observar('bodega_peticion_segundos', duracion, vista=vista, metodo=request.method)
+        metricas.observar('bodega_peticion_db_segundos', registro.tiempo, vista=vista)
+        if not response.streaming:
+            metricas.observar('bodega_respuesta_bytes', len(response.content), vista=vista)
+        elif not response.is_async:
+            # Descargas: el tamaño se conoce cuando termina de enviarse
+            response.streaming_content = contar_bytes(
+                response.streaming_content,
+                lambda total: metricas.observar('bodega_respuesta_bytes', total, vista=vista)
+            )
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0005_alter_recepcion_documento_referencia_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True, verbose_name='Última Actualización'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
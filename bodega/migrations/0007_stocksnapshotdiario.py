@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0006_producto_version_actualizado_en'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshotDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('stock_cierre', models.IntegerField(verbose_name='Stock al Cierre')),
+                ('total_entradas', models.IntegerField(default=0, verbose_name='Total Entradas')),
+                ('total_salidas', models.IntegerField(default=0, help_text='Suma de las salidas del día (valor positivo)', verbose_name='Total Salidas')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='bodega.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Snapshot Diario de Stock',
+                'verbose_name_plural': 'Snapshots Diarios de Stock',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['fecha'], name='snapshot_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'fecha'), name='snapshot_unico_por_dia')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:11
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copia congelada del tokenizador de bodega/busqueda.py al crear el índice:
+# la migración no debe cambiar si el tokenizador evoluciona. Los productos
+# se pueden reindexar después con `manage.py reindexar_busqueda`.
+def tokens_producto(codigo_producto, nombre):
+    texto = unicodedata.normalize('NFKD', f"{codigo_producto} {nombre}")
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    tokens = set()
+    for palabra in re.sub(r'[^0-9a-z]+', ' ', texto).split():
+        if len(palabra) < 3:
+            tokens.add(palabra)
+        else:
+            tokens.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return tokens
+
+
+def indexar_productos_existentes(apps, schema_editor):
+    Producto = apps.get_model('bodega', 'Producto')
+    ProductoToken = apps.get_model('bodega', 'ProductoToken')
+    lote = []
+    for codigo, nombre in Producto.objects.order_by().values_list('codigo_producto', 'nombre').iterator(chunk_size=1000):
+        lote.extend(ProductoToken(producto_id=codigo, token=token) for token in tokens_producto(codigo, nombre))
+        if len(lote) >= 1000:
+            ProductoToken.objects.bulk_create(lote)
+            lote = []
+    ProductoToken.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0008_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=10)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_busqueda', to='bodega.producto')),
+            ],
+            options={
+                'verbose_name': 'Token de Búsqueda',
+                'verbose_name_plural': 'Tokens de Búsqueda',
+                'indexes': [models.Index(fields=['token', 'producto'], name='token_busqueda_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'token'), name='token_unico_por_producto')],
+            },
+        ),
+        migrations.RunPython(indexar_productos_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0009_productotoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_actual', models.IntegerField(verbose_name='Stock Actual')),
+                ('stock_minimo', models.IntegerField(verbose_name='Stock Mínimo')),
+                ('referencia', models.CharField(blank=True, max_length=255, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Creado en')),
+                ('enviado_en', models.DateTimeField(blank=True, null=True, verbose_name='Enviado en')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bodega.producto', verbose_name='Producto')),
+                ('usuario_registra', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuario que registra')),
+            ],
+            options={
+                'verbose_name': 'Notificación Pendiente',
+                'verbose_name_plural': 'Notificaciones Pendientes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['enviado_en', 'id'], name='notificacion_pendiente_idx')],
+            },
+        ),
+    ]
@@ -62,6 +62,10 @@ class Producto(models.Model):
     observaciones = models.TextField(blank=True, null=True)
     stock_minimo = models.IntegerField(default=0, verbose_name="Stock Mínimo")
 
+    # Control de concurrencia optimista: cada cambio de stock incrementa la versión
+    version = models.PositiveIntegerField(default=0, editable=False)
+    actualizado_en = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+
     def __str__(self):
         return f"{self.nombre} ({self.codigo_producto})"
 
@@ -74,6 +78,26 @@ class Producto(models.Model):
         ]
     
 
+class ProductoToken(models.Model):
+    """
+    Trigrama (o palabra corta) del nombre o código normalizado de un producto.
+    Es el índice de búsqueda de productos: permite buscar subcadenas sin
+    `LIKE '%...%'`. Lo mantienen las señales de Producto (ver bodega/busqueda.py).
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='tokens_busqueda')
+    token = models.CharField(max_length=10)
+
+    class Meta:
+        verbose_name = "Token de Búsqueda"
+        verbose_name_plural = "Tokens de Búsqueda"
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'token'], name='token_unico_por_producto')
+        ]
+        indexes = [
+            models.Index(fields=['token', 'producto'], name='token_busqueda_idx'),
+        ]
+
+
 # ==============================================================================
 # Modelos de Movimientos (Transacciones)
 # ==============================================================================
@@ -139,6 +163,62 @@ class MovimientoInventario(models.Model):
         verbose_name = "Movimiento de Inventario"
         verbose_name_plural = "Movimientos de Inventario"
         ordering = ['-fecha_hora']
+        indexes = [
+            # Kardex de un producto paginado por cursor (fecha_hora, id)
+            models.Index(fields=['producto', 'fecha_hora', 'id'], name='kardex_producto_fecha_idx'),
+            # Recorridos por rango de fechas (dashboard, consolidación diaria)
+            models.Index(fields=['fecha_hora', 'id'], name='kardex_fecha_idx'),
+        ]
+
+class StockSnapshotDiario(models.Model):
+    """
+    Resumen diario del Kardex de un producto: stock al cierre del día y total
+    de entradas y salidas. Solo existen filas para los días con movimientos;
+    lo mantiene el comando `consolidar_stock_diario`.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='snapshots', verbose_name="Producto")
+    fecha = models.DateField(verbose_name="Fecha")
+    stock_cierre = models.IntegerField(verbose_name="Stock al Cierre")
+    total_entradas = models.IntegerField(default=0, verbose_name="Total Entradas")
+    total_salidas = models.IntegerField(default=0, help_text="Suma de las salidas del día (valor positivo)", verbose_name="Total Salidas")
+
+    def __str__(self):
+        return f"{self.producto_id} al {self.fecha}: {self.stock_cierre}"
+
+    class Meta:
+        verbose_name = "Snapshot Diario de Stock"
+        verbose_name_plural = "Snapshots Diarios de Stock"
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'fecha'], name='snapshot_unico_por_dia')
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], name='snapshot_fecha_idx'),
+        ]
+
+class NotificacionPendiente(models.Model):
+    """
+    Bandeja de salida de alertas de stock bajo. Se escribe en la misma
+    transacción que el despacho y la vacía el comando `enviar_notificaciones`.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, verbose_name="Producto")
+    stock_actual = models.IntegerField(verbose_name="Stock Actual")
+    stock_minimo = models.IntegerField(verbose_name="Stock Mínimo")
+    usuario_registra = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Usuario que registra")
+    referencia = models.CharField(max_length=255, blank=True, null=True)
+    creado_en = models.DateTimeField(auto_now_add=True, verbose_name="Creado en")
+    enviado_en = models.DateTimeField(null=True, blank=True, verbose_name="Enviado en")
+
+    def __str__(self):
+        return f"Stock bajo de {self.producto_id} ({self.stock_actual}/{self.stock_minimo})"
+
+    class Meta:
+        verbose_name = "Notificación Pendiente"
+        verbose_name_plural = "Notificaciones Pendientes"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['enviado_en', 'id'], name='notificacion_pendiente_idx'),
+        ]
 
 class AuditLog(models.Model):
     """
@@ -157,4 +237,7 @@ class AuditLog(models.Model):
     class Meta:
         verbose_name = "Registro de Auditoría"
         verbose_name_plural = "Registros de Auditoría"
-        ordering = ['-fecha_hora']
\ No newline at end of file
+        ordering = ['-fecha_hora']
+        indexes = [
+            models.Index(fields=['fecha_hora', 'id'], name='auditlog_fecha_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,71 @@
+# bodega/notificaciones.py
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction, connection
+from django.utils import timezone
+
+from .models import NotificacionPendiente
+
+# ==============================================================================
+# Envío de Alertas de Stock Bajo (Bandeja de Salida)
+# ==============================================================================
+
+TAMANO_LOTE = 500
+
+def _destinatarios():
+    """Correos de los usuarios del grupo 'Administradores' (una sola consulta)."""
+    return list(
+        User.objects.filter(groups__name='Administradores', is_active=True)
+        .exclude(email='').values_list('email', flat=True).distinct()
+    )
+
+def _mensaje_resumen(alertas):
+    lineas = [
+        f"- {alerta.producto.nombre} (Código: {alerta.producto_id}): "
+        f"stock {alerta.stock_actual}, mínimo {alerta.stock_minimo}"
+        f" — registrado por {alerta.usuario_registra.username if alerta.usuario_registra else 'Sistema'}"
+        f" ({alerta.referencia or 'sin referencia'})"
+        for alerta in alertas
+    ]
+    return (
+        "Hola,\n\n"
+        "Los siguientes productos han caído por debajo del stock mínimo establecido:\n\n"
+        + "\n".join(lineas)
+        + "\n\nPor favor, revise el inventario.\n\n- Sistema de Bodega RMC\n"
+    )
+
+def enviar_notificaciones_pendientes(tamano_lote=TAMANO_LOTE):
+    """
+    Toma un lote de alertas pendientes, conserva solo la más reciente de cada
+    producto y envía un único correo resumen a cada administrador. Las filas
+    se bloquean con SKIP LOCKED (si la base lo soporta) para que varios
+    procesos puedan vaciar la bandeja a la vez; si el envío falla la
+    transacción se revierte y el lote queda pendiente para el próximo ciclo.
+    Devuelve la cantidad de alertas procesadas.
+    """
+    with transaction.atomic():
+        pendientes = NotificacionPendiente.objects.filter(enviado_en__isnull=True).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            pendientes = pendientes.select_for_update(skip_locked=True)
+        lote = list(pendientes.select_related('producto', 'usuario_registra')[:tamano_lote])
+        if not lote:
+            return 0
+
+        # Una sola alerta por producto: la más reciente refleja el stock actual
+        por_producto = {}
+        for alerta in lote:
+            por_producto[alerta.producto_id] = alerta
+        alertas = sorted(por_producto.values(), key=lambda alerta: alerta.producto.nombre)
+
+        destinatarios = _destinatarios()
+        if destinatarios:
+            remitente = getattr(settings, 'EMAIL_HOST_USER', None) or settings.DEFAULT_FROM_EMAIL
+            asunto = f"Alerta de Stock Bajo: {len(alertas)} producto(s)"
+            cuerpo = _mensaje_resumen(alertas)
+            mensajes = [EmailMessage(asunto, cuerpo, remitente, [correo]) for correo in destinatarios]
+            get_connection().send_messages(mensajes)
+
+        NotificacionPendiente.objects.filter(id__in=[alerta.id for alerta in lote]).update(enviado_en=timezone.now())
+        return len(lote)
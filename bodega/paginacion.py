@@ -0,0 +1,84 @@
+# bodega/paginacion.py
+
+import base64
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+# ==============================================================================
+# Paginación por Cursor (Keyset)
+# ==============================================================================
+# Para tablas que solo crecen (Kardex, auditoría) el Paginator de Django hace
+# un COUNT(*) completo y un OFFSET cada vez más profundo. Aquí cada página se
+# pide "a partir de" la última fila vista usando el par (fecha, id), que está
+# cubierto por un índice compuesto, así que el costo no depende de la página.
+
+class PaginaCursor:
+    """Resultado de una página: los objetos y los cursores para moverse."""
+    def __init__(self, objetos, hay_anterior, hay_siguiente, campo_fecha):
+        self.objetos = objetos
+        self.hay_anterior = hay_anterior
+        self.hay_siguiente = hay_siguiente
+        self.cursor_anterior = codificar_cursor(objetos[0], campo_fecha) if objetos and hay_anterior else None
+        self.cursor_siguiente = codificar_cursor(objetos[-1], campo_fecha) if objetos and hay_siguiente else None
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+def codificar_cursor(objeto, campo_fecha):
+    valor = f"{getattr(objeto, campo_fecha).isoformat()}|{objeto.pk}"
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    """
+    Devuelve (fecha, id) o None si el cursor no es válido. Un cursor editado a
+    mano sin zona horaria (o con ella si USE_TZ está apagado) también es
+    inválido: compararlo con las fechas de la base o del archivo fallaría.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, pk = base64.urlsafe_b64decode(cursor + relleno).decode().split('|')
+        fecha, pk = datetime.fromisoformat(fecha), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if (fecha.tzinfo is not None) != settings.USE_TZ:
+        return None
+    return fecha, pk
+
+def paginar_por_cursor(queryset, despues=None, antes=None, tamano=20, campo_fecha='fecha_hora', archivo=None):
+    """
+    Pagina `queryset` de más reciente a más antiguo por (campo_fecha, id).
+    `despues` pide la página siguiente (más antigua) a un cursor y `antes`
+    la anterior (más reciente). Sin cursores devuelve la primera página.
+
+    `archivo` (un `LectorArchivo`, ver bodega/archivo.py) continúa la
+    paginación en las filas archivadas, que siempre son más antiguas que las
+    de la base de datos; solo se lee cuando la página no se completa con ella.
+    """
+    posicion_despues = decodificar_cursor(despues) if despues else None
+    posicion_antes = decodificar_cursor(antes) if antes else None
+
+    if posicion_antes:
+        fecha, pk = posicion_antes
+        filas = list(islice(archivo.posteriores(posicion_antes), tamano + 1)) if archivo is not None else []
+        if len(filas) <= tamano:
+            filas += list(
+                queryset.filter(Q(**{f'{campo_fecha}__gt': fecha}) | Q(**{campo_fecha: fecha, 'pk__gt': pk}))
+                .order_by(campo_fecha, 'pk')[:tamano + 1 - len(filas)]
+            )
+        hay_anterior = len(filas) > tamano
+        objetos = list(reversed(filas[:tamano]))
+        return PaginaCursor(objetos, hay_anterior, True, campo_fecha)
+
+    if posicion_despues:
+        fecha, pk = posicion_despues
+        queryset = queryset.filter(Q(**{f'{campo_fecha}__lt': fecha}) | Q(**{campo_fecha: fecha, 'pk__lt': pk}))
+    filas = list(queryset.order_by(f'-{campo_fecha}', '-pk')[:tamano + 1])
+    if archivo is not None and len(filas) <= tamano:
+        filas += list(islice(archivo.anteriores(posicion_despues), tamano + 1 - len(filas)))
+    return PaginaCursor(filas[:tamano], bool(posicion_despues), len(filas) > tamano, campo_fecha)
@@ -0,0 +1,276 @@
+# bodega/pdfs.py
+
+import hashlib
+import logging
+import os
+import multiprocessing
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction, connection
+from django.db.models import Prefetch
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Despacho, DespachoItem, Recepcion, RecepcionItem
+from .pdfs_proceso import escribir_pdf
+from .middleware import copiar_contexto
+from .metricas import registro as metricas
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Caché Inmutable de Comprobantes PDF
+# ==============================================================================
+# Despachos y recepciones no se editan después de registrarse, así que su
+# PDF solo cambia si cambia la plantilla. Cada PDF se guarda en disco bajo
+# una clave derivada de (tipo, id, hash de la plantilla): editar la plantilla
+# genera claves nuevas y los archivos viejos simplemente dejan de usarse.
+# La misma clave sirve de ETag.
+
+DOCUMENTOS = {
+    'despacho': {
+        'modelo': Despacho,
+        'item': DespachoItem,
+        'plantilla': 'bodega/pdf/despacho_pdf.html',
+        'relacionados': ('area', 'usuario_registra'),
+        'campo_fecha': 'fecha_despacho',
+    },
+    'recepcion': {
+        'modelo': Recepcion,
+        'item': RecepcionItem,
+        'plantilla': 'bodega/pdf/recepcion_pdf.html',
+        'relacionados': ('proveedor', 'usuario_registra'),
+        'campo_fecha': 'fecha_recepcion',
+    },
+}
+
+_versiones_plantilla = {}
+
+def directorio_pdfs():
+    return Path(getattr(settings, 'BODEGA_PDF_CACHE_DIR', Path(settings.BASE_DIR) / 'cache_pdf'))
+
+def version_plantilla(tipo):
+    """Hash del código de la plantilla del documento (se calcula una vez por proceso)."""
+    if tipo not in _versiones_plantilla:
+        fuente = get_template(DOCUMENTOS[tipo]['plantilla']).template.source
+        _versiones_plantilla[tipo] = hashlib.sha256(fuente.encode('utf-8')).hexdigest()[:16]
+    return _versiones_plantilla[tipo]
+
+def clave_pdf(tipo, pk):
+    return hashlib.sha256(f"{tipo}:{pk}:{version_plantilla(tipo)}".encode()).hexdigest()
+
+def ruta_pdf(tipo, pk):
+    clave = clave_pdf(tipo, pk)
+    return directorio_pdfs() / clave[:2] / f"{clave}.pdf"
+
+def consulta_documentos(tipo):
+    """
+    Cabeceras con sus catálogos y sus líneas con productos (dos consultas).
+    También la usan las vistas de detalle, que recorren las mismas líneas.
+    """
+    config = DOCUMENTOS[tipo]
+    return config['modelo'].objects.select_related(*config['relacionados']).prefetch_related(
+        Prefetch('items', queryset=config['item'].objects.select_related('producto').order_by('id'))
+    )
+
+def _html_documento(tipo, documento):
+    return get_template(DOCUMENTOS[tipo]['plantilla']).render({tipo: documento})
+
+def guardar_archivo(ruta, contenido):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    # Escritura atómica: nunca se sirve un archivo a medio escribir
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+
+def renderizar_pdf(tipo, pk):
+    """
+    Renderiza el PDF del documento con todas sus líneas y productos en dos
+    consultas. Devuelve los bytes, o None si el documento no existe.
+    """
+    documento = consulta_documentos(tipo).filter(pk=pk).first()
+    if documento is None:
+        return None
+    pdf = escribir_pdf(_html_documento(tipo, documento))
+    metricas.incrementar('bodega_pdfs_renderizados_total', tipo=tipo)
+    return pdf
+
+def obtener_pdf(tipo, pk):
+    """
+    Devuelve la ruta del PDF en caché, renderizándolo si hace falta, o None
+    si el documento no existe.
+    """
+    ruta = ruta_pdf(tipo, pk)
+    if ruta.exists():
+        return ruta
+    pdf = renderizar_pdf(tipo, pk)
+    if pdf is None:
+        return None
+    guardar_archivo(ruta, pdf)
+    return ruta
+
+def descartar_pdf(tipo, pk):
+    """Elimina el PDF en caché (por ejemplo, si el documento se borra)."""
+    ruta_pdf(tipo, pk).unlink(missing_ok=True)
+
+# ==============================================================================
+# Precalentado
+# ==============================================================================
+# Al registrar un documento su PDF se genera en un hilo de fondo cuando la
+# transacción se confirma, así la primera descarga ya lo encuentra en disco.
+# Se desactiva con BODEGA_PDF_PRECALENTAR = False.
+
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bodega-pdf')
+
+def _precalentar(tipo, pk):
+    try:
+        obtener_pdf(tipo, pk)
+    except Exception:
+        logger.exception("No se pudo precalentar el PDF de %s #%s", tipo, pk)
+    finally:
+        connection.close()
+
+def precalentar_pdf(tipo, pk):
+    if getattr(settings, 'BODEGA_PDF_PRECALENTAR', True):
+        # El hilo del executor no hereda el contexto de la petición (usuario, auditoría)
+        transaction.on_commit(lambda: _ejecutor.submit(copiar_contexto(_precalentar), tipo, pk))
+
+def esperar_precalentado():
+    """Bloquea hasta que terminen los PDFs encolados hasta ahora."""
+    _ejecutor.submit(lambda: None).result()
+
+# ==============================================================================
+# Renderizado por Lotes
+# ==============================================================================
+# Para los cierres de mes se generan todos los comprobantes de un rango de
+# fechas. WeasyPrint usa un solo núcleo, así que el HTML se arma aquí (con
+# una consulta de cabeceras y otra de líneas por bloque) y la conversión a
+# PDF se reparte entre procesos. Los PDFs que ya están en caché no se vuelven
+# a generar y los nuevos quedan guardados para las descargas individuales.
+
+TAMANO_LOTE_PDF = 50
+
+def documentos_en_rango(tipo, desde=None, hasta=None):
+    """Ids de los documentos cuya fecha cae entre `desde` y `hasta` (fechas, ambas inclusive)."""
+    campo = DOCUMENTOS[tipo]['campo_fecha']
+    queryset = DOCUMENTOS[tipo]['modelo'].objects.all()
+    if desde is not None:
+        queryset = queryset.filter(**{f'{campo}__gte': timezone.make_aware(datetime.combine(desde, time.min))})
+    if hasta is not None:
+        queryset = queryset.filter(**{f'{campo}__lt': timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))})
+    return queryset.order_by('pk').values_list('pk', flat=True)
+
+def _procesos_por_defecto():
+    return getattr(settings, 'BODEGA_PDF_PROCESOS', None) or os.cpu_count() or 1
+
+# Las descargas por lote desde la web comparten un único pool por proceso,
+# creado la primera vez que se usa: arrancar procesos 'spawn' en cada
+# petición cuesta más que renderizar un lote pequeño, y un pool por petición
+# multiplicaría los procesos con cada descarga simultánea.
+_pool_procesos = None
+_pool_lock = threading.Lock()
+
+def _pool_compartido():
+    global _pool_procesos
+    with _pool_lock:
+        if _pool_procesos is None:
+            _pool_procesos = ProcessPoolExecutor(
+                max_workers=_procesos_por_defecto(), mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool_procesos
+
+def renderizar_lote(tipo, pks, procesos=None, tamano=TAMANO_LOTE_PDF, progreso=None):
+    """
+    Genera `(pk, ruta)` para cada documento de `pks`, en el mismo orden, con
+    el PDF ya guardado en la caché. Los ids que no existen se omiten.
+    `progreso(hechos, total)` se llama al terminar cada bloque.
+    Con `procesos` se usa un pool propio de ese tamaño (comandos de
+    gestión); sin él, el pool compartido del proceso.
+    """
+    if procesos is None:
+        yield from _renderizar_bloques(tipo, list(pks), _pool_compartido(), tamano, progreso)
+        return
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from _renderizar_bloques(tipo, list(pks), pool, tamano, progreso)
+
+def _renderizar_bloques(tipo, pks, pool, tamano, progreso):
+    total = len(pks)
+    hechos = 0
+    for inicio in range(0, total, tamano):
+        bloque = pks[inicio:inicio + tamano]
+        rutas = {pk: ruta_pdf(tipo, pk) for pk in bloque}
+        faltantes = [pk for pk, ruta in rutas.items() if not ruta.exists()]
+        pendientes = {}
+        if faltantes:
+            for documento in consulta_documentos(tipo).filter(pk__in=faltantes):
+                pendientes[documento.pk] = pool.submit(escribir_pdf, _html_documento(tipo, documento))
+        for pk in bloque:
+            if pk in pendientes:
+                guardar_archivo(rutas[pk], pendientes[pk].result())
+                metricas.incrementar('bodega_pdfs_renderizados_total', tipo=tipo)
+            elif pk in faltantes:
+                continue
+            yield pk, rutas[pk]
+        hechos += len(bloque)
+        if progreso is not None:
+            progreso(hechos, total)
+
+# ==============================================================================
+# Salida del Lote
+# ==============================================================================
+
+TAMANO_TROZO = 64 * 1024
+
+class _BufferZip:
+    """Destino de `zipfile` que acumula lo escrito hasta que se vacía."""
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+def generar_zip(tipo, documentos):
+    """
+    Empaqueta los `(pk, ruta)` de `renderizar_lote` en un ZIP que se entrega
+    por trozos, a medida que cada PDF termina de generarse. Los PDFs ya
+    vienen comprimidos, así que se guardan sin volver a comprimir.
+    """
+    buffer = _BufferZip()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for pk, ruta in documentos:
+            with open(ruta, 'rb') as origen, archivo_zip.open(f"{tipo}_{pk}.pdf", 'w') as destino:
+                while trozo := origen.read(TAMANO_TROZO):
+                    destino.write(trozo)
+                    yield buffer.vaciar()
+    yield buffer.vaciar()
+
+def unir_pdfs(documentos):
+    """
+    Une los `(pk, ruta)` de `renderizar_lote` en un único PDF y devuelve un
+    archivo temporal listo para enviarse. Requiere `pypdf`.
+    """
+    from pypdf import PdfWriter
+
+    escritor = PdfWriter()
+    for _pk, ruta in documentos:
+        escritor.append(str(ruta))
+    archivo = tempfile.TemporaryFile()
+    escritor.write(archivo)
+    archivo.seek(0)
+    return archivo
@@ -0,0 +1,29 @@
+# bodega/pdfs_proceso.py
+
+import io
+
+import qrcode
+import qrcode.image.svg
+from weasyprint import HTML
+
+# Este módulo se importa dentro de los procesos de los pools de renderizado
+# (ver `renderizar_lote` en bodega/pdfs.py y `hoja_etiquetas` en
+# bodega/etiquetas.py). Los procesos arrancan con 'spawn', sin Django
+# configurado, así que aquí no se importa nada de Django: reciben datos ya
+# preparados y devuelven bytes.
+
+def escribir_pdf(html_string):
+    return HTML(string=html_string).write_pdf()
+
+def generar_qr(contenido, formato):
+    """Imagen QR de `contenido` en 'png' o 'svg'."""
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(contenido)
+    qr.make(fit=True)
+    if formato == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
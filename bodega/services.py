@@ -0,0 +1,241 @@
+# bodega/services.py
+
+import random
+import time
+from collections import OrderedDict
+
+from django.db import transaction, OperationalError
+from django.db.models import F, Case, When, Value, IntegerField
+from django.db.models.functions import Now
+
+from .models import (
+    Producto, MovimientoInventario,
+    DespachoItem, RecepcionItem, NotificacionPendiente
+)
+from .cache import invalidar_dashboard, renovar_version, anotar_cambios_stock, VERSION_STOCK
+from .pdfs import precalentar_pdf
+from .difusion import publicar_stock
+from .metricas import contar_documento
+
+# ==============================================================================
+# Excepciones
+# ==============================================================================
+
+class StockInsuficienteError(Exception):
+    """
+    Se lanza cuando un despacho pide más unidades de las disponibles.
+    `faltantes` es un diccionario {codigo_producto: stock_disponible}.
+    """
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        detalle = ', '.join(f"{codigo} (disponible: {stock})" for codigo, stock in faltantes.items())
+        super().__init__(f"Stock insuficiente para: {detalle}")
+
+class ConflictoConcurrenciaError(Exception):
+    """
+    Se lanza cuando otro usuario o movimiento cambió la versión de un
+    producto mientras se editaba, o cuando se agotan los reintentos.
+    """
+    pass
+
+# ==============================================================================
+# Reintentos ante Conflictos
+# ==============================================================================
+
+MAX_INTENTOS = 4
+ESPERA_BASE_SEGUNDOS = 0.05
+
+# Códigos MySQL: 1213 = deadlock, 1205 = lock wait timeout.
+# SQLSTATE PostgreSQL: 40001 = serialization failure, 40P01 = deadlock.
+_CODIGOS_MYSQL_TRANSITORIOS = {1213, 1205}
+_SQLSTATE_TRANSITORIOS = {'40001', '40P01'}
+
+def _es_error_transitorio(error):
+    """Indica si un error de base de datos se resuelve reintentando la transacción."""
+    if isinstance(error, ConflictoConcurrenciaError):
+        return True
+    causa = error.__cause__ or error
+    if getattr(causa, 'pgcode', None) in _SQLSTATE_TRANSITORIOS:
+        return True
+    if causa.args and causa.args[0] in _CODIGOS_MYSQL_TRANSITORIOS:
+        return True
+    # SQLite no tiene bloqueo por fila: avisa con "database is locked"
+    return 'database is locked' in str(causa) or 'database table is locked' in str(causa)
+
+def ejecutar_con_reintentos(funcion, max_intentos=MAX_INTENTOS):
+    """
+    Ejecuta `funcion` (que debe abrir su propia transacción) y la reintenta
+    con espera exponencial ante deadlocks, fallos de serialización o
+    conflictos de versión. Dentro de una transacción externa no se
+    reintenta, porque la transacción que falló ya no es utilizable.
+    """
+    if transaction.get_connection().in_atomic_block:
+        return funcion()
+    for intento in range(1, max_intentos + 1):
+        try:
+            return funcion()
+        except (OperationalError, ConflictoConcurrenciaError) as e:
+            if not _es_error_transitorio(e):
+                raise
+            if intento == max_intentos:
+                raise ConflictoConcurrenciaError(
+                    f"No se pudo registrar el movimiento tras {max_intentos} intentos"
+                ) from e
+            time.sleep(ESPERA_BASE_SEGUNDOS * (2 ** (intento - 1)) * (1 + random.random()))
+
+# ==============================================================================
+# Motor de Contabilización de Stock
+# ==============================================================================
+
+def _agrupar_lineas(lineas):
+    """Suma las cantidades por producto conservando el orden de aparición."""
+    totales = OrderedDict()
+    for producto_id, cantidad in lineas:
+        totales[producto_id] = totales.get(producto_id, 0) + cantidad
+    return totales
+
+def _bloquear_productos(producto_ids):
+    """
+    Bloquea todas las filas de Producto afectadas en una sola consulta.
+    El orden por clave primaria es estable entre operarios, así dos
+    movimientos concurrentes nunca se bloquean en orden cruzado.
+    Devuelve {codigo_producto: (cantidad_stock, stock_minimo)}.
+    """
+    filas = (
+        Producto.objects.select_for_update()
+        .filter(pk__in=producto_ids)
+        .order_by('pk')
+        .values_list('pk', 'cantidad_stock', 'stock_minimo')
+    )
+    return {pk: (stock, minimo) for pk, stock, minimo in filas}
+
+def _aplicar_deltas(deltas):
+    """
+    Aplica todos los cambios de stock con un único UPDATE basado en F().
+    Las filas ya están bloqueadas, así que no hace falta comparar versiones;
+    la versión se incrementa para que los formularios de edición abiertos
+    antes del movimiento detecten el cambio.
+    """
+    casos = [When(pk=producto_id, then=Value(delta)) for producto_id, delta in deltas.items()]
+    Producto.objects.filter(pk__in=deltas).update(
+        cantidad_stock=F('cantidad_stock') + Case(*casos, default=Value(0), output_field=IntegerField()),
+        version=F('version') + 1,
+        actualizado_en=Now(),
+    )
+
+def _bloquear_y_validar(totales, signo):
+    """
+    Bloquea los productos afectados y, en salidas, verifica que alcance el
+    stock de todos antes de escribir nada. Devuelve el stock y el stock
+    mínimo de cada producto.
+    """
+    bloqueados = _bloquear_productos(list(totales))
+    stock_actual = {pk: stock for pk, (stock, _) in bloqueados.items()}
+    minimos = {pk: minimo for pk, (_, minimo) in bloqueados.items()}
+    inexistentes = set(totales) - set(bloqueados)
+    if inexistentes:
+        raise Producto.DoesNotExist(f"Productos inexistentes: {', '.join(sorted(inexistentes))}")
+    if signo < 0:
+        faltantes = {
+            producto_id: stock_actual.get(producto_id, 0)
+            for producto_id, cantidad in totales.items()
+            if stock_actual.get(producto_id, 0) < cantidad
+        }
+        if faltantes:
+            raise StockInsuficienteError(faltantes)
+    return stock_actual, minimos
+
+def _registrar_movimientos(lineas, totales, stock_actual, signo, tipo_movimiento, referencia):
+    """
+    Actualiza el stock y crea los movimientos del Kardex con saldos
+    encadenados (un producto puede aparecer en varias líneas).
+    Devuelve el stock final de cada producto afectado.
+    """
+    _aplicar_deltas({producto_id: signo * cantidad for producto_id, cantidad in totales.items()})
+
+    movimientos = []
+    for producto_id, cantidad in lineas:
+        stock_anterior = stock_actual[producto_id]
+        stock_actual[producto_id] = stock_anterior + signo * cantidad
+        movimientos.append(MovimientoInventario(
+            producto_id=producto_id, tipo_movimiento=tipo_movimiento, cantidad=signo * cantidad,
+            stock_anterior=stock_anterior, stock_nuevo=stock_actual[producto_id],
+            referencia=referencia
+        ))
+    MovimientoInventario.objects.bulk_create(movimientos)
+    invalidar_dashboard()
+    renovar_version(VERSION_STOCK)
+    anotar_cambios_stock(totales)
+    publicar_stock(totales)
+    return stock_actual
+
+def _encolar_alertas_stock_bajo(stock_final, minimos, despacho):
+    """
+    Escribe en la bandeja de salida (dentro de la misma transacción) una
+    alerta por cada producto que quedó en o bajo su stock mínimo. El envío
+    lo hace el comando `enviar_notificaciones`, fuera de la petición.
+    """
+    NotificacionPendiente.objects.bulk_create([
+        NotificacionPendiente(
+            producto_id=producto_id, stock_actual=stock, stock_minimo=minimos[producto_id],
+            usuario_registra=despacho.usuario_registra, referencia=f"Despacho ID: {despacho.id}"
+        )
+        for producto_id, stock in stock_final.items()
+        if minimos[producto_id] > 0 and stock <= minimos[producto_id]
+    ])
+
+def _nuevo_documento(documento):
+    """Deja la cabecera lista para insertarse de nuevo si un intento anterior falló."""
+    documento.pk = None
+    documento._state.adding = True
+
+def registrar_recepcion(recepcion, lineas):
+    """
+    Guarda una recepción y suma su stock.
+    `lineas` es una lista de tuplas (codigo_producto, cantidad).
+    """
+    totales = _agrupar_lineas(lineas)
+
+    def intento():
+        _nuevo_documento(recepcion)
+        with transaction.atomic():
+            stock_actual, _ = _bloquear_y_validar(totales, 1)
+            recepcion.save()
+            RecepcionItem.objects.bulk_create([
+                RecepcionItem(recepcion=recepcion, producto_id=producto_id, cantidad=cantidad)
+                for producto_id, cantidad in lineas
+            ])
+            stock_final = _registrar_movimientos(
+                lineas, totales, stock_actual, 1, 'Recepción', f"Recepción ID: {recepcion.id}"
+            )
+            precalentar_pdf('recepcion', recepcion.pk)
+            contar_documento('recepcion', len(lineas))
+            return stock_final
+
+    return ejecutar_con_reintentos(intento)
+
+def registrar_despacho(despacho, lineas):
+    """
+    Guarda un despacho y descuenta su stock. Lanza StockInsuficienteError
+    (sin dejar nada guardado) si alguna línea supera el stock disponible.
+    """
+    totales = _agrupar_lineas(lineas)
+
+    def intento():
+        _nuevo_documento(despacho)
+        with transaction.atomic():
+            stock_actual, minimos = _bloquear_y_validar(totales, -1)
+            despacho.save()
+            DespachoItem.objects.bulk_create([
+                DespachoItem(despacho=despacho, producto_id=producto_id, cantidad=cantidad)
+                for producto_id, cantidad in lineas
+            ])
+            stock_final = _registrar_movimientos(
+                lineas, totales, stock_actual, -1, 'Despacho', f"Despacho ID: {despacho.id}"
+            )
+            _encolar_alertas_stock_bajo(stock_final, minimos, despacho)
+            precalentar_pdf('despacho', despacho.pk)
+            contar_documento('despacho', len(lineas))
+            return stock_final
+
+    return ejecutar_con_reintentos(intento)
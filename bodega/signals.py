@@ -1,31 +1,63 @@
 # bodega/signals.py
 
-from django.db.models.signals import post_save, post_delete
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Producto, Proveedor, Rack, Area, AuditLog, Recepcion, Despacho # <-- Importa Recepcion y Despacho
+from .models import Producto, Proveedor, Rack, Area, Recepcion, Despacho, MovimientoInventario # <-- Importa Recepcion y Despacho
 from .middleware import get_current_user
+from .cache import invalidar_dashboard, renovar_version, VERSION_CATALOGO
+from .busqueda import indexar_producto
+from .pdfs import descartar_pdf
+from .difusion import publicar_stock
+from .instrumentacion import instalar_en_conexion
+from .auditoria import registrar_auditoria, capturar_estado, describir_cambios
 
-def log_audit_action(instance, action):
+def _detalle_documento(instance):
+    """
+    Describe una Recepción o Despacho sin cargar su proveedor/área: el
+    __str__ del modelo haría una consulta extra si la relación no está en caché.
+    """
+    if isinstance(instance, Despacho):
+        if Despacho.area.is_cached(instance):
+            return str(instance)
+        return f"Despacho #{instance.id} para área #{instance.area_id or 'N/A'}"
+    if Recepcion.proveedor.is_cached(instance):
+        return str(instance)
+    return f"Recepción #{instance.id} de proveedor #{instance.proveedor_id}"
+
+def log_audit_action(instance, action, cambios=None):
     """
     Función genérica para crear una entrada en el registro de auditoría.
+    La entrada se escribe en lote al confirmar la transacción (ver bodega/auditoria.py).
     """
     user = get_current_user()
     if user and user.is_authenticated:
         # Lógica para obtener un detalle más descriptivo para Recepciones y Despachos
-        detalle_str = str(instance)
         if isinstance(instance, (Recepcion, Despacho)):
-             # Usamos el __str__ del modelo que ya es descriptivo
-             detalle_str = str(instance)
+            detalle_str = _detalle_documento(instance)
         else:
-             detalle_str = f"Objeto: {str(instance)}"
+            detalle_str = f"Objeto: {str(instance)}"
+        if cambios:
+            detalle_str = f"{detalle_str}. Cambios: {cambios}"
+
+        registrar_auditoria(user, action, instance.__class__.__name__, detalle_str)
 
-        AuditLog.objects.create(
-            usuario=user,
-            accion=action,
-            modelo_afectado=instance.__class__.__name__,
-            detalle=detalle_str
-        )
+@receiver(pre_save, sender=Producto)
+@receiver(pre_save, sender=Proveedor)
+@receiver(pre_save, sender=Rack)
+@receiver(pre_save, sender=Area)
+@receiver(pre_save, sender=User)
+def snapshot_before_save(sender, instance, update_fields=None, **kwargs):
+    """
+    Guarda en la instancia los valores previos de los campos auditables para
+    que 'post_save' pueda registrar solo lo que realmente cambió.
+    """
+    user = get_current_user()
+    if not (user and user.is_authenticated):
+        instance._auditoria_antes = None
+        return
+    instance._auditoria_antes = capturar_estado(instance, update_fields)
 
 # Aplicamos los decoradores a todos los modelos que queremos auditar
 @receiver(post_save, sender=Producto)
@@ -48,7 +80,11 @@ def log_save_action(sender, instance, created, **kwargs):
         if created:
             log_audit_action(instance, "CREADO")
         else:
-            log_audit_action(instance, "MODIFICADO")
+            # Solo si cambió algún campo relevante (no last_login, stock, etc.)
+            antes = getattr(instance, '_auditoria_antes', None)
+            cambios = describir_cambios(antes, instance) if antes else ''
+            if cambios:
+                log_audit_action(instance, "MODIFICADO", cambios)
 
 
 @receiver(post_delete, sender=Producto)
@@ -61,4 +97,68 @@ def log_delete_action(sender, instance, **kwargs):
     """
     Escucha la señal 'post_delete' para los modelos especificados.
     """
-    log_audit_action(instance, "ELIMINADO")
\ No newline at end of file
+    log_audit_action(instance, "ELIMINADO")
+
+
+# --- Invalidación de la caché del dashboard ---
+# El servicio de stock usa update()/bulk_create(), que no disparan señales,
+# así que también invalida por su cuenta (ver bodega/services.py).
+@receiver(post_save, sender=Producto)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_save, sender=MovimientoInventario)
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_delete, sender=MovimientoInventario)
+def invalidar_cache_dashboard(sender, **kwargs):
+    """Descarta los agregados del dashboard cuando cambia el catálogo o el stock."""
+    invalidar_dashboard()
+
+
+# --- Índice de búsqueda de productos ---
+# Los tokens se borran en cascada al eliminar el producto.
+# Solo se reindexa si pudo cambiar el nombre: el código es la clave primaria
+# (cambiarlo crea otro producto). La foto previa de la auditoría dice si el
+# nombre cambió; sin ella (guardados sin usuario) se reindexa por si acaso.
+@receiver(post_save, sender=Producto)
+def indexar_producto_busqueda(sender, instance, created, update_fields=None, **kwargs):
+    """Mantiene al día los tokens de búsqueda del producto guardado."""
+    if not created:
+        if update_fields is not None and 'nombre' not in update_fields:
+            return
+        antes = getattr(instance, '_auditoria_antes', None)
+        if antes is not None and 'nombre' in antes and antes['nombre'] == instance.nombre:
+            return
+    indexar_producto(instance)
+
+
+# --- Versión del catálogo (índice de autocompletado de cada worker) ---
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def renovar_version_catalogo(sender, **kwargs):
+    """Obliga a los workers a reconstruir su índice de autocompletado."""
+    renovar_version(VERSION_CATALOGO)
+
+
+# --- Caché de comprobantes PDF ---
+@receiver(post_delete, sender=Despacho)
+@receiver(post_delete, sender=Recepcion)
+def descartar_pdf_documento(sender, instance, **kwargs):
+    """Evita seguir sirviendo el PDF de un documento eliminado."""
+    descartar_pdf(sender._meta.model_name, instance.pk)
+
+
+# --- Stock en vivo ---
+# El servicio de stock crea los movimientos con bulk_create y publica por su
+# cuenta (ver bodega/services.py); esto cubre los creados uno a uno.
+@receiver(post_save, sender=MovimientoInventario)
+def difundir_movimiento(sender, instance, created, **kwargs):
+    """Avisa a las tablets suscritas del nuevo stock del producto."""
+    if created:
+        publicar_stock([instance.producto_id])
+
+
+# --- Instrumentación SQL ---
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    """Instala el wrapper que mide las consultas de las peticiones muestreadas."""
+    instalar_en_conexion(connection)
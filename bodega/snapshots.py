@@ -0,0 +1,164 @@
+# bodega/snapshots.py
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import (
+    OuterRef, Subquery, Sum, Max, Case, When, Value, F,
+    IntegerField
+)
+from django.db.models.functions import Coalesce
+
+from .models import Producto, MovimientoInventario, StockSnapshotDiario
+
+# ==============================================================================
+# Consolidación Diaria
+# ==============================================================================
+
+def ultimo_dia_consolidado():
+    """
+    Devuelve la fecha más reciente con snapshots, o None si no hay ninguno.
+    Como solo se guardan días con movimientos, los días posteriores a esta
+    fecha se resuelven siempre desde el Kardex, estén consolidados o no.
+    """
+    return StockSnapshotDiario.objects.aggregate(ultimo=Max('fecha'))['ultimo']
+
+def consolidar_dia(fecha):
+    """
+    Calcula (o recalcula) los snapshots de todos los productos que tuvieron
+    movimientos en `fecha`. Devuelve la cantidad de snapshots escritos.
+    """
+    resumen = (
+        MovimientoInventario.objects.filter(fecha_hora__date=fecha)
+        .order_by()
+        .values('producto_id')
+        .annotate(
+            entradas=Coalesce(Sum(Case(When(cantidad__gt=0, then=F('cantidad')), output_field=IntegerField())), 0),
+            salidas=Coalesce(Sum(Case(When(cantidad__lt=0, then=-F('cantidad')), output_field=IntegerField())), 0),
+            ultimo_id=Max('id'),
+        )
+    )
+    resumen = list(resumen)
+    # El stock de cierre es el saldo del último movimiento del día
+    cierres = dict(
+        MovimientoInventario.objects.filter(id__in=[fila['ultimo_id'] for fila in resumen])
+        .values_list('id', 'stock_nuevo')
+    )
+    snapshots = [
+        StockSnapshotDiario(
+            producto_id=fila['producto_id'], fecha=fecha, stock_cierre=cierres[fila['ultimo_id']],
+            total_entradas=fila['entradas'], total_salidas=fila['salidas']
+        )
+        for fila in resumen
+    ]
+    with transaction.atomic():
+        StockSnapshotDiario.objects.filter(fecha=fecha).delete()
+        StockSnapshotDiario.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+def dias_pendientes(hasta, desde=None):
+    """
+    Días a consolidar hasta `hasta` inclusive. Sin `desde`, continúa después
+    del último día consolidado (o desde el primer movimiento registrado).
+    """
+    if desde is None:
+        ultimo = ultimo_dia_consolidado()
+        if ultimo is not None:
+            desde = ultimo + timedelta(days=1)
+        else:
+            primero = MovimientoInventario.objects.order_by('fecha_hora').values_list('fecha_hora', flat=True).first()
+            if primero is None:
+                return []
+            desde = primero.date()
+    return [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+
+# ==============================================================================
+# Consultas Históricas
+# ==============================================================================
+
+def productos_con_stock_a_fecha(fecha):
+    """
+    Anota en cada Producto el campo `stock_a_fecha` con su stock al cierre de
+    `fecha`, en una sola consulta:
+      * el último snapshot hasta `fecha` (o hasta el último día consolidado),
+      * más los movimientos de los días aún no consolidados,
+      * o, si no hay snapshot previo, el saldo anterior a su primer
+        movimiento (o el stock actual si nunca se movió).
+    """
+    consolidado_hasta = ultimo_dia_consolidado()
+    corte = min(fecha, consolidado_hasta) if consolidado_hasta else None
+
+    snapshot = StockSnapshotDiario.objects.filter(producto=OuterRef('pk'))
+    if corte is not None:
+        snapshot = snapshot.filter(fecha__lte=corte)
+    else:
+        snapshot = snapshot.none()
+    primer_movimiento = MovimientoInventario.objects.filter(producto=OuterRef('pk')).order_by('id')
+
+    delta = MovimientoInventario.objects.filter(producto=OuterRef('pk'), fecha_hora__date__lte=fecha)
+    if corte is not None:
+        delta = delta.filter(fecha_hora__date__gt=corte)
+    delta = delta.order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+
+    return Producto.objects.annotate(
+        stock_a_fecha=Coalesce(
+            Subquery(snapshot.order_by('-fecha').values('stock_cierre')[:1]),
+            Subquery(primer_movimiento.values('stock_anterior')[:1]),
+            F('cantidad_stock'),
+        ) + Coalesce(Subquery(delta, output_field=IntegerField()), Value(0)),
+    )
+
+def _consultas_movimientos_por_dia(desde, hasta, producto, consolidado_hasta):
+    """
+    Consultas que cubren el rango: snapshots para los días consolidados y el
+    Kardex agregado para el resto. Cualquiera de las dos puede ser None.
+    """
+    snapshots = resumen = None
+    if consolidado_hasta and desde <= consolidado_hasta:
+        snapshots = StockSnapshotDiario.objects.filter(fecha__gte=desde, fecha__lte=min(hasta, consolidado_hasta))
+        if producto is not None:
+            snapshots = snapshots.filter(producto=producto)
+        snapshots = snapshots.order_by().values('fecha').annotate(entradas=Sum('total_entradas'), salidas=Sum('total_salidas'))
+
+    if not consolidado_hasta or hasta > consolidado_hasta:
+        inicio_vivo = max(desde, consolidado_hasta + timedelta(days=1)) if consolidado_hasta else desde
+        movimientos = MovimientoInventario.objects.filter(fecha_hora__date__gte=inicio_vivo, fecha_hora__date__lte=hasta)
+        if producto is not None:
+            movimientos = movimientos.filter(producto=producto)
+        resumen = (
+            movimientos.order_by()
+            .values('fecha_hora__date')
+            .annotate(
+                entradas=Coalesce(Sum(Case(When(cantidad__gt=0, then=F('cantidad')), output_field=IntegerField())), 0),
+                salidas=Coalesce(Sum(Case(When(cantidad__lt=0, then=-F('cantidad')), output_field=IntegerField())), 0),
+            )
+        )
+    return snapshots, resumen
+
+def _combinar_dias(filas_snapshots, filas_kardex):
+    dias = {}
+    for fila in filas_snapshots:
+        dias[fila['fecha']] = {'fecha': fila['fecha'], 'entradas': fila['entradas'], 'salidas': fila['salidas']}
+    for fila in filas_kardex:
+        dias[fila['fecha_hora__date']] = {
+            'fecha': fila['fecha_hora__date'], 'entradas': fila['entradas'], 'salidas': fila['salidas']
+        }
+    return [dias[fecha] for fecha in sorted(dias)]
+
+def movimientos_por_dia(desde, hasta, producto=None):
+    """
+    Devuelve [{fecha, entradas, salidas}] por día entre `desde` y `hasta`
+    (inclusive). Los días consolidados se leen de los snapshots y el resto se
+    agrega directamente desde el Kardex.
+    """
+    snapshots, resumen = _consultas_movimientos_por_dia(desde, hasta, producto, ultimo_dia_consolidado())
+    return _combinar_dias(snapshots if snapshots is not None else [], resumen if resumen is not None else [])
+
+async def amovimientos_por_dia(desde, hasta, producto=None):
+    """Versión asíncrona de `movimientos_por_dia` (ORM asíncrono)."""
+    consolidado_hasta = (await StockSnapshotDiario.objects.aaggregate(ultimo=Max('fecha')))['ultimo']
+    snapshots, resumen = _consultas_movimientos_por_dia(desde, hasta, producto, consolidado_hasta)
+    return _combinar_dias(
+        [fila async for fila in snapshots] if snapshots is not None else [],
+        [fila async for fila in resumen] if resumen is not None else [],
+    )
@@ -28,10 +28,61 @@ class PruebasModelos(TestCase):
         self.assertEqual(nombre_obtenido, nombre_esperado)
         # bodega/tests.py
 
-from django.test import TestCase
-from django.contrib.auth.models import User
-from django.urls import reverse
-from .models import Proveedor, Producto, Area, Despacho, MovimientoInventario
+import base64
+import io
+import json
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command, CommandError
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.auth.signals import user_logged_in
+from django.core import mail
+from openpyxl import load_workbook
+from django.urls import include, path, reverse
+from django.shortcuts import render
+from .models import (
+    Proveedor, Producto, Rack, Area, Despacho, DespachoItem, Recepcion, MovimientoInventario,
+    StockSnapshotDiario, NotificacionPendiente, AuditLog
+)
+from .services import (
+    registrar_despacho, registrar_recepcion, ejecutar_con_reintentos,
+    StockInsuficienteError, ConflictoConcurrenciaError
+)
+from .forms import ProductoForm
+from .exports import iterar_en_bloques, RespuestaStreaming, TAMANO_SALTO_ASGI
+from .instrumentacion import huella_sql
+from .metricas import Registro
+from .cache import consultar_stock, aconsultar_stock, acalcular_widgets_dashboard, calcular_widgets_dashboard, SECUENCIA_STOCK
+from .difusion import obtener_difusor
+from .snapshots import productos_con_stock_a_fecha, movimientos_por_dia
+from .paginacion import paginar_por_cursor, decodificar_cursor
+from .etiquetas import directorio_qr, ruta_qr, obtener_qrs, hoja_etiquetas, productos_para_etiquetas
+from .pdfs import directorio_pdfs, renderizar_pdf, ruta_pdf, esperar_precalentado, renderizar_lote
+from .archivo import lector_kardex, lector_auditoria, directorio_archivo, cubeta_kardex, TIPO_SALDO_INICIAL
+from .busqueda import buscar_productos
+from .autocompletado import IndiceAutocompletado
+from .auditoria import auditoria_en_lote, _escritor_asincrono
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+from . import middleware
+from . import pdfs
+from .management.commands.benchmark_vistas import comparar_con_base
+from .datos_sinteticos import GeneradorDatos, finalizar_carga
+from . import urls as urls_bodega
 
 # ... (clase PruebasModelos que ya escribimos) ...
 
@@ -44,6 +95,7 @@ class PruebasLogicaDespacho(TestCase):
         Es perfecto para crear los objetos que necesitaremos en varias pruebas.
         """
         self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user.user_permissions.add(Permission.objects.get(codename='add_despacho'))
         self.area = Area.objects.create(nombre='Area de Prueba')
         self.producto = Producto.objects.create(
             codigo_producto='PROD01',
@@ -82,4 +134,1519 @@ class PruebasLogicaDespacho(TestCase):
         self.assertContains(response, 'Stock insuficiente')
         # 3. La verificación más importante: que el stock del producto NO haya cambiado
         self.producto.refresh_from_db() # Recargamos el objeto desde la BD
-        self.assertEqual(self.producto.cantidad_stock, 10)
\ No newline at end of file
+        self.assertEqual(self.producto.cantidad_stock, 10)
+
+    def test_despacho_descuenta_stock_y_registra_kardex(self):
+        """
+        Verifica que un despacho válido descuenta el stock y deja una línea
+        en el Kardex por cada ítem, con los saldos encadenados.
+        """
+        self.client.login(username='testuser', password='password123')
+        datos_formulario = {
+            'usuario_solicitante': 'Usuario Test',
+            'area': self.area.id,
+            'motivo': 'Test de stock',
+            'items-TOTAL_FORMS': '2',
+            'items-INITIAL_FORMS': '0',
+            'items-0-producto': self.producto.pk,
+            'items-0-cantidad': '3',
+            'items-1-producto': self.producto.pk,
+            'items-1-cantidad': '4',
+        }
+        response = self.client.post(reverse('agregar_despacho'), datos_formulario)
+
+        self.assertRedirects(response, reverse('lista_stock'), fetch_redirect_response=False)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad_stock, 3)
+        saldos = list(
+            MovimientoInventario.objects.filter(producto=self.producto)
+            .order_by('id').values_list('stock_anterior', 'stock_nuevo')
+        )
+        self.assertEqual(saldos, [(10, 7), (7, 3)])
+
+
+class PruebasServicioStock(TestCase):
+
+    def setUp(self):
+        self.area = Area.objects.create(nombre='Area de Prueba')
+        self.proveedor = Proveedor.objects.create(nombre='Proveedor de Prueba')
+        self.producto_a = Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=5)
+        self.producto_b = Producto.objects.create(codigo_producto='B', nombre='Producto B', cantidad_stock=1)
+
+    def test_recepcion_suma_stock(self):
+        recepcion = Recepcion(proveedor=self.proveedor)
+        stock_final = registrar_recepcion(recepcion, [('A', 2), ('B', 3)])
+
+        self.assertEqual(stock_final, {'A': 7, 'B': 4})
+        self.assertEqual(recepcion.items.count(), 2)
+        self.producto_a.refresh_from_db()
+        self.assertEqual(self.producto_a.cantidad_stock, 7)
+
+    def test_despacho_sin_stock_no_guarda_nada(self):
+        """Si una sola línea no alcanza, no se guarda ninguna."""
+        with self.assertRaises(StockInsuficienteError) as ctx:
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 1), ('B', 2)])
+
+        self.assertEqual(ctx.exception.faltantes, {'B': 1})
+        self.assertFalse(Despacho.objects.exists())
+        self.assertFalse(MovimientoInventario.objects.exists())
+        self.producto_a.refresh_from_db()
+        self.assertEqual(self.producto_a.cantidad_stock, 5)
+
+    def test_despacho_usa_consultas_constantes(self):
+        """El número de consultas no depende del número de líneas."""
+        with self.assertNumQueries(7):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 1), ('B', 1)])
+        with self.assertNumQueries(7):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 1)] * 3)
+
+    def test_edicion_con_version_desactualizada_es_rechazada(self):
+        """Un formulario abierto antes de un despacho no pisa el stock nuevo."""
+        datos = {
+            'codigo_producto': 'A', 'nombre': 'Producto A', 'cantidad_stock': 5,
+            'stock_minimo': 0, 'version': self.producto_a.version,
+        }
+        registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 2)])
+        self.producto_a.refresh_from_db()
+
+        form = ProductoForm(datos, instance=self.producto_a)
+        self.assertTrue(form.is_valid())
+        with self.assertRaises(ConflictoConcurrenciaError):
+            form.save()
+        self.producto_a.refresh_from_db()
+        self.assertEqual(self.producto_a.cantidad_stock, 3)
+
+    def test_edicion_con_version_vigente_incrementa_la_version(self):
+        version = self.producto_a.version
+        datos = {
+            'codigo_producto': 'A', 'nombre': 'Producto A', 'cantidad_stock': 8,
+            'stock_minimo': 0, 'version': version,
+        }
+        form = ProductoForm(datos, instance=self.producto_a)
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.producto_a.refresh_from_db()
+        self.assertEqual((self.producto_a.cantidad_stock, self.producto_a.version), (8, version + 1))
+
+    def test_vista_muestra_el_producto_vigente_tras_un_conflicto(self):
+        usuario = User.objects.create_superuser(username='editor', password='password123')
+        self.client.force_login(usuario)
+        version = self.producto_a.version
+        registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 2)])
+
+        response = self.client.post(reverse('editar_producto', args=['A']), {
+            'codigo_producto': 'A', 'nombre': 'Producto A', 'cantidad_stock': 5,
+            'stock_minimo': 0, 'version': version,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['conflicto'])
+        self.producto_a.refresh_from_db()
+        self.assertEqual(response.context['form']['cantidad_stock'].value(), 3)
+        self.assertEqual(response.context['form']['version'].value(), self.producto_a.version)
+
+
+@override_settings(BODEGA_PDF_PRECALENTAR=False)
+class PruebasConcurrenciaStock(TransactionTestCase):
+    """
+    Lanza movimientos simultáneos desde varios hilos (cada uno con su propia
+    conexión) y verifica que no se pierda ninguna actualización de stock.
+    SQLite no tiene bloqueo por fila: ahí los hilos abren sus transacciones
+    con BEGIN IMMEDIATE, esperan su turno (`timeout`) y, si se agota, fallan
+    con "database is locked" y se reintentan (`ejecutar_con_reintentos`).
+    Las pruebas de reintentos no usan la base.
+    """
+    NUM_HILOS = 8
+    MOVIMIENTOS_POR_HILO = 5
+
+    def setUp(self):
+        self.area = Area.objects.create(nombre='Area de Prueba')
+        self.proveedor = Proveedor.objects.create(nombre='Proveedor de Prueba')
+        self.stock_inicial = {'A': 1000, 'B': 1000, 'C': 1000}
+        for codigo, stock in self.stock_inicial.items():
+            Producto.objects.create(codigo_producto=codigo, nombre=f'Producto {codigo}', cantidad_stock=stock)
+
+    def _trabajador(self, numero, errores):
+        try:
+            for i in range(self.MOVIMIENTOS_POR_HILO):
+                # Órdenes de línea distintos entre hilos para provocar cruces de bloqueo
+                lineas = [('A', 2), ('B', 1), ('C', 3)] if numero % 2 else [('C', 1), ('A', 1), ('B', 2)]
+                if (numero + i) % 3:
+                    registrar_despacho(Despacho(area=self.area, usuario_solicitante=f'Hilo {numero}'), lineas)
+                else:
+                    registrar_recepcion(Recepcion(proveedor=self.proveedor), lineas)
+        except Exception as e:
+            errores.append(e)
+        finally:
+            connection.close()
+
+    def test_stock_final_coincide_con_kardex(self):
+        if connection.vendor == 'sqlite':
+            # Las conexiones de los hilos se crean con estas opciones
+            opciones = mock.patch.dict(connection.settings_dict['OPTIONS'], {'transaction_mode': 'IMMEDIATE', 'timeout': 20})
+            opciones.start()
+            self.addCleanup(opciones.stop)
+        errores = []
+        hilos = [
+            threading.Thread(target=self._trabajador, args=(numero, errores))
+            for numero in range(self.NUM_HILOS)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(
+            Despacho.objects.count() + Recepcion.objects.count(),
+            self.NUM_HILOS * self.MOVIMIENTOS_POR_HILO
+        )
+        for producto in Producto.objects.all():
+            movimientos = MovimientoInventario.objects.filter(producto=producto)
+            suma_kardex = movimientos.aggregate(total=Sum('cantidad'))['total']
+            self.assertEqual(producto.cantidad_stock, self.stock_inicial[producto.pk] + suma_kardex)
+            # Los saldos del Kardex deben encadenarse sin huecos ni duplicados
+            saldos = list(movimientos.order_by('id').values_list('stock_anterior', 'stock_nuevo'))
+            self.assertEqual(saldos[0][0], self.stock_inicial[producto.pk])
+            for (_, nuevo), (anterior, _) in zip(saldos, saldos[1:]):
+                self.assertEqual(nuevo, anterior)
+            self.assertEqual(saldos[-1][1], producto.cantidad_stock)
+
+    def test_reintenta_conflictos_transitorios(self):
+        intentos = []
+
+        def operacion():
+            intentos.append(1)
+            if len(intentos) < 3:
+                raise ConflictoConcurrenciaError()
+            return 'ok'
+
+        self.assertEqual(ejecutar_con_reintentos(operacion), 'ok')
+        self.assertEqual(len(intentos), 3)
+
+    def test_agota_reintentos(self):
+        def operacion():
+            raise ConflictoConcurrenciaError()
+
+        with self.assertRaises(ConflictoConcurrenciaError):
+            ejecutar_con_reintentos(operacion, max_intentos=2)
+
+
+class PruebasExportaciones(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        proveedor = Proveedor.objects.create(nombre='Proveedor Ñandú')
+        for i in range(5):
+            Producto.objects.create(
+                codigo_producto=f'P{i:02d}', nombre=f'Producto {i}', cantidad_stock=i,
+                proveedor=proveedor if i % 2 else None
+            )
+
+    def test_exportar_stock_csv_en_streaming(self):
+        response = self.client.get(reverse('exportar_stock_excel'), {'format': 'csv'})
+
+        self.assertTrue(response.streaming)
+        lineas = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lineas), 6)
+        self.assertEqual(lineas[2], 'P01,Producto 1,1,0,N/A,Proveedor Ñandú,,')
+
+    def test_exportar_stock_ndjson(self):
+        response = self.client.get(reverse('exportar_stock_excel'), {'format': 'ndjson'})
+
+        filas = [json.loads(linea) for linea in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(filas[0]['codigo_producto'], 'P00')
+        self.assertEqual(filas[0]['proveedor'], 'N/A')
+
+    def test_exportar_stock_xlsx(self):
+        response = self.client.get(reverse('exportar_stock_excel'))
+
+        libro = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(libro['Inventario'].max_row, 6)
+
+    def test_bajo_asgi_la_descarga_se_envia_sin_acumularla(self):
+        """Django haría sync_to_async(list): aquí el primer trozo sale antes de generar el resto."""
+        generados = []
+
+        def contenido():
+            for i in range(3):
+                generados.append(i)
+                yield b'x' * TAMANO_SALTO_ASGI
+
+        async def primer_trozo():
+            partes = aiter(RespuestaStreaming(contenido()))
+            try:
+                return await anext(partes)
+            finally:
+                await partes.aclose()
+
+        self.assertEqual(len(asyncio.run(primer_trozo())), TAMANO_SALTO_ASGI)
+        self.assertEqual(generados, [0])
+
+    def test_formato_invalido(self):
+        response = self.client.get(reverse('exportar_stock_excel'), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_lectura_por_bloques_no_depende_de_relaciones(self):
+        """Un JOIN por bloque: 5 filas en bloques de 2 son 3 consultas."""
+        with self.assertNumQueries(3):
+            filas = list(iterar_en_bloques(Producto.objects.all(), ['codigo_producto', 'proveedor__nombre'], tamano=2))
+        self.assertEqual(len(filas), 5)
+
+    def test_exportar_despachos_aplana_lineas_y_filtra_fechas(self):
+        area = Area.objects.create(nombre='Bodega Central')
+        registrar_despacho(Despacho(area=area, usuario_solicitante='Ana'), [('P01', 1), ('P02', 2)])
+        antiguo = Despacho(area=area, usuario_solicitante='Luis')
+        registrar_despacho(antiguo, [('P03', 1)])
+        Despacho.objects.filter(pk=antiguo.pk).update(fecha_despacho=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+
+        hoy = timezone.now().strftime('%Y-%m-%d')
+        response = self.client.get(
+            reverse('exportar_despachos'), {'format': 'ndjson', 'start_date': hoy, 'end_date': hoy}
+        )
+
+        filas = [json.loads(linea) for linea in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([fila['codigo_producto'] for fila in filas], ['P01', 'P02'])
+        self.assertEqual(filas[0]['area'], 'Bodega Central')
+        self.assertEqual(filas[1]['cantidad'], 2)
+
+    def test_exportar_historial_producto_csv(self):
+        registrar_recepcion(Recepcion(proveedor=Proveedor.objects.get()), [('P01', 4)])
+
+        response = self.client.get(reverse('exportar_historial_producto', args=['P01']), {'format': 'csv'})
+
+        lineas = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertIn('Recepción,4,1,5', lineas[1])
+
+
+class PruebasCacheDashboard(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        self.area = Area.objects.create(nombre='Area de Prueba')
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10, stock_minimo=5)
+
+    def test_widgets_se_calculan_una_vez(self):
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.context['num_productos'], 1)
+        self.assertFalse(any('COUNT' in q['sql'] for q in consultas.captured_queries))
+
+    def test_despacho_invalida_widgets(self):
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 6)])
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['productos_stock_bajo_count'], 1)
+        self.assertEqual(response.context['chart_data'], [4])
+        self.assertEqual(len(response.context['ultimos_movimientos']), 1)
+
+
+class PruebasSnapshotsStock(TestCase):
+
+    def setUp(self):
+        self.area = Area.objects.create(nombre='Area de Prueba')
+        self.proveedor = Proveedor.objects.create(nombre='Proveedor de Prueba')
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10)
+        Producto.objects.create(codigo_producto='B', nombre='Producto B', cantidad_stock=7)
+        self.dias = [date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 4)]
+        # Día 1: +5 A | Día 2: -3 A, -2 A | Día 4: -8 A
+        self._mover(self.dias[0], registrar_recepcion, Recepcion(proveedor=self.proveedor), [('A', 5)])
+        self._mover(self.dias[1], registrar_despacho, Despacho(area=self.area, usuario_solicitante='X'), [('A', 3), ('A', 2)])
+        self._mover(self.dias[2], registrar_despacho, Despacho(area=self.area, usuario_solicitante='X'), [('A', 8)])
+
+    def _mover(self, dia, registrar, documento, lineas):
+        registrar(documento, lineas)
+        tipo = 'Recepción' if isinstance(documento, Recepcion) else 'Despacho'
+        MovimientoInventario.objects.filter(referencia=f"{tipo} ID: {documento.pk}").update(
+            fecha_hora=datetime(dia.year, dia.month, dia.day, 12, tzinfo=dt_timezone.utc)
+        )
+
+    def _stock(self, dia):
+        return dict(productos_con_stock_a_fecha(dia).values_list('codigo_producto', 'stock_a_fecha'))
+
+    def test_stock_a_fecha_coincide_con_o_sin_consolidar(self):
+        esperado = {
+            date(2025, 2, 28): {'A': 10, 'B': 7},
+            date(2025, 3, 1): {'A': 15, 'B': 7},
+            date(2025, 3, 3): {'A': 10, 'B': 7},
+            date(2025, 3, 4): {'A': 2, 'B': 7},
+        }
+        for dia, stock in esperado.items():
+            self.assertEqual(self._stock(dia), stock)
+
+        call_command('consolidar_stock_diario', '--hasta', '2025-03-02', stdout=io.StringIO())
+
+        self.assertEqual(StockSnapshotDiario.objects.count(), 2)
+        for dia, stock in esperado.items():
+            self.assertEqual(self._stock(dia), stock)
+
+    def test_consolidacion_incremental(self):
+        call_command('consolidar_stock_diario', '--hasta', '2025-03-02', stdout=io.StringIO())
+        call_command('consolidar_stock_diario', '--hasta', '2025-03-05', stdout=io.StringIO())
+
+        snapshot = StockSnapshotDiario.objects.get(producto='A', fecha=date(2025, 3, 2))
+        self.assertEqual((snapshot.stock_cierre, snapshot.total_entradas, snapshot.total_salidas), (10, 0, 5))
+        self.assertEqual(
+            list(StockSnapshotDiario.objects.order_by('fecha').values_list('fecha', flat=True)), self.dias
+        )
+
+    def test_movimientos_por_dia_mezcla_snapshots_y_kardex(self):
+        call_command('consolidar_stock_diario', '--hasta', '2025-03-02', stdout=io.StringIO())
+
+        dias = movimientos_por_dia(date(2025, 3, 1), date(2025, 3, 31), producto='A')
+
+        self.assertEqual(
+            [(dia['fecha'], dia['entradas'], dia['salidas']) for dia in dias],
+            [(self.dias[0], 5, 0), (self.dias[1], 0, 5), (self.dias[2], 0, 8)]
+        )
+
+
+class PruebasPaginacionCursor(TestCase):
+
+    def setUp(self):
+        self.producto = Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=0)
+        base = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        # Varias filas comparten fecha_hora para probar el desempate por id
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                producto=self.producto, tipo_movimiento='Ajuste', cantidad=1,
+                stock_anterior=i, stock_nuevo=i + 1
+            )
+            for i in range(45)
+        ])
+        for movimiento in MovimientoInventario.objects.all():
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(
+                fecha_hora=base + timedelta(minutes=movimiento.pk // 3)
+            )
+        self.orden_esperado = list(
+            MovimientoInventario.objects.order_by('-fecha_hora', '-id').values_list('id', flat=True)
+        )
+
+    def test_recorre_todas_las_paginas_en_ambos_sentidos(self):
+        queryset = MovimientoInventario.objects.filter(producto=self.producto)
+        paginas = [paginar_por_cursor(queryset, tamano=20)]
+        while paginas[-1].hay_siguiente:
+            paginas.append(paginar_por_cursor(queryset, despues=paginas[-1].cursor_siguiente, tamano=20))
+
+        self.assertEqual([len(p) for p in paginas], [20, 20, 5])
+        self.assertEqual([m.id for p in paginas for m in p], self.orden_esperado)
+        self.assertFalse(paginas[0].hay_anterior)
+
+        anterior = paginar_por_cursor(queryset, antes=paginas[2].cursor_anterior, tamano=20)
+        self.assertEqual([m.id for m in anterior], [m.id for m in paginas[1]])
+        self.assertTrue(anterior.hay_anterior)
+
+    def test_historial_producto_paginado(self):
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+
+        response = self.client.get(reverse('historial_producto', args=['A']))
+
+        self.assertEqual(len(response.context['movimientos']), 45)
+        self.assertFalse(response.context['pagina'].hay_siguiente)
+
+    def test_cursor_invalido_devuelve_primera_pagina(self):
+        pagina = paginar_por_cursor(MovimientoInventario.objects.all(), despues='no-es-un-cursor', tamano=10)
+        self.assertEqual([m.id for m in pagina], self.orden_esperado[:10])
+
+    def test_cursor_sin_zona_horaria_es_invalido(self):
+        sin_zona = base64.urlsafe_b64encode(b'2024-01-01T10:00:00|5').decode().rstrip('=')
+        self.assertIsNone(decodificar_cursor(sin_zona))
+        pagina = paginar_por_cursor(MovimientoInventario.objects.all(), despues=sin_zona, tamano=10)
+        self.assertEqual([m.id for m in pagina], self.orden_esperado[:10])
+
+
+class PruebasBusquedaProductos(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        Producto.objects.create(codigo_producto='TOR-001', nombre='Tornillo cabeza hexagonal')
+        Producto.objects.create(codigo_producto='TUE-010', nombre='Tuerca de acero')
+        Producto.objects.create(codigo_producto='CAB-002', nombre='Cable eléctrico 2mm')
+
+    def _codigos(self, consulta):
+        return list(buscar_productos(Producto.objects.all(), consulta).order_by('-relevancia', 'nombre').values_list('pk', flat=True))
+
+    def test_busca_subcadenas_sin_acentos(self):
+        self.assertEqual(self._codigos('hexag'), ['TOR-001'])
+        self.assertEqual(self._codigos('ELECTRICO'), ['CAB-002'])
+        self.assertEqual(self._codigos('acero tuer'), ['TUE-010'])
+        self.assertEqual(self._codigos('inexistente'), [])
+
+    def test_prefijo_de_codigo_tiene_mayor_relevancia(self):
+        # 'cab' aparece en el nombre de TOR-001 y es prefijo del código CAB-002
+        self.assertEqual(self._codigos('cab'), ['CAB-002', 'TOR-001'])
+
+    def test_indice_se_actualiza_al_editar(self):
+        producto = Producto.objects.get(pk='TUE-010')
+        producto.nombre = 'Arandela plana'
+        producto.save()
+
+        self.assertEqual(self._codigos('arandela'), ['TUE-010'])
+        self.assertEqual(self._codigos('tuerca'), [])
+
+    def test_no_reindexa_si_no_cambia_el_nombre(self):
+        producto = Producto.objects.get(pk='TUE-010')
+        tokens = set(producto.tokens_busqueda.values_list('id', flat=True))
+
+        producto.stock_minimo = 5
+        producto.save(update_fields=['stock_minimo'])
+        with middleware.usuario_actual(self.user):
+            producto.cantidad_stock = 7
+            producto.save()
+
+        self.assertEqual(set(producto.tokens_busqueda.values_list('id', flat=True)), tokens)
+        self.assertEqual(self._codigos('tuerca'), ['TUE-010'])
+
+    def test_ajax_devuelve_codigo_como_id(self):
+        response = self.client.get(reverse('ajax_buscar_productos'), {'q': 'torn'})
+
+        self.assertEqual(response.json(), [{'id': 'TOR-001', 'text': 'TOR-001 - Tornillo cabeza hexagonal (Stock: 0)'}])
+
+    def test_lista_stock_no_usa_like_con_comodin_inicial(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('lista_stock'), {'q': 'tuerca'})
+
+        self.assertEqual([p.pk for p in response.context['page_obj']], ['TUE-010'])
+        self.assertFalse(any("LIKE '%" in q['sql'] or 'LIKE %' in q['sql'] for q in consultas.captured_queries))
+
+
+
+class PruebasIndiceAutocompletado(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.area = Area.objects.create(nombre='Area de Prueba')
+        Producto.objects.create(codigo_producto='TOR-001', nombre='Tornillo cabeza hexagonal', cantidad_stock=9)
+        Producto.objects.create(codigo_producto='CAB-002', nombre='Cable eléctrico 2mm')
+        Producto.objects.create(codigo_producto='ARA-003', nombre='Arandela para cable')
+        self.indice = IndiceAutocompletado()
+
+    def _ids(self, consulta):
+        return [fila['id'] for fila in json.loads(self.indice.responder(consulta))]
+
+    def test_prefijos_de_codigo_y_nombre(self):
+        self.assertEqual(self._ids('tor-0'), ['TOR-001'])
+        self.assertEqual(self._ids('electr'), ['CAB-002'])
+        self.assertEqual(self._ids('CAB'), ['CAB-002', 'ARA-003', 'TOR-001'])
+        self.assertEqual(self._ids('cable para'), ['ARA-003'])
+        self.assertEqual(self._ids(''), ['ARA-003', 'CAB-002', 'TOR-001'])
+
+    def test_consultas_repetidas_no_tocan_la_base_de_datos(self):
+        self.indice.responder('torn')
+        with self.assertNumQueries(0):
+            self.indice.responder('torn')
+            self.indice.responder('cab')
+
+    def test_movimiento_de_stock_recarga_solo_cantidades(self):
+        self.indice.responder('torn')
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('TOR-001', 4)])
+
+        with self.assertNumQueries(1):
+            respuesta = json.loads(self.indice.responder('torn'))
+        self.assertEqual(respuesta[0]['text'], 'TOR-001 - Tornillo cabeza hexagonal (Stock: 5)')
+
+    def test_movimiento_relee_y_descarta_solo_los_productos_movidos(self):
+        self.indice.responder('torn')
+        self.indice.responder('electr')
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('TOR-001', 4)])
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self._ids('electr'), ['CAB-002'])
+            respuesta = json.loads(self.indice.responder('torn'))
+        self.assertEqual(len(consultas), 1)
+        self.assertIn("'TOR-001'", consultas[0]['sql'])
+        self.assertNotIn("'CAB-002'", consultas[0]['sql'])
+        self.assertEqual(respuesta[0]['text'], 'TOR-001 - Tornillo cabeza hexagonal (Stock: 5)')
+
+    def test_sin_diario_relee_todo_el_stock(self):
+        self.indice.responder('torn')
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('TOR-001', 4)])
+        cache.delete(f"bodega:stock:cambios:{cache.get(SECUENCIA_STOCK)}")
+
+        respuesta = json.loads(self.indice.responder('torn'))
+        self.assertEqual(respuesta[0]['text'], 'TOR-001 - Tornillo cabeza hexagonal (Stock: 5)')
+
+    def test_cambio_de_catalogo_reconstruye_el_indice(self):
+        self.indice.responder('clavo')
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(codigo_producto='CLA-004', nombre='Clavo de acero')
+
+        self.assertEqual(self._ids('clavo'), ['CLA-004'])
+
+
+class PruebasNotificacionesStockBajo(TestCase):
+
+    def setUp(self):
+        self.area = Area.objects.create(nombre='Area de Prueba')
+        grupo = Group.objects.create(name='Administradores')
+        for nombre in ('admin1', 'admin2'):
+            User.objects.create_user(username=nombre, email=f'{nombre}@bodega.test').groups.add(grupo)
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10, stock_minimo=5)
+        Producto.objects.create(codigo_producto='B', nombre='Producto B', cantidad_stock=10, stock_minimo=0)
+
+    def test_despacho_escribe_en_bandeja_sin_enviar_correo(self):
+        registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 6), ('B', 9)])
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            list(NotificacionPendiente.objects.values_list('producto_id', 'stock_actual', 'stock_minimo')),
+            [('A', 4, 5)]
+        )
+
+    def test_despacho_revertido_no_deja_alertas(self):
+        with self.assertRaises(StockInsuficienteError):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 6), ('B', 11)])
+        self.assertFalse(NotificacionPendiente.objects.exists())
+
+    def test_comando_envia_un_resumen_por_destinatario(self):
+        for _ in range(3):
+            registrar_despacho(Despacho(area=self.area, usuario_solicitante='X'), [('A', 2)])
+
+        call_command('enviar_notificaciones', stdout=io.StringIO())
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['admin1@bodega.test', 'admin2@bodega.test'])
+        # Tres alertas del mismo producto se resumen en una sola línea con el último stock
+        self.assertEqual(mail.outbox[0].body.count('Producto A'), 1)
+        self.assertIn('stock 4, mínimo 5', mail.outbox[0].body)
+        self.assertFalse(NotificacionPendiente.objects.filter(enviado_en__isnull=True).exists())
+
+        call_command('enviar_notificaciones', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class PruebasAuditoriaEnLote(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='password123')
+        self.proveedor = Proveedor.objects.create(nombre='Proveedor Auditado')
+        self._token = middleware._usuario_actual.set(middleware._Referencia(self.user))
+
+    def tearDown(self):
+        middleware._usuario_actual.reset(self._token)
+
+    def _inserts_auditoria(self, consultas):
+        return [q for q in consultas.captured_queries if q['sql'].startswith('INSERT INTO "bodega_auditlog"')]
+
+    def test_una_peticion_escribe_la_auditoria_en_un_solo_insert(self):
+        with CaptureQueriesContext(connection) as consultas:
+            with auditoria_en_lote():
+                with self.captureOnCommitCallbacks(execute=True):
+                    for i in range(3):
+                        Producto.objects.create(codigo_producto=f'AUD{i}', nombre=f'Auditado {i}')
+
+        self.assertEqual(len(self._inserts_auditoria(consultas)), 1)
+        self.assertEqual(AuditLog.objects.filter(accion='CREADO', modelo_afectado='Producto').count(), 3)
+
+    def test_cambios_revertidos_no_se_auditan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Producto.objects.create(codigo_producto='REV', nombre='Revertido')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_detalle_de_recepcion_no_consulta_el_proveedor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as consultas:
+                recepcion = Recepcion.objects.create(proveedor_id=self.proveedor.pk)
+        # Solo el INSERT de la recepción: ningún SELECT del proveedor
+        self.assertFalse([q for q in consultas.captured_queries if q['sql'].startswith('SELECT')])
+        self.assertEqual(
+            AuditLog.objects.get(accion='REGISTRADO').detalle,
+            f"Recepción #{recepcion.pk} de proveedor #{self.proveedor.pk}"
+        )
+
+
+class PruebasAuditoriaAsincrona(TransactionTestCase):
+
+    @override_settings(BODEGA_AUDITORIA_ASINCRONA=True)
+    def test_los_lotes_se_escriben_en_segundo_plano(self):
+        auditor = User.objects.create_user(username='auditor', password='password123')
+        with middleware.usuario_actual(auditor), auditoria_en_lote():
+            Proveedor.objects.create(nombre='Proveedor 1')
+            Proveedor.objects.create(nombre='Proveedor 2')
+
+        _escritor_asincrono().vaciar()
+        self.assertEqual(AuditLog.objects.filter(modelo_afectado='Proveedor').count(), 2)
+
+
+class PruebasAuditoriaCambios(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='password123')
+        self.producto = Producto.objects.create(codigo_producto='CAMB', nombre='Original', stock_minimo=1)
+        self._token = middleware._usuario_actual.set(middleware._Referencia(self.user))
+
+    def tearDown(self):
+        middleware._usuario_actual.reset(self._token)
+
+    def test_guardar_sin_cambios_no_audita(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.save()
+            self.producto.version += 1
+            self.producto.save()
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_modificacion_registra_solo_los_campos_cambiados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.nombre = 'Renombrado'
+            self.producto.stock_minimo = 4
+            self.producto.save()
+
+        detalle = AuditLog.objects.get(accion='MODIFICADO').detalle
+        self.assertIn("nombre: 'Original' → 'Renombrado'", detalle)
+        self.assertIn("stock_minimo: 1 → 4", detalle)
+        self.assertNotIn('observaciones', detalle)
+
+    def test_inicio_de_sesion_no_audita_last_login(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as consultas:
+                user_logged_in.send(sender=User, request=None, user=self.user)
+        self.assertFalse(AuditLog.objects.exists())
+        # Ni siquiera se consulta el estado previo: solo el UPDATE de last_login
+        self.assertEqual(len(consultas.captured_queries), 1)
+
+    def test_cambio_de_contrasena_no_guarda_el_hash(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('otra-clave')
+            self.user.save()
+        detalle = AuditLog.objects.get(modelo_afectado='User').detalle
+        self.assertIn('password: (modificado)', detalle)
+        self.assertNotIn(self.user.password, detalle)
+
+
+class PruebasArchivoHistorico(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = self.settings(BODEGA_ARCHIVO_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.user = User.objects.create_user(username='archivista', password='password123')
+        self.producto = Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=0)
+        proveedor = Proveedor.objects.create(nombre='Proveedor')
+        for _ in range(10):
+            registrar_recepcion(Recepcion(proveedor=proveedor), [('A', 1)])
+        # Los 7 primeros movimientos son de hace más de un año
+        antiguo = timezone.now() - timedelta(days=400)
+        for i, pk in enumerate(MovimientoInventario.objects.order_by('id').values_list('pk', flat=True)[:7]):
+            MovimientoInventario.objects.filter(pk=pk).update(fecha_hora=antiguo + timedelta(days=i))
+        self.orden_original = list(
+            MovimientoInventario.objects.order_by('-fecha_hora', '-id').values_list('id', flat=True)
+        )
+
+        AuditLog.objects.create(usuario=self.user, accion='CREADO', modelo_afectado='Producto', detalle='Antiguo')
+        AuditLog.objects.update(fecha_hora=antiguo)
+        AuditLog.objects.create(usuario=self.user, accion='CREADO', modelo_afectado='Producto', detalle='Reciente')
+
+        call_command('consolidar_stock_diario', stdout=io.StringIO())
+        call_command('archivar_historial', '--dias', '30', '--lote', '3', stdout=io.StringIO())
+
+    def test_mueve_filas_antiguas_y_deja_saldo_inicial(self):
+        self.assertEqual(MovimientoInventario.objects.count(), 4)
+        saldo = MovimientoInventario.objects.get(tipo_movimiento=TIPO_SALDO_INICIAL)
+        self.assertEqual((saldo.stock_anterior, saldo.stock_nuevo), (7, 7))
+        # El saldo encadena con el primer movimiento que queda en la base
+        siguiente = MovimientoInventario.objects.exclude(pk=saldo.pk).order_by('fecha_hora', 'id').first()
+        self.assertEqual(siguiente.stock_anterior, saldo.stock_nuevo)
+        self.assertTrue(list((directorio_archivo() / 'kardex').glob(f'*/{cubeta_kardex("A")}.jsonl.gz')))
+        self.assertEqual(list(AuditLog.objects.values_list('detalle', flat=True)), ['Reciente'])
+
+        # Repetir el comando no duplica saldos ni filas archivadas
+        call_command('archivar_historial', '--dias', '30', stdout=io.StringIO())
+        self.assertEqual(MovimientoInventario.objects.count(), 4)
+        self.assertEqual(len(list(lector_kardex(self.producto).anteriores())), 7)
+
+    def test_paginacion_continua_en_el_archivo(self):
+        queryset = MovimientoInventario.objects.filter(producto=self.producto)
+        archivo = lector_kardex(self.producto)
+        paginas = [paginar_por_cursor(queryset, tamano=3, archivo=archivo)]
+        while paginas[-1].hay_siguiente:
+            paginas.append(paginar_por_cursor(queryset, despues=paginas[-1].cursor_siguiente, tamano=3, archivo=archivo))
+
+        ids = [m.id for p in paginas for m in p if m.tipo_movimiento != TIPO_SALDO_INICIAL]
+        self.assertEqual(ids, self.orden_original)
+        self.assertEqual([m.stock_nuevo for m in paginas[-1]], [2, 1])
+
+        # Volver hacia atrás cruza de nuevo del archivo a la base de datos
+        anterior = paginar_por_cursor(queryset, antes=paginas[2].cursor_anterior, tamano=3, archivo=archivo)
+        self.assertEqual([m.id for m in anterior], [m.id for m in paginas[1]])
+
+    def test_registro_de_auditoria_incluye_lo_archivado(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='view_auditlog'))
+        self.client.login(username='archivista', password='password123')
+        response = self.client.get(reverse('audit_log'))
+
+        logs = list(response.context['page_obj'])
+        self.assertEqual([log.detalle for log in logs][-2:], ['Reciente', 'Antiguo'])
+        self.assertContains(response, 'archivista')
+        self.assertEqual(len(list(lector_auditoria().anteriores())), 1)
+
+    def test_paginas_siguientes_no_vuelven_a_descomprimir(self):
+        self.assertEqual(len(list(lector_kardex(self.producto).anteriores())), 7)
+        self.assertEqual(len(list(lector_auditoria().anteriores())), 1)
+        with mock.patch('bodega.archivo.gzip.open', side_effect=AssertionError("archivo releído")):
+            self.assertEqual(len(list(lector_kardex(self.producto).anteriores())), 7)
+            self.assertEqual([log.usuario.username for log in lector_auditoria().anteriores()], ['archivista'])
+
+
+class PruebasCachePdf(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = self.settings(BODEGA_PDF_CACHE_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        area = Area.objects.create(nombre='Bodega Central')
+        for i in range(5):
+            Producto.objects.create(codigo_producto=f'P{i}', nombre=f'Producto {i}', cantidad_stock=10)
+        self.despacho = Despacho.objects.create(area=area, usuario_solicitante='X')
+        DespachoItem.objects.bulk_create([
+            DespachoItem(despacho=self.despacho, producto_id=f'P{i}', cantidad=1) for i in range(5)
+        ])
+
+    def test_renderizado_no_consulta_por_linea(self):
+        # Cabecera con sus relaciones + líneas con sus productos
+        with self.assertNumQueries(2):
+            renderizar_pdf('despacho', self.despacho.pk)
+
+    def test_segunda_descarga_sale_del_disco_y_revalida_con_etag(self):
+        url = reverse('generar_despacho_pdf', args=[self.despacho.pk])
+        primera = self.client.get(url)
+        self.assertEqual(primera['Content-Type'], 'application/pdf')
+        self.assertTrue(ruta_pdf('despacho', self.despacho.pk).exists())
+
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get(url)
+        self.assertEqual(b''.join(segunda.streaming_content), b''.join(primera.streaming_content))
+        self.assertFalse([q for q in consultas.captured_queries if 'bodega_despacho' in q['sql']])
+
+        no_modificado = self.client.get(url, HTTP_IF_NONE_MATCH=segunda['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+
+    def test_documento_inexistente_devuelve_404(self):
+        response = self.client.get(reverse('generar_recepcion_pdf', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PruebasPrecalentadoPdf(TransactionTestCase):
+
+    def test_registrar_despacho_genera_el_pdf_al_confirmar(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10)
+        area = Area.objects.create(nombre='Bodega Central')
+
+        with self.settings(BODEGA_PDF_CACHE_DIR=directorio, BODEGA_PDF_PRECALENTAR=True):
+            despacho = Despacho(area=area, usuario_solicitante='X')
+            registrar_despacho(despacho, [('A', 2)])
+            esperar_precalentado()
+            self.assertTrue(ruta_pdf('despacho', despacho.pk).exists())
+
+
+class PruebasLotePdf(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = self.settings(BODEGA_PDF_CACHE_DIR=directorio, BODEGA_PDF_PROCESOS=2)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        area = Area.objects.create(nombre='Bodega Central')
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10)
+        self.despachos = [Despacho.objects.create(area=area, usuario_solicitante='X') for _ in range(5)]
+        DespachoItem.objects.bulk_create([DespachoItem(despacho=d, producto_id='A', cantidad=1) for d in self.despachos])
+
+    def test_una_consulta_de_cabeceras_y_otra_de_lineas_por_bloque(self):
+        pks = [d.pk for d in self.despachos] + [999]
+        avances = []
+        with self.assertNumQueries(6):
+            generados = list(renderizar_lote('despacho', pks, tamano=2, progreso=lambda h, t: avances.append(h)))
+        self.assertEqual([pk for pk, _ruta in generados], pks[:5])
+        self.assertTrue(all(ruta.exists() for _pk, ruta in generados))
+        self.assertEqual(avances, [2, 4, 6])
+
+        # Con todo en caché ya no hace falta consultar la base de datos
+        with self.assertNumQueries(0):
+            list(renderizar_lote('despacho', pks[:5], tamano=2))
+
+    def test_exportar_zip_del_periodo(self):
+        hoy = str(timezone.localdate())
+        response = self.client.get(reverse('exportar_despachos_pdf'), {'format': 'zip', 'start_date': hoy, 'end_date': hoy})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archivo = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archivo.namelist(), [f"despacho_{d.pk}.pdf" for d in self.despachos])
+        self.assertTrue(archivo.read(archivo.namelist()[0]).startswith(b'%PDF'))
+
+    def test_las_descargas_comparten_el_pool_de_procesos(self):
+        url = reverse('exportar_despachos_pdf')
+        hoy = str(timezone.localdate())
+        with mock.patch('bodega.pdfs._pool_procesos', None), \
+                mock.patch('bodega.pdfs.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as crear:
+            for _ in range(2):
+                b''.join(self.client.get(url, {'format': 'zip', 'start_date': hoy, 'end_date': hoy}).streaming_content)
+            pdfs._pool_procesos.shutdown()
+        self.assertEqual(crear.call_count, 1)
+
+    def test_exportar_exige_un_periodo_acotado(self):
+        url = reverse('exportar_despachos_pdf')
+        hoy = timezone.localdate()
+        for parametros in ({}, {'start_date': str(hoy)}, {'start_date': str(hoy - timedelta(days=31)), 'end_date': str(hoy)},
+                           {'start_date': str(hoy), 'end_date': str(hoy - timedelta(days=1))}):
+            self.assertEqual(self.client.get(url, parametros).status_code, 400)
+        self.assertFalse(list(directorio_pdfs().glob('*/*.pdf')))
+
+    def test_comando_genera_zip(self):
+        salida = Path(tempfile.mkdtemp()) / 'despachos.zip'
+        self.addCleanup(shutil.rmtree, salida.parent)
+        out = io.StringIO()
+        call_command('generar_comprobantes_pdf', 'despacho', str(salida), '--lote', '3', stdout=out)
+        self.assertIn('5/5 comprobantes', out.getvalue())
+        self.assertEqual(len(zipfile.ZipFile(salida).namelist()), 5)
+
+
+class PruebasEtiquetasQr(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = self.settings(BODEGA_QR_CACHE_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', categoria='Ferretería')
+        Producto.objects.create(codigo_producto='B', nombre='Producto B', categoria='Aseo')
+
+    def test_imagen_se_guarda_y_revalida_sin_consultas(self):
+        url = reverse('imagen_qr_producto', args=['A', 'svg'])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(ruta_qr('A', 'svg').exists())
+
+        with CaptureQueriesContext(connection) as consultas:
+            no_modificado = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+        self.assertFalse([q for q in consultas.captured_queries if 'bodega_producto' in q['sql']])
+
+    def test_producto_inexistente_o_formato_invalido_devuelve_404(self):
+        self.assertEqual(self.client.get(reverse('imagen_qr_producto', args=['ZZZ', 'png'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('imagen_qr_producto', args=['A', 'gif'])).status_code, 404)
+
+    def test_hoja_de_etiquetas_por_categoria(self):
+        productos = list(productos_para_etiquetas(categoria='Aseo'))
+        self.assertEqual(productos, [('B', 'Producto B')])
+        with hoja_etiquetas(productos) as pdf:
+            self.assertTrue(pdf.read().startswith(b'%PDF'))
+        self.assertTrue(ruta_qr('B', 'png').exists())
+
+    def test_hoja_de_etiquetas_exige_permiso_y_un_filtro_acotado(self):
+        url = reverse('etiquetas_qr')
+        self.assertEqual(self.client.get(url, {'categoria': 'Aseo'}).status_code, 302)
+
+        usuario = User.objects.get(username='testuser')
+        usuario.user_permissions.add(Permission.objects.get(codename='view_producto'))
+        self.assertEqual(self.client.get(url).status_code, 400)
+        response = self.client.get(url, {'categoria': 'Aseo'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        Producto.objects.create(codigo_producto='C', nombre='Producto C', categoria='Aseo')
+        with mock.patch('bodega.views.MAX_ETIQUETAS_QR', 1):
+            self.assertEqual(self.client.get(url, {'categoria': 'Aseo'}).status_code, 400)
+
+    @override_settings(BODEGA_PDF_PROCESOS=2)
+    def test_qr_masivos_en_procesos(self):
+        codigos = [f'C{i}' for i in range(250)]
+        rutas = obtener_qrs(codigos)
+        self.assertTrue(all(ruta.read_bytes().startswith(b'\x89PNG') for ruta in rutas.values()))
+
+
+@override_settings(BODEGA_PDF_PRECALENTAR=False)
+class PruebasStockPorLote(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        for i in range(60):
+            Producto.objects.create(codigo_producto=f'P{i}', nombre=f'Producto {i}', cantidad_stock=i, stock_minimo=5)
+        self.url = reverse('ajax_stock_productos')
+        self.codigos = [f'P{i}' for i in range(60)] + ['NOEXISTE']
+
+    def test_una_consulta_para_todas_las_lineas(self):
+        with self.assertNumQueries(1):
+            productos = consultar_stock(self.codigos)
+        self.assertEqual(len(productos), 60)
+        self.assertEqual(productos['P7']['stock'], 7)
+        self.assertEqual(productos['P7']['stock_minimo'], 5)
+        # La segunda vez sale de la caché
+        with self.assertNumQueries(0):
+            consultar_stock(self.codigos[:60])
+
+    def test_etag_cambia_cuando_se_mueve_el_stock(self):
+        response = self.client.get(self.url, {'codigo': self.codigos})
+        self.assertEqual(response.json()['no_encontrados'], ['NOEXISTE'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, {'codigo': self.codigos}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        despacho = Despacho(area=Area.objects.create(nombre='Bodega'), usuario_solicitante='X')
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_despacho(despacho, [('P10', 3)])
+        response = self.client.get(self.url, {'codigo': self.codigos}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['productos']['P10']['stock'], 7)
+
+    def test_producto_desconocido_devuelve_404_json(self):
+        response = self.client.get(reverse('ajax_get_stock'), {'codigo_producto': 'NOEXISTE'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error'], 'Producto no encontrado')
+
+
+class _SuscripcionDePrueba:
+    def __init__(self, productos):
+        self.productos = set(productos)
+        self.recibidos = []
+
+    def interesa(self, evento):
+        return evento['codigo'] in self.productos
+
+    def podria_interesar(self, codigos):
+        return not self.productos.isdisjoint(codigos)
+
+    def entregar(self, evento):
+        self.recibidos.append(evento)
+
+
+@override_settings(BODEGA_PDF_PRECALENTAR=False)
+class PruebasStockEnVivo(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        rack = Rack.objects.create(codigo_rack='R1')
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10, ubicacion_rack=rack)
+        Producto.objects.create(codigo_producto='B', nombre='Producto B', cantidad_stock=10)
+
+    def test_movimiento_confirmado_se_difunde_a_los_suscritos(self):
+        suscripcion = _SuscripcionDePrueba(['A'])
+        obtener_difusor().suscribir(suscripcion)
+        self.addCleanup(obtener_difusor().desuscribir, suscripcion)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            registrar_despacho(Despacho(area=Area.objects.create(nombre='Bodega'), usuario_solicitante='X'), [('A', 3), ('B', 1)])
+        # Nada se anuncia antes del commit
+        self.assertEqual(suscripcion.recibidos, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual([(e['codigo'], e['stock'], e['rack']) for e in suscripcion.recibidos], [('A', 7, 'R1')])
+
+    def test_sin_suscriptores_no_se_consulta_el_stock(self):
+        suscripcion = _SuscripcionDePrueba(['B'])
+        obtener_difusor().suscribir(suscripcion)
+        self.addCleanup(obtener_difusor().desuscribir, suscripcion)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            registrar_recepcion(Recepcion(proveedor=Proveedor.objects.create(nombre='P')), [('A', 1)])
+        cache.clear()
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(suscripcion.recibidos, [])
+
+    async def test_stream_envia_stock_inicial_y_cambios(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('ajax_stock_en_vivo'), {'rack': 'R1', 'producto': 'B'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        contenido = aiter(response.streaming_content)
+        self.assertEqual(await anext(contenido), b'retry: 5000\n\n')
+        self.assertIn(b'"stock": 10', await anext(contenido))
+
+        obtener_difusor().publicar([
+            {'codigo': 'Z', 'rack': 'OTRO', 'stock': 1},
+            {'codigo': 'A', 'rack': 'R1', 'stock': 7},
+        ])
+        evento = await anext(contenido)
+        self.assertTrue(evento.startswith(b'event: stock'))
+        self.assertIn(b'"codigo": "A"', evento)
+        await contenido.aclose()
+
+    async def test_movimiento_entre_conexion_y_primera_lectura_no_se_pierde(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('ajax_stock_en_vivo'), {'producto': 'A'})
+        # El cliente aún no lee el stream cuando se confirma el movimiento
+        obtener_difusor().publicar([{'codigo': 'A', 'rack': 'R1', 'stock': 4}])
+
+        contenido = aiter(response.streaming_content)
+        self.assertEqual(await anext(contenido), b'retry: 5000\n\n')
+        self.assertIn(b'"stock": 10', await anext(contenido))
+        self.assertIn(b'"stock": 4', await anext(contenido))
+        await contenido.aclose()
+
+    async def test_cerrar_sin_leer_cancela_la_suscripcion(self):
+        await self.async_client.aforce_login(self.user)
+        difusor = obtener_difusor()
+        antes = len(difusor._suscripciones)
+        response = await self.async_client.get(reverse('ajax_stock_en_vivo'), {'producto': 'A'})
+        self.assertEqual(len(difusor._suscripciones), antes + 1)
+        response.close()
+        self.assertEqual(len(difusor._suscripciones), antes)
+
+    def test_sin_suscripciones_devuelve_400(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('ajax_stock_en_vivo')).status_code, 400)
+
+
+class PruebasContextoPeticion(TestCase):
+
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='password123')
+        self.beto = User.objects.create_user(username='beto', password='password123')
+
+    def test_el_usuario_no_sobrevive_a_la_peticion(self):
+        self.client.force_login(self.ana)
+        self.client.get(reverse('dashboard'))
+        self.assertIsNone(middleware.get_current_user())
+
+    def test_executor_recibe_el_contexto_copiado(self):
+        with middleware.usuario_actual(self.ana), ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertIsNone(executor.submit(middleware.get_current_user).result())
+            self.assertEqual(executor.submit(middleware.copiar_contexto(middleware.get_current_user)).result(), self.ana)
+
+    async def test_tareas_concurrentes_no_comparten_usuario(self):
+        async def peticion(usuario):
+            with middleware.usuario_actual(usuario):
+                await asyncio.sleep(0)
+                # La vista síncrona corre en otro hilo con el contexto copiado
+                return await sync_to_async(middleware.get_current_user)()
+
+        resultados = await asyncio.gather(peticion(self.ana), peticion(self.beto))
+        self.assertEqual(resultados, [self.ana, self.beto])
+
+
+class PruebasAuditoriaAsgi(TransactionTestCase):
+
+    async def test_auditoria_de_una_vista_bajo_asgi(self):
+        self.ana = await sync_to_async(User.objects.create_superuser)(username='ana', password='password123')
+        await self.async_client.aforce_login(self.ana)
+        response = await self.async_client.post(reverse('agregar_area'), {'nombre': 'Patio'})
+        self.assertEqual(response.status_code, 302)
+        log = await AuditLog.objects.select_related('usuario').aget(modelo_afectado='Area')
+        self.assertEqual(log.usuario, self.ana)
+
+
+class PruebasLecturasAsincronas(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        Proveedor.objects.create(nombre='Proveedor 1')
+        Producto.objects.create(codigo_producto='TAL-001', nombre='Taladro Percutor', cantidad_stock=2, stock_minimo=5, categoria='Herramientas')
+        Producto.objects.create(codigo_producto='MAR-002', nombre='Martillo', cantidad_stock=20, categoria='Herramientas')
+
+    async def test_vistas_ajax_bajo_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('ajax_buscar_productos'), {'q': 'tal'})
+        self.assertEqual([r['id'] for r in json.loads(response.content)], ['TAL-001'])
+
+        response = await self.async_client.get(reverse('ajax_get_stock'), {'codigo_producto': 'MAR-002'})
+        self.assertEqual(response.json(), {'stock': 20})
+
+        response = await self.async_client.get(reverse('ajax_stock_productos'), {'codigo': ['TAL-001', 'X']})
+        self.assertEqual(response.json()['no_encontrados'], ['X'])
+
+        response = await self.async_client.get(reverse('ajax_dashboard_datos'))
+        self.assertEqual(response.json()['productos_stock_bajo_count'], 1)
+
+    async def test_versiones_asincronas_devuelven_lo_mismo(self):
+        self.assertEqual(await acalcular_widgets_dashboard(), await sync_to_async(calcular_widgets_dashboard)())
+        self.assertEqual(await aconsultar_stock(['MAR-002']), await sync_to_async(consultar_stock)(['MAR-002']))
+
+
+class PruebasBenchmarkLecturas(TransactionTestCase):
+    # Los hilos del modo síncrono abren sus propias conexiones: los datos
+    # tienen que estar confirmados para que los vean.
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='medidor', password='password123')
+        Producto.objects.create(codigo_producto='TAL-001', nombre='Taladro Percutor', cantidad_stock=2)
+
+    def test_benchmark_reporta_todas_las_lecturas(self):
+        out = io.StringIO()
+        call_command(
+            'benchmark_lecturas', '--peticiones', '10', '--hilos', '2', '--concurrencia', '5', '--usuario', 'medidor',
+            stdout=out
+        )
+        for lectura in ('autocompletado', 'stock por lote', 'dashboard'):
+            self.assertIn(lectura, out.getvalue())
+
+    def test_una_conexion_por_hilo_en_ambos_modos(self):
+        with mock.patch('django.db.backends.base.base.BaseDatabaseWrapper.connect', autospec=True,
+                        side_effect=BaseDatabaseWrapper.connect) as conexiones:
+            call_command(
+                'benchmark_lecturas', '--peticiones', '20', '--hilos', '2', '--concurrencia', '5', '--usuario', 'medidor',
+                stdout=io.StringIO()
+            )
+        # Por lectura: una conexión por cada hilo síncrono y una para el ORM asíncrono
+        self.assertLessEqual(conexiones.call_count, 3 * (2 + 1) + 1)
+
+    def test_sin_usuario_no_mide(self):
+        with self.assertRaisesMessage(CommandError, '--usuario'):
+            call_command('benchmark_lecturas', '--peticiones', '1', stdout=io.StringIO())
+
+
+def _detalle_sin_prefetch(request, pk):
+    """El detalle de despacho sin prefetch de líneas: un N+1 a propósito."""
+    return render(request, 'bodega/detalle_despacho.html', {'despacho': Despacho.objects.get(pk=pk)})
+
+urlpatterns = [
+    path('n1/<int:pk>/', _detalle_sin_prefetch, name='detalle_sin_prefetch'),
+    path('', include('config.urls')),
+]
+
+
+@override_settings(BODEGA_SQL_MUESTREO=1, BODEGA_SQL_UMBRAL_REPETICIONES=3, ROOT_URLCONF='bodega.tests')
+class PruebasInstrumentacionSQL(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        area = Area.objects.create(nombre='Bodega Central')
+        for i in range(5):
+            Producto.objects.create(codigo_producto=f'P{i}', nombre=f'Producto {i}', cantidad_stock=10)
+        self.despacho = Despacho.objects.create(area=area, usuario_solicitante='X')
+        DespachoItem.objects.bulk_create([
+            DespachoItem(despacho=self.despacho, producto_id=f'P{i}', cantidad=1) for i in range(5)
+        ])
+
+    def test_huella_ignora_valores(self):
+        self.assertEqual(
+            huella_sql("SELECT * FROM t WHERE id IN (%s, %s) AND nombre = 'x' LIMIT 21"),
+            huella_sql("SELECT * FROM t WHERE id IN (%s) AND nombre = 'y' LIMIT 1"),
+        )
+
+    def test_server_timing_y_aviso_de_n_mas_1_con_linea_de_plantilla(self):
+        with self.assertLogs('bodega.sql', 'INFO') as logs:
+            response = self.client.get(reverse('detalle_sin_prefetch', args=[self.despacho.pk]))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ consultas", n1;')
+        aviso = [r for r in logs.records if r.levelname == 'WARNING'][0]
+        self.assertEqual(aviso.sql['vista'], 'detalle_sin_prefetch')
+        repetida = aviso.sql['repetidas'][0]
+        self.assertEqual(repetida['veces'], 5)
+        self.assertTrue(repetida['plantilla'].startswith('bodega/detalle_despacho.html:'))
+
+    @override_settings(BODEGA_SQL_MUESTREO=0)
+    def test_peticiones_fuera_de_la_muestra_no_se_miden(self):
+        response = self.client.get(reverse('detalle_despacho', args=[self.despacho.pk]))
+        self.assertNotIn('Server-Timing', response)
+
+
+class PruebasMetricas(TestCase):
+
+    def _registro(self):
+        registro = Registro()
+        registro.contador('prueba_total', "Prueba.", ('tipo',))
+        registro.histograma('prueba_segundos', "Prueba.", buckets=(0.1, 1))
+        return registro
+
+    def test_histograma_acumulado_y_contadores_entre_hilos(self):
+        registro = self._registro()
+
+        def trabajar():
+            for _ in range(1000):
+                registro.incrementar('prueba_total', tipo='a')
+        hilos = [threading.Thread(target=trabajar) for _ in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        for valor in (0.05, 0.5, 3):
+            registro.observar('prueba_segundos', valor)
+
+        texto = registro.exponer()
+        self.assertIn('prueba_total{tipo="a"} 4000', texto)
+        self.assertIn('prueba_segundos_bucket{le="0.1"} 1', texto)
+        self.assertIn('prueba_segundos_bucket{le="1"} 2', texto)
+        self.assertIn('prueba_segundos_bucket{le="+Inf"} 3', texto)
+        self.assertIn('prueba_segundos_count 3', texto)
+
+    def test_suma_los_procesos_del_directorio_compartido(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        with self.settings(BODEGA_METRICAS_DIR=directorio):
+            worker_1, worker_2 = self._registro(), self._registro()
+            worker_1.incrementar('prueba_total', 2, tipo='a')
+            worker_2.incrementar('prueba_total', 3, tipo='a')
+            worker_2.volcar()
+            self.assertIn('prueba_total{tipo="a"} 5', worker_1.exponer())
+
+    @override_settings(BODEGA_METRICAS_TOKEN='secreto', BODEGA_PDF_PRECALENTAR=False)
+    def test_endpoint_expone_vistas_y_contadores_de_negocio(self):
+        Producto.objects.create(codigo_producto='A', nombre='Producto A', cantidad_stock=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_despacho(Despacho(area=Area.objects.create(nombre='Bodega'), usuario_solicitante='X'), [('A', 1), ('A', 2)])
+        User.objects.create_user(username='testuser', password='password123')
+        self.client.login(username='testuser', password='password123')
+        self.client.get(reverse('ajax_buscar_productos'), {'q': 'pro'})
+
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        texto = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto').content.decode()
+        self.assertIn('bodega_peticion_segundos_count{vista="ajax_buscar_productos",metodo="GET"}', texto)
+        self.assertIn('bodega_lineas_registradas_total{tipo="despacho"}', texto)
+        self.assertRegex(texto, r'bodega_despachos_total [1-9]')
+
+
+class PruebasDatosSinteticos(TestCase):
+
+    def _generar(self, prefijo):
+        call_command(
+            'generar_datos', '--hasta', '2026-01-31', productos=30, racks=3, proveedores=4, areas=2,
+            documentos=120, dias=10, semilla=7, prefijo=prefijo, lote=50, stdout=io.StringIO()
+        )
+        return MovimientoInventario.objects.filter(producto__codigo_producto__startswith=f"{prefijo}-")
+
+    def test_kardex_encadenado_y_stock_final(self):
+        movimientos = self._generar('A')
+        self.assertTrue(Despacho.objects.exists())
+        self.assertTrue(Recepcion.objects.exists())
+        saldos = {}
+        for mov in movimientos.order_by('fecha_hora', 'id'):
+            self.assertEqual(mov.stock_anterior, saldos.get(mov.producto_id, 0))
+            self.assertEqual(mov.stock_nuevo, mov.stock_anterior + mov.cantidad)
+            self.assertGreaterEqual(mov.stock_nuevo, 0)
+            saldos[mov.producto_id] = mov.stock_nuevo
+        for producto in Producto.objects.filter(pk__in=saldos):
+            self.assertEqual(producto.cantidad_stock, saldos[producto.pk])
+
+        fechas = movimientos.order_by('fecha_hora').values_list('fecha_hora', flat=True)
+        self.assertEqual(fechas.first().date(), date(2026, 1, 22))
+        self.assertEqual(fechas.last().date(), date(2026, 1, 31))
+        # El índice de búsqueda se reconstruye al final de la carga
+        palabra = Producto.objects.filter(pk__startswith='A-').first().nombre.split()[0]
+        self.assertTrue(buscar_productos(Producto.objects.all(), palabra).exists())
+
+    def test_misma_semilla_mismos_datos(self):
+        primero = list(self._generar('A').order_by('id').values_list('tipo_movimiento', 'cantidad', 'fecha_hora'))
+        segundo = list(self._generar('B').order_by('id').values_list('tipo_movimiento', 'cantidad', 'fecha_hora'))
+        self.assertEqual(primero, segundo)
+
+
+class PruebasBenchmarkVistas(TestCase):
+
+    def _resultados(self, segundos, consultas, memoria_kb):
+        return {'escala': 'pequena', 'casos': {'lista_stock': {
+            'segundos': segundos, 'consultas': consultas, 'memoria_pico_kb': memoria_kb
+        }}}
+
+    def test_detecta_regresiones_sobre_el_umbral(self):
+        base = self._resultados(0.100, 5, 1000)
+        self.assertEqual(comparar_con_base(self._resultados(0.115, 5, 1100), base, 0.2, 0.005), [])
+        regresiones = comparar_con_base(self._resultados(0.200, 6, 2000), base, 0.2, 0.005)
+        self.assertEqual(len(regresiones), 3)
+        self.assertIn('5 -> 6 consultas', regresiones[0])
+
+    def test_ignora_ruido_de_pocos_milisegundos(self):
+        base = self._resultados(0.002, 5, 100)
+        self.assertEqual(comparar_con_base(self._resultados(0.004, 5, 150), base, 0.2, 0.005), [])
+
+
+@override_settings(BODEGA_PDF_PRECALENTAR=False, BODEGA_SQL_MUESTREO=0)
+class PruebasPresupuestoConsultas(TestCase):
+    """
+    Fija cuántas consultas SQL hace cada URL de bodega/urls.py. Cada
+    presupuesto se comprueba con dos tamaños de datos: si una vista hace una
+    consulta por fila (N+1), el segundo tamaño la hace fallar. Los tamaños
+    quedan bajo los bloques de las exportaciones y lotes de PDF, que sí
+    crecen (a propósito) con una consulta cada TAMANO_LOTE_PDF documentos.
+    """
+    TAMANOS = ({'productos': 6, 'documentos': 10}, {'productos': 30, 'documentos': 40})
+
+    # Incluyen la sesión y el usuario de cada petición; las altas (POST)
+    # cuentan el registro completo del documento con una línea.
+    PRESUPUESTOS = {
+        'dashboard': 9,
+        'lista_stock': 4,
+        'agregar_producto': 4,
+        'editar_producto': 5,
+        'eliminar_producto': 3,
+        'historial_producto': 5,
+        'exportar_historial_producto': 4,
+        'generar_qr_producto': 3,
+        'imagen_qr_producto': 3,
+        'etiquetas_qr': 3,
+        'exportar_stock_excel': 3,
+        'exportar_stock_a_fecha': 4,
+        'lista_proveedores': 4,
+        'agregar_proveedor': 2,
+        'editar_proveedor': 3,
+        'eliminar_proveedor': 3,
+        'lista_racks': 4,
+        'agregar_rack': 2,
+        'editar_rack': 3,
+        'eliminar_rack': 3,
+        'lista_areas': 4,
+        'agregar_area': 2,
+        'editar_area': 3,
+        'eliminar_area': 3,
+        'agregar_recepcion': 13,
+        'agregar_despacho': 13,
+        'reporte_recepciones': 4,
+        'exportar_recepciones': 3,
+        'exportar_recepciones_pdf': 5,
+        'detalle_recepcion': 4,
+        'generar_recepcion_pdf': 4,
+        'reporte_despachos': 4,
+        'exportar_despachos': 3,
+        'exportar_despachos_pdf': 5,
+        'detalle_despacho': 4,
+        'generar_despacho_pdf': 4,
+        'ajax_agregar_proveedor': 4,
+        'ajax_get_stock': 3,
+        'ajax_stock_productos': 3,
+        'ajax_stock_en_vivo': 3,
+        'ajax_buscar_productos': 3,
+        'ajax_movimientos_por_dia': 4,
+        'ajax_dashboard_datos': 8,
+        'lista_usuarios': 4,
+        'crear_usuario': 2,
+        'editar_usuario': 5,
+        'audit_log': 3,
+        'metricas': 2,
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='password123')
+        self.client.force_login(self.admin)
+        for ajuste in ('BODEGA_PDF_CACHE_DIR', 'BODEGA_QR_CACHE_DIR'):
+            directorio = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directorio, True)
+            ajustes = self.settings(**{ajuste: directorio})
+            ajustes.enable()
+            self.addCleanup(ajustes.disable)
+
+    def _poblar(self, numero, tamano):
+        generador = GeneradorDatos(semilla=numero, prefijo=f'T{numero}', dias=30)
+        generador.generar_catalogo(tamano['productos'], racks=3, proveedores=3, areas=3, usuarios=tamano['productos'] // 3)
+        generador.generar_documentos(tamano['documentos'])
+        generador.generar_auditoria(tamano['documentos'])
+        finalizar_carga()
+        # Cada tamaño empieza sin PDFs ni QR en disco
+        for directorio in (directorio_pdfs(), directorio_qr()):
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    def _peticiones(self):
+        """Una petición por URL, sobre los objetos más cargados de la base actual."""
+        c = self.client
+        producto = (
+            MovimientoInventario.objects.values('producto').annotate(total=Count('id'))
+            .order_by('-total', 'producto').values_list('producto', flat=True).first()
+        )
+        despacho = Despacho.objects.annotate(lineas=Count('items')).order_by('-lineas', 'pk').first().pk
+        recepcion = Recepcion.objects.annotate(lineas=Count('items')).order_by('-lineas', 'pk').first().pk
+        proveedor = Proveedor.objects.order_by('pk').first().pk
+        rack = Rack.objects.order_by('pk').first().pk
+        area = Area.objects.order_by('pk').first().pk
+        hoy = timezone.localdate()
+        rango = {'start_date': str(hoy - timedelta(days=30)), 'end_date': str(hoy)}
+        codigos = list(Producto.objects.order_by('pk').values_list('pk', flat=True)[:20])
+        linea = {'items-TOTAL_FORMS': '1', 'items-INITIAL_FORMS': '0', 'items-0-producto': producto, 'items-0-cantidad': '1'}
+
+        return {
+            'dashboard': lambda: c.get(reverse('dashboard')),
+            'lista_stock': lambda: c.get(reverse('lista_stock')),
+            'agregar_producto': lambda: c.get(reverse('agregar_producto')),
+            'editar_producto': lambda: c.get(reverse('editar_producto', args=[producto])),
+            'eliminar_producto': lambda: c.get(reverse('eliminar_producto', args=[producto])),
+            'historial_producto': lambda: c.get(reverse('historial_producto', args=[producto])),
+            'exportar_historial_producto': lambda: c.get(reverse('exportar_historial_producto', args=[producto])),
+            'generar_qr_producto': lambda: c.get(reverse('generar_qr_producto', args=[producto])),
+            'imagen_qr_producto': lambda: c.get(reverse('imagen_qr_producto', args=[producto, 'svg'])),
+            'etiquetas_qr': lambda: c.get(reverse('etiquetas_qr'), {'rack': rack}),
+            'exportar_stock_excel': lambda: c.get(reverse('exportar_stock_excel')),
+            'exportar_stock_a_fecha': lambda: c.get(reverse('exportar_stock_a_fecha'), {'fecha': str(hoy)}),
+            'lista_proveedores': lambda: c.get(reverse('lista_proveedores')),
+            'agregar_proveedor': lambda: c.get(reverse('agregar_proveedor')),
+            'editar_proveedor': lambda: c.get(reverse('editar_proveedor', args=[proveedor])),
+            'eliminar_proveedor': lambda: c.get(reverse('eliminar_proveedor', args=[proveedor])),
+            'lista_racks': lambda: c.get(reverse('lista_racks')),
+            'agregar_rack': lambda: c.get(reverse('agregar_rack')),
+            'editar_rack': lambda: c.get(reverse('editar_rack', args=[rack])),
+            'eliminar_rack': lambda: c.get(reverse('eliminar_rack', args=[rack])),
+            'lista_areas': lambda: c.get(reverse('lista_areas')),
+            'agregar_area': lambda: c.get(reverse('agregar_area')),
+            'editar_area': lambda: c.get(reverse('editar_area', args=[area])),
+            'eliminar_area': lambda: c.get(reverse('eliminar_area', args=[area])),
+            'agregar_recepcion': lambda: c.post(reverse('agregar_recepcion'), {'proveedor': proveedor, **linea}),
+            'agregar_despacho': lambda: c.post(
+                reverse('agregar_despacho'), {'usuario_solicitante': 'Presupuesto', 'area': area, **linea}
+            ),
+            'reporte_recepciones': lambda: c.get(reverse('reporte_recepciones')),
+            'exportar_recepciones': lambda: c.get(reverse('exportar_recepciones')),
+            'detalle_recepcion': lambda: c.get(reverse('detalle_recepcion', args=[recepcion])),
+            'generar_recepcion_pdf': lambda: c.get(reverse('generar_recepcion_pdf', args=[recepcion])),
+            # El lote va después del PDF individual, que así se mide sin caché
+            'exportar_recepciones_pdf': lambda: c.get(reverse('exportar_recepciones_pdf'), rango),
+            'reporte_despachos': lambda: c.get(reverse('reporte_despachos')),
+            'exportar_despachos': lambda: c.get(reverse('exportar_despachos')),
+            'detalle_despacho': lambda: c.get(reverse('detalle_despacho', args=[despacho])),
+            'generar_despacho_pdf': lambda: c.get(reverse('generar_despacho_pdf', args=[despacho])),
+            'exportar_despachos_pdf': lambda: c.get(reverse('exportar_despachos_pdf'), rango),
+            'ajax_agregar_proveedor': lambda: c.post(reverse('ajax_agregar_proveedor'), {'nombre': f'Nuevo {len(codigos)}'}),
+            'ajax_get_stock': lambda: c.get(reverse('ajax_get_stock'), {'codigo_producto': producto}),
+            'ajax_stock_productos': lambda: c.get(reverse('ajax_stock_productos'), {'codigo': codigos}),
+            'ajax_stock_en_vivo': lambda: c.get(reverse('ajax_stock_en_vivo'), {'producto': codigos}),
+            'ajax_buscar_productos': lambda: c.get(reverse('ajax_buscar_productos'), {'q': 'a'}),
+            'ajax_movimientos_por_dia': lambda: c.get(reverse('ajax_movimientos_por_dia'), rango),
+            'ajax_dashboard_datos': lambda: c.get(reverse('ajax_dashboard_datos')),
+            'lista_usuarios': lambda: c.get(reverse('lista_usuarios')),
+            'crear_usuario': lambda: c.get(reverse('crear_usuario')),
+            'editar_usuario': lambda: c.get(reverse('editar_usuario', args=[self.admin.pk])),
+            'audit_log': lambda: c.get(reverse('audit_log')),
+            'metricas': lambda: c.get(reverse('metricas')),
+        }
+
+    def test_todas_las_urls_tienen_presupuesto(self):
+        nombres = {patron.name for patron in urls_bodega.urlpatterns}
+        self.assertEqual(set(self.PRESUPUESTOS), nombres)
+        self._poblar(0, self.TAMANOS[0])
+        self.assertEqual(set(self._peticiones()), nombres)
+
+    def test_consultas_no_crecen_con_los_datos(self):
+        for numero, tamano in enumerate(self.TAMANOS):
+            self._poblar(numero, tamano)
+            for nombre, peticion in self._peticiones().items():
+                with self.subTest(vista=nombre, tamano=tamano):
+                    # Caché fría: se cuentan también las consultas que la caché esconde
+                    cache.clear()
+                    with self.assertNumQueries(self.PRESUPUESTOS[nombre]):
+                        respuesta = peticion()
+                        if respuesta.streaming and not respuesta.is_async:
+                            for _ in respuesta.streaming_content:
+                                pass
+                    respuesta.close()
+                    self.assertIn(respuesta.status_code, (200, 201, 302))
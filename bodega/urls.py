@@ -13,10 +13,14 @@ urlpatterns = [
     path('producto/editar/<str:pk>/', views.editar_producto, name='editar_producto'),
     path('producto/eliminar/<str:pk>/', views.eliminar_producto, name='eliminar_producto'),
     path('producto/<str:pk>/historial/', views.historial_producto, name='historial_producto'),
+    path('producto/<str:pk>/historial/exportar/', views.exportar_historial_producto, name='exportar_historial_producto'),
     path('producto/<str:pk>/qr/', views.generar_qr_producto, name='generar_qr_producto'),
+    path('producto/<str:pk>/qr/<str:formato>/', views.imagen_qr_producto, name='imagen_qr_producto'),
+    path('etiquetas/', views.etiquetas_qr, name='etiquetas_qr'),
     
     # --- URLs de Utilidades/Exportación ---
     path('stock/exportar/', views.exportar_stock_excel, name='exportar_stock_excel'),
+    path('stock/a-fecha/exportar/', views.exportar_stock_a_fecha, name='exportar_stock_a_fecha'),
 
     # --- URLs para Proveedores ---
     path('proveedores/', views.lista_proveedores, name='lista_proveedores'),
@@ -42,18 +46,26 @@ urlpatterns = [
 
     # --- URLs para Reportes Recepciones---
     path('reportes/recepciones/', views.reporte_recepciones, name='reporte_recepciones'),
+    path('reportes/recepciones/exportar/', views.exportar_recepciones, name='exportar_recepciones'),
+    path('reportes/recepciones/exportar/pdf/', views.exportar_recepciones_pdf, name='exportar_recepciones_pdf'),
     path('reportes/recepciones/<int:pk>/', views.detalle_recepcion, name='detalle_recepcion'),
     path('reportes/recepciones/<int:pk>/pdf/', views.generar_recepcion_pdf, name='generar_recepcion_pdf'),
 
     # --- URLs para Reportes Despachos ---
     path('reportes/despachos/', views.reporte_despachos, name='reporte_despachos'),
+    path('reportes/despachos/exportar/', views.exportar_despachos, name='exportar_despachos'),
+    path('reportes/despachos/exportar/pdf/', views.exportar_despachos_pdf, name='exportar_despachos_pdf'),
     path('reportes/despachos/<int:pk>/', views.detalle_despacho, name='detalle_despacho'),
     path('reportes/despachos/<int:pk>/pdf/', views.generar_despacho_pdf, name='generar_despacho_pdf'),
     
     # --- URLs para AJAX ---
     path('ajax/agregar_proveedor/', views.agregar_proveedor_ajax, name='ajax_agregar_proveedor'),
     path('ajax/get_stock/', views.get_stock_producto_ajax, name='ajax_get_stock'),
+    path('ajax/stock/', views.stock_productos_ajax, name='ajax_stock_productos'),
+    path('ajax/stock/en-vivo/', views.stock_en_vivo, name='ajax_stock_en_vivo'),
     path('ajax/buscar-productos/', views.buscar_productos_ajax, name='ajax_buscar_productos'),
+    path('ajax/movimientos-por-dia/', views.movimientos_por_dia_ajax, name='ajax_movimientos_por_dia'),
+    path('ajax/dashboard/', views.dashboard_datos_ajax, name='ajax_dashboard_datos'),
 
     # --- QR Code Scanning ---
     #path('ajax/get_producto_details/<str:codigo_producto>/', views.get_producto_details_ajax, name='ajax_get_producto_details'),
@@ -65,4 +77,7 @@ urlpatterns = [
 
     # --- URLs para Registro de Auditoría ---
     path('admin/audit-log/', views.audit_log_view, name='audit_log'),
+
+    # --- Métricas (Prometheus) ---
+    path('metricas/', views.metricas, name='metricas'),
 ]
\ No newline at end of file
@@ -1,26 +1,26 @@
 # bodega/views.py
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Q, F, Count
+from django.db.models import Q, F
 from django.db import transaction
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from django.core.paginator import Paginator
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User, Group
-from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from datetime import datetime, timedelta
+from functools import partial
+import asyncio
+import hashlib
+import hmac
+import json
 
 
 # Librerías de terceros
-from openpyxl import Workbook
-import qrcode
-import io
-import base64
-from weasyprint import HTML
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.models import User, Group
 
@@ -38,6 +38,23 @@ from .forms import (
     CustomUserCreationForm, CustomUserChangeForm
 )
 
+# Servicios locales
+from .cache import obtener_widgets_dashboard, aobtener_widgets_dashboard, aconsultar_stock
+from .difusion import Suscripcion, obtener_difusor, aeventos_stock
+from .exports import iterar_en_bloques, formato_solicitado, respuesta_exportacion, RespuestaStreaming, RespuestaArchivo
+from .snapshots import productos_con_stock_a_fecha, amovimientos_por_dia
+from .paginacion import paginar_por_cursor
+from .archivo import lector_kardex, lector_auditoria
+from .busqueda import buscar_productos
+from .autocompletado import indice_autocompletado
+from .etiquetas import FORMATOS_QR, clave_qr, ruta_qr, obtener_qr, productos_para_etiquetas, hoja_etiquetas
+from .metricas import registro as registro_metricas
+from .pdfs import obtener_pdf, renderizar_lote, generar_zip, unir_pdfs, consulta_documentos, documentos_en_rango
+from .services import (
+    registrar_recepcion, registrar_despacho,
+    StockInsuficienteError, ConflictoConcurrenciaError
+)
+
 # ==============================================================================
 # Vistas de Autenticación
 # ==============================================================================
@@ -72,47 +89,23 @@ def dashboard(request):
     start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
     end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
 
-    # Queries para las tarjetas de estadísticas
-    num_productos = Producto.objects.count()
-    num_proveedores = Proveedor.objects.count()
-    
-    # Lógica para la tarjeta/lista de stock bajo
-    productos_stock_bajo_lista = Producto.objects.filter(
-        cantidad_stock__lte=F('stock_minimo'), 
-        stock_minimo__gt=0
-    ).order_by('cantidad_stock')[:5]
-    productos_stock_bajo_count = Producto.objects.filter(cantidad_stock__lte=F('stock_minimo'), stock_minimo__gt=0).count()
-
-    # Query para la actividad reciente (respeta el filtro de fecha)
-    movimientos = MovimientoInventario.objects.all()
+    # Tarjetas, stock bajo y gráficos salen de la caché de agregados
+    # (se invalida cuando cambia el stock o el catálogo)
+    context = obtener_widgets_dashboard()
+
+    # Query para la actividad reciente (respeta el filtro de fecha, siempre en vivo)
+    movimientos = MovimientoInventario.objects.select_related('producto')
     if start_date:
         movimientos = movimientos.filter(fecha_hora__gte=start_date)
     if end_date:
         movimientos = movimientos.filter(fecha_hora__lt=end_date + timedelta(days=1))
     ultimos_movimientos = movimientos.order_by('-fecha_hora')[:5]
 
-    # Queries para los gráficos (estos no se filtran por fecha para mostrar una vista general)
-    productos_top_stock = Producto.objects.filter(cantidad_stock__gt=0).order_by('-cantidad_stock')[:10]
-    chart_labels = [p.nombre for p in productos_top_stock]
-    chart_data = [p.cantidad_stock for p in productos_top_stock]
-    
-    productos_por_categoria = Producto.objects.filter(categoria__isnull=False, categoria__gt='').values('categoria').annotate(total=Count('categoria')).order_by('-total')
-    pie_chart_labels = [item['categoria'] for item in productos_por_categoria]
-    pie_chart_data = [item['total'] for item in productos_por_categoria]
-
-    context = {
-        'num_productos': num_productos,
-        'num_proveedores': num_proveedores,
-        'productos_stock_bajo_count': productos_stock_bajo_count,
-        'productos_stock_bajo_lista': productos_stock_bajo_lista,
+    context.update({
         'ultimos_movimientos': ultimos_movimientos,
-        'chart_labels': chart_labels,
-        'chart_data': chart_data,
-        'pie_chart_labels': pie_chart_labels,
-        'pie_chart_data': pie_chart_data,
         'start_date': start_date_str,
         'end_date': end_date_str,
-    }
+    })
     return render(request, 'bodega/dashboard.html', context)
 
 # ==============================================================================
@@ -125,7 +118,7 @@ def lista_stock(request):
     filtro_stock_bajo = request.GET.get('filtro')
     lista_productos = Producto.objects.select_related('ubicacion_rack', 'proveedor').all().order_by('nombre')
     if query:
-        lista_productos = lista_productos.filter(Q(nombre__icontains=query) | Q(codigo_producto__icontains=query))
+        lista_productos = buscar_productos(lista_productos, query).order_by('-relevancia', 'nombre')
     if filtro_stock_bajo == 'stock_bajo':
         lista_productos = lista_productos.filter(cantidad_stock__lte=F('stock_minimo'), stock_minimo__gt=0)
     
@@ -150,16 +143,24 @@ def agregar_producto(request):
 
 @permission_required('bodega.change_producto', login_url='dashboard')
 def editar_producto(request, pk):
-    producto = get_object_or_404(Producto, pk=pk)
+    conflicto = False
     if request.method == 'POST':
+        producto = get_object_or_404(Producto, pk=pk)
         form = ProductoForm(request.POST, instance=producto)
         if form.is_valid():
-            form.save()
-            messages.success(request, f'¡Producto "{producto.nombre}" actualizado exitosamente!')
-            return redirect('lista_stock')
+            try:
+                form.save()
+            except ConflictoConcurrenciaError:
+                # Se vuelve a mostrar el producto vigente (stock y versión actuales)
+                form = ProductoForm(instance=get_object_or_404(Producto, pk=pk))
+                conflicto = True
+            else:
+                messages.success(request, f'¡Producto "{producto.nombre}" actualizado exitosamente!')
+                return redirect('lista_stock')
     else:
+        producto = get_object_or_404(Producto, pk=pk)
         form = ProductoForm(instance=producto)
-    context = {'form': form, 'titulo': f'Editar Producto'}
+    context = {'form': form, 'titulo': f'Editar Producto', 'conflicto': conflicto}
     return render(request, 'bodega/agregar_producto.html', context)
 
 @permission_required('bodega.delete_producto', login_url='dashboard')
@@ -175,8 +176,12 @@ def eliminar_producto(request, pk):
 @login_required
 def historial_producto(request, pk):
     producto = get_object_or_404(Producto, pk=pk)
-    movimientos = MovimientoInventario.objects.filter(producto=producto).order_by('-fecha_hora')
-    context = {'producto': producto, 'movimientos': movimientos}
+    movimientos = paginar_por_cursor(
+        MovimientoInventario.objects.filter(producto=producto),
+        despues=request.GET.get('despues'), antes=request.GET.get('antes'), tamano=50,
+        archivo=lector_kardex(producto)
+    )
+    context = {'producto': producto, 'movimientos': movimientos, 'pagina': movimientos}
     return render(request, 'bodega/historial_producto.html', context)
 
 # ==============================================================================
@@ -352,8 +357,15 @@ def eliminar_area(request, pk):
 # Vistas para Movimientos
 # ==============================================================================
 
+def _lineas_formset(formset):
+    """Extrae las líneas (producto, cantidad) válidas de un formset de ítems."""
+    return [
+        (item_form.cleaned_data['producto'], item_form.cleaned_data['cantidad'])
+        for item_form in formset
+        if item_form.cleaned_data
+    ]
+
 @permission_required('bodega.add_recepcion', login_url='dashboard')
-@transaction.atomic
 def agregar_recepcion(request):
     if request.method == 'POST':
         form = RecepcionForm(request.POST)
@@ -361,23 +373,14 @@ def agregar_recepcion(request):
         if form.is_valid() and formset.is_valid():
             recepcion = form.save(commit=False)
             recepcion.usuario_registra = request.user
-            recepcion.save()
-            for item_form in formset:
-                if item_form.cleaned_data:
-                    item = item_form.save(commit=False)
-                    item.recepcion = recepcion
-                    item.save()
-                    producto = item.producto
-                    stock_anterior = producto.cantidad_stock
-                    producto.cantidad_stock += item.cantidad
-                    producto.save()
-                    MovimientoInventario.objects.create(
-                        producto=producto, tipo_movimiento='Recepción', cantidad=item.cantidad,
-                        stock_anterior=stock_anterior, stock_nuevo=producto.cantidad_stock,
-                        referencia=f"Recepción ID: {recepcion.id}"
-                    )
-            messages.success(request, '¡Recepción registrada exitosamente! El stock ha sido actualizado.')
-            return redirect('lista_stock')
+            lineas = [(producto.pk, cantidad) for producto, cantidad in _lineas_formset(formset)]
+            try:
+                registrar_recepcion(recepcion, lineas)
+            except ConflictoConcurrenciaError:
+                messages.error(request, 'Hay mucha actividad sobre estos productos. Intente guardar nuevamente.')
+            else:
+                messages.success(request, '¡Recepción registrada exitosamente! El stock ha sido actualizado.')
+                return redirect('lista_stock')
     else:
         form = RecepcionForm()
         formset = ItemRecepcionFormSet()
@@ -385,75 +388,38 @@ def agregar_recepcion(request):
     return render(request, 'bodega/agregar_recepcion.html', context)
 
 @permission_required('bodega.add_despacho', login_url='dashboard')
-@transaction.atomic
 def agregar_despacho(request):
     if request.method == 'POST':
         form = DespachoForm(request.POST)
         formset = ItemDespachoFormSet(request.POST)
         if form.is_valid() and formset.is_valid():
-            # ... (validación de stock sin cambios) ...
-
             despacho = form.save(commit=False)
             despacho.usuario_registra = request.user
-            despacho.save()
-
-            for item_form in formset:
-                if item_form.cleaned_data:
-                    item = item_form.save(commit=False)
-                    item.despacho = despacho
-                    item.save()
-
-                    producto = item.producto
-                    stock_anterior = producto.cantidad_stock
-                    
-                    producto.cantidad_stock -= item.cantidad
-                    producto.save()
-
-                    MovimientoInventario.objects.create(
-                        producto=producto, tipo_movimiento='Despacho', cantidad=-item.cantidad,
-                        stock_anterior=stock_anterior, stock_nuevo=producto.cantidad_stock,
-                        referencia=f"Despacho ID: {despacho.id}"
-                    )
-
-                    # --- INICIO DE LA NUEVA LÓGICA DE NOTIFICACIÓN ---
-                    # Comprobamos si el stock ha caído por debajo del mínimo
-                    if producto.stock_minimo > 0 and producto.cantidad_stock <= producto.stock_minimo:
-                        # Buscamos a todos los usuarios que pertenecen al grupo 'Administradores'
-                        try:
-                            admin_group = Group.objects.get(name='Administradores')
-                            admin_users = admin_group.user_set.all()
-                            
-                            # Obtenemos una lista de sus correos electrónicos
-                            recipient_list = [user.email for user in admin_users if user.email]
-
-                            if recipient_list:
-                                subject = f"Alerta de Stock Bajo: {producto.nombre}"
-                                message = f"""
-                                Hola,
-                                
-                                El stock del producto '{producto.nombre}' (Código: {producto.codigo_producto}) ha caído por debajo del mínimo establecido.
-                                
-                                Stock Actual: {producto.cantidad_stock}
-                                Stock Mínimo: {producto.stock_minimo}
-                                
-                                La acción fue registrada por: {request.user.username}
-                                
-                                Por favor, revise el inventario.
-                                
-                                - Sistema de Bodega RMC
-                                """
-                                email_from = settings.EMAIL_HOST_USER # O una dirección por defecto
-                                
-                                send_mail(subject, message, email_from, recipient_list)
-                                messages.warning(request, f'¡Alerta! El stock de "{producto.nombre}" es bajo. Se ha enviado una notificación.')
-
-                        except Group.DoesNotExist:
-                            # En caso de que el grupo 'Administradores' no exista
-                            pass
-                    # --- FIN DE LA LÓGICA DE NOTIFICACIÓN ---
-
-            messages.success(request, '¡Despacho registrado exitosamente!')
-            return redirect('lista_stock')
+            lineas_formset = _lineas_formset(formset)
+            try:
+                stock_final = registrar_despacho(
+                    despacho, [(producto.pk, cantidad) for producto, cantidad in lineas_formset]
+                )
+            except StockInsuficienteError as e:
+                # Marcamos el error en cada fila cuyo producto no alcanza
+                for item_form in formset:
+                    producto = item_form.cleaned_data.get('producto') if item_form.cleaned_data else None
+                    if producto and producto.pk in e.faltantes:
+                        item_form.add_error(
+                            'cantidad', f'Stock insuficiente. Disponible: {e.faltantes[producto.pk]}'
+                        )
+            except ConflictoConcurrenciaError:
+                messages.error(request, 'Hay mucha actividad sobre estos productos. Intente guardar nuevamente.')
+            else:
+                # Las alertas por correo quedan en la bandeja de salida
+                # (NotificacionPendiente) y las envía `enviar_notificaciones`.
+                productos = {producto.pk: producto for producto, _ in lineas_formset}
+                for producto in productos.values():
+                    if producto.stock_minimo > 0 and stock_final[producto.pk] <= producto.stock_minimo:
+                        messages.warning(request, f'¡Alerta! El stock de "{producto.nombre}" es bajo. Se notificará a los administradores.')
+
+                messages.success(request, '¡Despacho registrado exitosamente!')
+                return redirect('lista_stock')
     else:
         form = DespachoForm()
         formset = ItemDespachoFormSet()
@@ -465,16 +431,21 @@ def agregar_despacho(request):
 # Vistas para Reportes
 # ==============================================================================
 
+def _filtrar_por_fechas(queryset, campo, start_date_str, end_date_str):
+    """Aplica el filtro `start_date`/`end_date` (ambos inclusive) sobre `campo`."""
+    if start_date_str:
+        queryset = queryset.filter(**{f'{campo}__gte': start_date_str})
+    if end_date_str:
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+        queryset = queryset.filter(**{f'{campo}__lt': end_date + timedelta(days=1)})
+    return queryset
+
 @login_required
 def reporte_recepciones(request):
     start_date_str = request.GET.get('start_date')
     end_date_str = request.GET.get('end_date')
     queryset = Recepcion.objects.select_related('proveedor', 'usuario_registra').all().order_by('-fecha_recepcion')
-    if start_date_str:
-        queryset = queryset.filter(fecha_recepcion__gte=start_date_str)
-    if end_date_str:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        queryset = queryset.filter(fecha_recepcion__lt=end_date + timedelta(days=1))
+    queryset = _filtrar_por_fechas(queryset, 'fecha_recepcion', start_date_str, end_date_str)
     paginator = Paginator(queryset, 15)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -483,31 +454,20 @@ def reporte_recepciones(request):
 
 @login_required
 def detalle_recepcion(request, pk):
-    recepcion = get_object_or_404(Recepcion, pk=pk)
+    recepcion = get_object_or_404(consulta_documentos('recepcion'), pk=pk)
     context = {'recepcion': recepcion}
     return render(request, 'bodega/detalle_recepcion.html', context)
 
 @login_required
 def generar_recepcion_pdf(request, pk):
-    recepcion = get_object_or_404(Recepcion, pk=pk)
-    template = get_template('bodega/pdf/recepcion_pdf.html')
-    context = {'recepcion': recepcion}
-    html_string = template.render(context)
-    pdf = HTML(string=html_string).write_pdf()
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="recepcion_{recepcion.id}.pdf"'
-    return response
+    return _respuesta_pdf(request, 'recepcion', pk)
 
 @login_required
 def reporte_despachos(request):
     start_date_str = request.GET.get('start_date')
     end_date_str = request.GET.get('end_date')
     queryset = Despacho.objects.select_related('area', 'usuario_registra').all().order_by('-fecha_despacho')
-    if start_date_str:
-        queryset = queryset.filter(fecha_despacho__gte=start_date_str)
-    if end_date_str:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        queryset = queryset.filter(fecha_despacho__lt=end_date + timedelta(days=1))
+    queryset = _filtrar_por_fechas(queryset, 'fecha_despacho', start_date_str, end_date_str)
     paginator = Paginator(queryset, 15)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -516,7 +476,7 @@ def reporte_despachos(request):
 
 @login_required
 def detalle_despacho(request, pk):
-    despacho = get_object_or_404(Despacho, pk=pk)
+    despacho = get_object_or_404(consulta_documentos('despacho'), pk=pk)
     context = {'despacho': despacho}
     return render(request, 'bodega/detalle_despacho.html', context)
 
@@ -525,64 +485,227 @@ def generar_despacho_pdf(request, pk):
     """
     Genera un comprobante en PDF para un despacho específico.
     """
-    # 1. Obtener los datos
-    despacho = get_object_or_404(Despacho, pk=pk)
-    
-    # 2. Renderizar la plantilla HTML a un string
-    template = get_template('bodega/pdf/despacho_pdf.html')
-    context = {'despacho': despacho}
-    html_string = template.render(context)
-    
-    # 3. Crear el PDF en memoria
-    pdf = HTML(string=html_string).write_pdf()
-    
-    # 4. Crear una respuesta HTTP con el PDF
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="despacho_{despacho.id}.pdf"'
-    
+    return _respuesta_pdf(request, 'despacho', pk)
+
+def _respuesta_pdf(request, tipo, pk):
+    """
+    Sirve el comprobante desde la caché de PDFs (ver bodega/pdfs.py). Como el
+    documento no cambia, el navegador puede revalidar con ETag/Last-Modified
+    y recibir un 304 sin volver a descargarlo.
+    """
+    ruta = obtener_pdf(tipo, pk)
+    if ruta is None:
+        raise Http404
+    etag = f'"{ruta.stem}"'
+    ultima_modificacion = ruta.stat().st_mtime
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = FileResponse(
+            open(ruta, 'rb'), as_attachment=True, filename=f"{tipo}_{pk}.pdf", content_type='application/pdf'
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_modificacion)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@login_required
+def exportar_despachos_pdf(request):
+    return _respuesta_lote_pdf(request, 'despacho')
+
+@login_required
+def exportar_recepciones_pdf(request):
+    return _respuesta_lote_pdf(request, 'recepcion')
+
+# Un rango más largo se genera fuera de la petición con el comando
+# `generar_comprobantes_pdf`.
+MAX_DIAS_LOTE_PDF = 31
+
+def _respuesta_lote_pdf(request, tipo):
+    """
+    Descarga todos los comprobantes del período (start_date/end_date,
+    obligatorios y de hasta MAX_DIAS_LOTE_PDF días): un ZIP que se va
+    enviando mientras se generan (`format=zip`, por defecto) o un único PDF
+    unido (`format=pdf`). Ver `renderizar_lote` en bodega/pdfs.py.
+    """
+    formato = formato_solicitado(request, por_defecto='zip')
+    if formato not in ('zip', 'pdf'):
+        return HttpResponseBadRequest("Formato no soportado. Use: zip, pdf")
+    try:
+        desde = datetime.strptime(request.GET.get('start_date', ''), '%Y-%m-%d').date()
+        hasta = datetime.strptime(request.GET.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponseBadRequest("start_date y end_date son obligatorios (AAAA-MM-DD).")
+    if not 0 <= (hasta - desde).days < MAX_DIAS_LOTE_PDF:
+        return HttpResponseBadRequest(
+            f"El período debe tener entre 1 y {MAX_DIAS_LOTE_PDF} días. "
+            "Para rangos mayores use el comando generar_comprobantes_pdf."
+        )
+    documentos = renderizar_lote(tipo, documentos_en_rango(tipo, desde, hasta))
+    nombre_base = f"comprobantes_{tipo}"
+
+    if formato == 'pdf':
+        return RespuestaArchivo(
+            unir_pdfs(documentos), as_attachment=True, filename=f"{nombre_base}.pdf", content_type='application/pdf'
+        )
+    response = RespuestaStreaming(generar_zip(tipo, documentos), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_base}.zip"'
     return response
 
+# ==============================================================================
+# Vistas para Exportación de Reportes
+# ==============================================================================
+# Cada exportación recorre las líneas (ítems o movimientos) con un único JOIN
+# por bloque hacia la cabecera y sus catálogos, y respeta los mismos filtros
+# start_date/end_date que la pantalla del reporte.
+
+@login_required
+def exportar_despachos(request):
+    headers = ['Despacho', 'Fecha', 'Área de Destino', 'Usuario Solicitante', 'Registrado por', 'Motivo', 'Código Producto', 'Producto', 'Cantidad']
+    claves = ['despacho', 'fecha', 'area', 'usuario_solicitante', 'usuario_registra', 'motivo', 'codigo_producto', 'producto', 'cantidad']
+    campos = [
+        'despacho_id', 'despacho__fecha_despacho', 'despacho__area__nombre', 'despacho__usuario_solicitante',
+        'despacho__usuario_registra__username', 'despacho__motivo', 'producto_id', 'producto__nombre', 'cantidad',
+    ]
+    items = _filtrar_por_fechas(
+        DespachoItem.objects.all(), 'despacho__fecha_despacho',
+        request.GET.get('start_date'), request.GET.get('end_date')
+    )
+    return respuesta_exportacion(
+        formato_solicitado(request), 'reporte_despachos', 'Despachos', headers, claves,
+        iterar_en_bloques(items, campos)
+    )
+
+@login_required
+def exportar_recepciones(request):
+    headers = ['Recepción', 'Fecha', 'Proveedor', 'N° Orden de Compra', 'Registrado por', 'Código Producto', 'Producto', 'Cantidad']
+    claves = ['recepcion', 'fecha', 'proveedor', 'documento_referencia', 'usuario_registra', 'codigo_producto', 'producto', 'cantidad']
+    campos = [
+        'recepcion_id', 'recepcion__fecha_recepcion', 'recepcion__proveedor__nombre', 'recepcion__documento_referencia',
+        'recepcion__usuario_registra__username', 'producto_id', 'producto__nombre', 'cantidad',
+    ]
+    items = _filtrar_por_fechas(
+        RecepcionItem.objects.all(), 'recepcion__fecha_recepcion',
+        request.GET.get('start_date'), request.GET.get('end_date')
+    )
+    return respuesta_exportacion(
+        formato_solicitado(request), 'reporte_recepciones', 'Recepciones', headers, claves,
+        iterar_en_bloques(items, campos)
+    )
+
+@login_required
+def exportar_historial_producto(request, pk):
+    producto = get_object_or_404(Producto, pk=pk)
+    headers = ['Fecha y Hora', 'Tipo de Movimiento', 'Cantidad', 'Stock Anterior', 'Stock Nuevo', 'Referencia']
+    claves = ['fecha_hora', 'tipo_movimiento', 'cantidad', 'stock_anterior', 'stock_nuevo', 'referencia']
+    movimientos = _filtrar_por_fechas(
+        MovimientoInventario.objects.filter(producto=producto), 'fecha_hora',
+        request.GET.get('start_date'), request.GET.get('end_date')
+    )
+    return respuesta_exportacion(
+        formato_solicitado(request), f'kardex_{producto.codigo_producto}', 'Kardex', headers, claves,
+        iterar_en_bloques(movimientos, claves)
+    )
+
+@login_required
+def exportar_stock_a_fecha(request):
+    """
+    Exporta el stock de todos los productos al cierre del día `fecha`
+    (AAAA-MM-DD), calculado desde los snapshots diarios más los movimientos
+    aún no consolidados.
+    """
+    fecha_str = request.GET.get('fecha')
+    try:
+        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("Indique la fecha con el formato AAAA-MM-DD.")
+    headers = ['Código Producto', 'Nombre', 'Categoría', 'Unidad de Medida', f'Stock al {fecha_str}']
+    claves = ['codigo_producto', 'nombre', 'categoria', 'unidad_de_medida', 'stock']
+    return respuesta_exportacion(
+        formato_solicitado(request), f'stock_al_{fecha_str}', 'Stock', headers, claves,
+        iterar_en_bloques(productos_con_stock_a_fecha(fecha), ['codigo_producto', 'nombre', 'categoria', 'unidad_de_medida', 'stock_a_fecha'])
+    )
+
 # ==============================================================================
 # Vistas para Utilidades
 # ==============================================================================
 
 @login_required
 def exportar_stock_excel(request):
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="inventario_stock.xlsx"'
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Inventario"
+    """
+    Exporta el inventario completo en XLSX (por defecto), CSV o NDJSON según
+    el parámetro `format`. Las filas se leen por bloques con un solo JOIN a
+    proveedor y se escriben sin mantener el inventario entero en memoria.
+    """
     headers = ['Código Producto', 'Nombre', 'Stock Actual', 'Stock Mínimo', 'Ubicación (Rack)', 'Proveedor', 'Categoría', 'Unidad de Medida']
-    ws.append(headers)
-    productos = Producto.objects.all()
-    for producto in productos:
-        rack = producto.ubicacion_rack.codigo_rack if producto.ubicacion_rack else 'N/A'
-        proveedor = producto.proveedor.nombre if producto.proveedor else 'N/A'
-        ws.append([producto.codigo_producto, producto.nombre, producto.cantidad_stock, producto.stock_minimo, rack, proveedor, producto.categoria, producto.unidad_de_medida])
-    wb.save(response)
-    return response
+    claves = ['codigo_producto', 'nombre', 'cantidad_stock', 'stock_minimo', 'ubicacion_rack', 'proveedor', 'categoria', 'unidad_de_medida']
+    campos = ['codigo_producto', 'nombre', 'cantidad_stock', 'stock_minimo', 'ubicacion_rack_id', 'proveedor__nombre', 'categoria', 'unidad_de_medida']
+
+    def filas():
+        for codigo, nombre, stock, minimo, rack, proveedor, categoria, unidad in iterar_en_bloques(Producto.objects.all(), campos):
+            yield [codigo, nombre, stock, minimo, rack or 'N/A', proveedor or 'N/A', categoria, unidad]
+
+    return respuesta_exportacion(
+        formato_solicitado(request), 'inventario_stock', 'Inventario', headers, claves, filas()
+    )
 
 @login_required
 def generar_qr_producto(request, pk):
     producto = get_object_or_404(Producto, pk=pk)
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
-    qr.add_data(producto.codigo_producto)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    qr_image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    context = {'producto': producto, 'qr_image_base64': qr_image_base64}
+    context = {'producto': producto}
     return render(request, 'bodega/generar_qr_producto.html', context)
 
+@login_required
+def imagen_qr_producto(request, pk, formato):
+    """
+    Imagen QR del producto desde la caché en disco (ver bodega/etiquetas.py).
+    La imagen depende solo del código, así que se marca como inmutable y las
+    revalidaciones se responden con 304 sin tocar la base de datos ni el disco.
+    """
+    if formato not in FORMATOS_QR:
+        raise Http404
+    etag = f'"{clave_qr(pk, formato)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        ruta = ruta_qr(pk, formato)
+        if not ruta.exists():
+            get_object_or_404(Producto, pk=pk)
+            ruta = obtener_qr(pk, formato)
+        response = FileResponse(open(ruta, 'rb'), content_type=FORMATOS_QR[formato])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+MAX_ETIQUETAS_QR = 500
+
+@permission_required('bodega.view_producto', login_url='dashboard')
+def etiquetas_qr(request):
+    """
+    Hoja de etiquetas QR en PDF para un rack o una categoría, de hasta
+    MAX_ETIQUETAS_QR productos. Ver `hoja_etiquetas` en bodega/etiquetas.py.
+    """
+    rack = request.GET.get('rack')
+    categoria = request.GET.get('categoria')
+    if not rack and not categoria:
+        return HttpResponseBadRequest(
+            "Indique un rack o una categoría. "
+            "Para todo el catálogo use el comando generar_etiquetas_qr."
+        )
+    productos = list(productos_para_etiquetas(rack=rack, categoria=categoria)[:MAX_ETIQUETAS_QR + 1])
+    if len(productos) > MAX_ETIQUETAS_QR:
+        return HttpResponseBadRequest(
+            f"La hoja admite hasta {MAX_ETIQUETAS_QR} etiquetas. "
+            "Para más productos use el comando generar_etiquetas_qr."
+        )
+    nombre = f"etiquetas_{rack or categoria}.pdf"
+    return RespuestaArchivo(hoja_etiquetas(productos), as_attachment=True, filename=nombre, content_type='application/pdf')
+
 # ==============================================================================
 # Vistas para Gestión de Usuarios
 # ==============================================================================
 
 @permission_required('auth.view_user', login_url='dashboard')
 def lista_usuarios(request):
-    users = User.objects.all().order_by('username')
+    users = User.objects.prefetch_related('groups').order_by('username')
     return render(request, 'bodega/lista_usuarios.html', {'users': users})
 
 @permission_required('auth.add_user', login_url='dashboard')
@@ -630,52 +753,163 @@ def agregar_proveedor_ajax(request):
         else:
             return JsonResponse({'errors': form.errors.as_json()}, status=400)
     return JsonResponse({'error': 'Método no permitido'}, status=405)
+# Las lecturas AJAX de alto volumen (escáneres y tablets) son vistas
+# asíncronas: bajo ASGI no ocupan un hilo mientras esperan la base de datos
+# o la caché. Bajo WSGI siguen funcionando, Django las ejecuta en un event loop.
+
 @login_required
-def get_stock_producto_ajax(request):
+async def get_stock_producto_ajax(request):
     """
     Vista especial que devuelve el stock de un producto específico en formato JSON.
+    Para varias líneas use `stock_productos_ajax`, que responde todas en una llamada.
     """
     codigo_producto = request.GET.get('codigo_producto', None)
     data = {'stock': ''} # Valor por defecto si no se encuentra
-    
+
     if codigo_producto:
-        producto = get_object_or_404(Producto, pk=codigo_producto)
-        data['stock'] = producto.cantidad_stock
-        
+        datos = (await aconsultar_stock([codigo_producto])).get(codigo_producto)
+        if datos is None:
+            return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+        data['stock'] = datos['stock']
+
     return JsonResponse(data)
 
+MAX_CODIGOS_STOCK = 500
+
 @login_required
-def buscar_productos_ajax(request):
-    q = (request.GET.get('q') or '').strip()
-    qs = Producto.objects.all()
+async def stock_productos_ajax(request):
+    """
+    Stock, stock mínimo, rack y unidad de varios productos a la vez
+    (`?codigo=A&codigo=B...`). El ETag se arma con la versión de cada
+    producto, así el navegador revalida y recibe 304 si nada cambió.
+    """
+    codigos = [codigo for codigo in request.GET.getlist('codigo') if codigo]
+    if len(codigos) > MAX_CODIGOS_STOCK:
+        return JsonResponse({'error': f'Máximo {MAX_CODIGOS_STOCK} códigos por consulta'}, status=400)
+    productos = await aconsultar_stock(codigos)
+    no_encontrados = [codigo for codigo in dict.fromkeys(codigos) if codigo not in productos]
+
+    firma = json.dumps([sorted((codigo, datos['version']) for codigo, datos in productos.items()), no_encontrados])
+    etag = f'"{hashlib.md5(firma.encode("utf-8")).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'productos': productos, 'no_encontrados': no_encontrados})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+INTERVALO_LATIDO = 15
 
-    if q:
-        qs = qs.filter(Q(nombre__icontains=q) | Q(codigo_producto__icontains=q))
+@login_required
+async def stock_en_vivo(request):
+    """
+    Stream SSE (servido por ASGI) con el stock de los productos
+    (`?producto=...`) y racks (`?rack=...`) suscritos. Al conectar envía el
+    stock actual de los productos pedidos y luego un evento por cada
+    movimiento confirmado (ver bodega/difusion.py).
+    """
+    productos = [codigo for codigo in request.GET.getlist('producto') if codigo]
+    racks = [rack for rack in request.GET.getlist('rack') if rack]
+    if not productos and not racks:
+        return JsonResponse({'error': 'Indique al menos un producto o rack'}, status=400)
+    # Primero la suscripción y después el stock inicial: un movimiento
+    # confirmado entre ambos queda en la cola en lugar de perderse.
+    suscripcion = Suscripcion(productos, racks)
+    difusor = obtener_difusor()
+    difusor.suscribir(suscripcion)
+    try:
+        iniciales = await aeventos_stock(productos)
+    except BaseException:
+        difusor.desuscribir(suscripcion)
+        raise
+
+    async def eventos():
+        try:
+            yield "retry: 5000\n\n"
+            for evento in iniciales:
+                yield _evento_sse(evento)
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), INTERVALO_LATIDO)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": latido\n\n"
+                else:
+                    yield _evento_sse(evento)
+        finally:
+            difusor.desuscribir(suscripcion)
+
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    # Si el cliente se va antes de empezar el stream, el finally de eventos()
+    # no se ejecuta; close() de la respuesta se llama siempre.
+    response._resource_closers.append(partial(difusor.desuscribir, suscripcion))
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    # Lista inicial cuando q == '' (primeros 50 ordenados por nombre)
-    qs = qs.order_by('nombre')[:50]
+def _evento_sse(evento):
+    return f"event: stock\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
 
-    results = [
-        {
-            "id": p.id,  # o p.codigo_producto si tu formset guarda el código
-            "text": f"{p.codigo_producto} - {p.nombre} (Stock: {p.cantidad_stock})"
-        }
-        for p in qs
-    ]
-    return JsonResponse(results, safe=False)
+@login_required
+async def buscar_productos_ajax(request):
+    """
+    Autocompletado de productos (select2). Se responde desde el índice en
+    memoria del worker, sin consultar la base de datos en cada tecla.
+    """
+    q = (request.GET.get('q') or '').strip()
+    return HttpResponse(await indice_autocompletado.aresponder(q), content_type='application/json')
+
+@login_required
+async def dashboard_datos_ajax(request):
+    """Tarjetas y gráficos del dashboard en JSON, desde la caché de agregados."""
+    return JsonResponse(await aobtener_widgets_dashboard())
+
+@login_required
+async def movimientos_por_dia_ajax(request):
+    """
+    Devuelve en JSON las entradas y salidas por día entre `start_date` y
+    `end_date`, opcionalmente para un solo `codigo_producto`.
+    """
+    try:
+        desde = datetime.strptime(request.GET.get('start_date', ''), '%Y-%m-%d').date()
+        hasta = datetime.strptime(request.GET.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'start_date y end_date son obligatorios (AAAA-MM-DD)'}, status=400)
+    dias = await amovimientos_por_dia(desde, hasta, producto=request.GET.get('codigo_producto') or None)
+    return JsonResponse(
+        [{'fecha': dia['fecha'].isoformat(), 'entradas': dia['entradas'], 'salidas': dia['salidas']} for dia in dias],
+        safe=False
+    )
+
+def metricas(request):
+    """
+    Métricas en formato de texto de Prometheus (ver bodega/metricas.py).
+    Acceso para usuarios staff o para el scraper con BODEGA_METRICAS_TOKEN.
+    """
+    token = getattr(settings, 'BODEGA_METRICAS_TOKEN', None)
+    autorizado = request.user.is_authenticated and request.user.is_staff
+    if not autorizado and token:
+        autorizado = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not autorizado:
+        return HttpResponse(status=403)
+    return HttpResponse(registro_metricas.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @permission_required('bodega.view_auditlog', login_url='dashboard')
 def audit_log_view(request):
     """
-    Muestra el registro de auditoría completo, con paginación.
+    Muestra el registro de auditoría completo, con paginación por cursor
+    (sin COUNT(*) ni OFFSET sobre toda la tabla). Al llegar a las entradas
+    archivadas continúa leyéndolas del archivo histórico.
     """
     log_list = AuditLog.objects.select_related('usuario').all()
-    
-    paginator = Paginator(log_list, 20) # Mostraremos 20 registros por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+
+    pagina = paginar_por_cursor(
+        log_list, despues=request.GET.get('despues'), antes=request.GET.get('antes'), tamano=20,
+        archivo=lector_auditoria()
+    )
 
     context = {
-        'page_obj': page_obj
+        'page_obj': pagina,
+        'pagina': pagina,
     }
     return render(request, 'bodega/audit_log.html', context)
\ No newline at end of file
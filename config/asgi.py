@@ -3,6 +3,15 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through ASGI (uvicorn, daphne) to use the live stock
+stream (``ajax/stock/en-vivo/``) and to run the async AJAX reads without a
+thread per request; under WSGI each open stream holds a worker.
+
+Large downloads (exports, batch PDFs, label sheets) are sync iterators.
+Django would buffer them whole under ASGI, so they use ``RespuestaStreaming``
+and ``RespuestaArchivo`` (bodega/exports.py), which pull them in ~64 KB
+steps from the request thread and keep memory constant.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
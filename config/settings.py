@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bodega.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,10 +49,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Todo el stack admite modo asíncrono: bajo ASGI las vistas async no
+    # pasan por ningún hilo, y las descargas grandes se envían por trozos
+    # (ver config/asgi.py)
     'bodega.middleware.CurrentUserMiddleware',
+    'bodega.middleware.InstrumentacionSQLMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -89,6 +91,69 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# LocMemCache es por proceso: con varios workers de gunicorn las invalidaciones
+# solo llegan al worker que hizo el cambio. En producción apunte 'default' a un
+# backend compartido (Redis o Memcached).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bodega',
+    }
+}
+
+# Auditoría: con True los lotes de AuditLog se escriben desde un hilo de fondo
+# en lugar de al final de cada petición.
+BODEGA_AUDITORIA_ASINCRONA = False
+
+# Archivo histórico: el comando `archivar_historial` mueve aquí (JSONL.gz por
+# mes) el Kardex y la auditoría con más de BODEGA_RETENCION_DIAS días.
+BODEGA_ARCHIVO_DIR = BASE_DIR / 'archivo'
+BODEGA_RETENCION_DIAS = 365
+
+# Comprobantes PDF: se guardan una vez generados y se generan en segundo plano
+# al registrar cada despacho o recepción.
+BODEGA_PDF_CACHE_DIR = BASE_DIR / 'cache_pdf'
+BODEGA_PDF_PRECALENTAR = True
+# Procesos para generar PDFs por lotes (None = uno por núcleo).
+BODEGA_PDF_PROCESOS = None
+# Imágenes QR de productos (inmutables, una por código y formato).
+BODEGA_QR_CACHE_DIR = BASE_DIR / 'cache_qr'
+# Stock en vivo (SSE, requiere servir con ASGI). DifusionLocal solo reparte
+# dentro de cada proceso; con varios workers use un backend compartido.
+BODEGA_DIFUSION_BACKEND = 'bodega.difusion.DifusionLocal'
+
+# Instrumentación SQL: fracción de peticiones medidas (0 a 1) y repeticiones
+# de una misma consulta a partir de las cuales se avisa de un posible N+1.
+BODEGA_SQL_MUESTREO = 0.05
+BODEGA_SQL_UMBRAL_REPETICIONES = 10
+
+# Métricas (/metricas/, formato Prometheus). Con varios workers de gunicorn
+# apunte BODEGA_METRICAS_DIR a un directorio compartido y vacío al arrancar.
+# Sin sesión de staff, el scraper debe enviar "Authorization: Bearer <token>".
+BODEGA_METRICAS_DIR = None
+BODEGA_METRICAS_TOKEN = None
+
+# Cada línea de un despacho o recepción son dos campos POST; el límite de
+# Django (1000) rechazaba documentos de más de ~495 líneas con un 400.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 2100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # WARNING: solo los avisos de posible N+1. Con INFO se registra además
+        # el resumen de consultas de cada petición muestreada.
+        'bodega.sql': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
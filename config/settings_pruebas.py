@@ -0,0 +1,18 @@
+"""
+Ajustes para correr las pruebas sin servidor MySQL:
+
+    python manage.py test bodega --settings=config.settings_pruebas
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'pruebas.sqlite3',
+    }
+}
+
+# Sin PDFs en hilos de fondo: consultarían la base de pruebas mientras corren
+# otras pruebas. La prueba del precalentado lo activa por su cuenta.
+BODEGA_PDF_PRECALENTAR = False